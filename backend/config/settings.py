@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 from pathlib import Path
+from corsheaders.defaults import default_headers
 from decouple import config, Csv
 import os
 import dj_database_url
@@ -50,6 +51,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "trip_planner.telemetry.TelemetryMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
@@ -69,6 +71,9 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",  # If you run your React dev server locally on this port
     "http://127.0.0.1:5173",  # Also good practice for local dev
 ]
+# Clients may send Idempotency-Key on trip creates (see trip_planner/idempotency.py)
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key")
+CORS_EXPOSE_HEADERS = ["Idempotent-Replayed"]
 
 # Rest Framework settings
 REST_FRAMEWORK = {
@@ -76,7 +81,7 @@ REST_FRAMEWORK = {
         "rest_framework.permissions.AllowAny",  # For this demo only, consider authentication in production
     ],
     "DEFAULT_RENDERER_CLASSES": [
-        "rest_framework.renderers.JSONRenderer",
+        "trip_planner.renderers.FastJSONRenderer",
         "rest_framework.renderers.BrowsableAPIRenderer",
     ],
 }
@@ -168,3 +173,146 @@ STATICFILES_DIRS = [
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# Trip planner caching
+# Geocode results: a per-process LRU in front of a table shared by all workers.
+
+GEOCODE_CACHE_MEMORY_SIZE = config("GEOCODE_CACHE_MEMORY_SIZE", default=2048, cast=int)
+GEOCODE_CACHE_TTL_SECONDS = config(
+    "GEOCODE_CACHE_TTL_SECONDS", default=30 * 24 * 3600, cast=int
+)
+GEOCODE_CACHE_MAX_ROWS = config("GEOCODE_CACHE_MAX_ROWS", default=50000, cast=int)
+
+# Routes: keyed by waypoints snapped to a grid (0.001 degrees is roughly 100 m) plus
+# mode, with the shared table bounded by the total size of the stored geometry.
+
+ROUTE_CACHE_GRID_DEGREES = config("ROUTE_CACHE_GRID_DEGREES", default=0.001, cast=float)
+ROUTE_CACHE_MEMORY_SIZE = config("ROUTE_CACHE_MEMORY_SIZE", default=128, cast=int)
+ROUTE_CACHE_TTL_SECONDS = config(
+    "ROUTE_CACHE_TTL_SECONDS", default=7 * 24 * 3600, cast=int
+)
+ROUTE_CACHE_MAX_BYTES = config(
+    "ROUTE_CACHE_MAX_BYTES", default=256 * 1024 * 1024, cast=int
+)
+
+
+# Route lines are simplified (Douglas-Peucker) as they arrive from Geoapify: no dropped
+# vertex is more than the tolerance off the kept line, and the tolerance is raised for
+# any line that would still have more than the maximum number of points.
+
+ROUTE_GEOMETRY_TOLERANCE_METERS = config(
+    "ROUTE_GEOMETRY_TOLERANCE_METERS", default=5.0, cast=float
+)
+ROUTE_GEOMETRY_MAX_POINTS = config("ROUTE_GEOMETRY_MAX_POINTS", default=10000, cast=int)
+
+# Simulated plans for trips with an explicit departure_time, keyed by a hash of the
+# routed legs, starting cycle hours, departure and HOS rules; a hit skips the HOS
+# simulation and ELD generation. The shared table is capped by bytes.
+
+PLAN_CACHE_MEMORY_SIZE = config("PLAN_CACHE_MEMORY_SIZE", default=256, cast=int)
+PLAN_CACHE_TTL_SECONDS = config(
+    "PLAN_CACHE_TTL_SECONDS", default=7 * 24 * 3600, cast=int
+)
+PLAN_CACHE_MAX_BYTES = config(
+    "PLAN_CACHE_MAX_BYTES", default=64 * 1024 * 1024, cast=int
+)
+
+# Trip detail responses (GET /api/trips/<id>/): each body is cached once, plain and
+# compressed, with a strong ETag, until the trip is updated or deleted. The per-process
+# tier's TTL bounds how long other workers serve a body after that; the shared table is
+# capped by bytes.
+
+TRIP_RESPONSE_CACHE_MEMORY_SIZE = config(
+    "TRIP_RESPONSE_CACHE_MEMORY_SIZE", default=256, cast=int
+)
+TRIP_RESPONSE_CACHE_MEMORY_TTL_SECONDS = config(
+    "TRIP_RESPONSE_CACHE_MEMORY_TTL_SECONDS", default=300, cast=int
+)
+TRIP_RESPONSE_CACHE_MAX_BYTES = config(
+    "TRIP_RESPONSE_CACHE_MAX_BYTES", default=256 * 1024 * 1024, cast=int
+)
+
+
+# Geoapify client (trip_planner/geoapify.py): per-endpoint read timeouts in seconds,
+# bounded retries with jittered backoff, and the per-worker keep-alive pool size.
+# Point GEOAPIFY_BASE_URL at `python manage.py geoapify_standin` to run fully offline.
+
+GEOAPIFY_BASE_URL = config("GEOAPIFY_BASE_URL", default="https://api.geoapify.com")
+
+GEOAPIFY_CONNECT_TIMEOUT = config("GEOAPIFY_CONNECT_TIMEOUT", default=3.05, cast=float)
+GEOAPIFY_GEOCODE_TIMEOUT = config("GEOAPIFY_GEOCODE_TIMEOUT", default=10, cast=float)
+GEOAPIFY_ROUTING_TIMEOUT = config("GEOAPIFY_ROUTING_TIMEOUT", default=15, cast=float)
+GEOAPIFY_MAX_RETRIES = config("GEOAPIFY_MAX_RETRIES", default=2, cast=int)
+GEOAPIFY_BACKOFF_SECONDS = config("GEOAPIFY_BACKOFF_SECONDS", default=0.25, cast=float)
+GEOAPIFY_POOL_SIZE = config("GEOAPIFY_POOL_SIZE", default=10, cast=int)
+
+
+# Batch trip creation (POST /api/trips/batch/): the most trips per request, and how many
+# distinct geocodes/lanes are fetched at once while resolving a batch.
+
+TRIP_BATCH_MAX_SIZE = config("TRIP_BATCH_MAX_SIZE", default=500, cast=int)
+TRIP_BATCH_UPSTREAM_WORKERS = config("TRIP_BATCH_UPSTREAM_WORKERS", default=8, cast=int)
+
+
+# Async trip planning (POST /api/trips/?async=1): queued in the database and run by
+# PLANNING_JOB_LOCAL_WORKERS threads per web worker, started as each gunicorn worker
+# boots (0 leaves it all to `python manage.py run_planning_jobs`). A running job's
+# heartbeat is refreshed every PLANNING_JOB_HEARTBEAT_SECONDS; RUNNING jobs whose
+# heartbeat is older than the stale timeout are assumed to belong to a dead worker and
+# are retried, up to the attempt limit.
+
+PLANNING_JOB_LOCAL_WORKERS = config("PLANNING_JOB_LOCAL_WORKERS", default=2, cast=int)
+PLANNING_JOB_POLL_SECONDS = config("PLANNING_JOB_POLL_SECONDS", default=2, cast=float)
+PLANNING_JOB_HEARTBEAT_SECONDS = config(
+    "PLANNING_JOB_HEARTBEAT_SECONDS", default=10, cast=float
+)
+PLANNING_JOB_STALE_SECONDS = config("PLANNING_JOB_STALE_SECONDS", default=60, cast=int)
+PLANNING_JOB_MAX_ATTEMPTS = config("PLANNING_JOB_MAX_ATTEMPTS", default=3, cast=int)
+
+
+# Idempotency-Key on trip creates: a retry with the same key gets the first request's
+# trip (or job) for this long, and an unfinished claim is taken over after the pending
+# timeout (its worker is assumed dead).
+
+IDEMPOTENCY_KEY_TTL_SECONDS = config(
+    "IDEMPOTENCY_KEY_TTL_SECONDS", default=24 * 3600, cast=int
+)
+IDEMPOTENCY_KEY_PENDING_SECONDS = config(
+    "IDEMPOTENCY_KEY_PENDING_SECONDS", default=300, cast=int
+)
+
+
+# Queries taking at least this long are logged (with their SQL) and counted in
+# trip_planner_slow_queries_total; 0 turns this off. Every request's query count and
+# database time are reported regardless.
+
+SLOW_QUERY_MS = config("SLOW_QUERY_MS", default=200, cast=float)
+
+
+# /metrics and /api/planner/stats/ are for staff users, and for scrapers sending
+# "Authorization: Bearer <METRICS_TOKEN>"; with no token set, only staff can read them.
+
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+
+
+# Logging: LOG_FORMAT "json" writes one JSON object per line (with each request's
+# per-phase timings) for log shippers; "text" is human-readable.
+
+LOG_LEVEL = config("LOG_LEVEL", default="INFO")
+LOG_FORMAT = config("LOG_FORMAT", default="text")
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "text": {"format": "%(asctime)s %(levelname)s %(name)s: %(message)s"},
+        "json": {"()": "trip_planner.telemetry.JsonFormatter"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": LOG_FORMAT},
+    },
+    "loggers": {
+        "trip_planner": {"handlers": ["console"], "level": LOG_LEVEL},
+    },
+}
@@ -4,10 +4,12 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from trip_planner.telemetry import metrics
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include("trip_planner.urls")),
+    path("metrics", metrics, name="metrics"),
 ]
 
 if settings.DEBUG:
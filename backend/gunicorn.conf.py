@@ -8,8 +8,17 @@ bind = "0.0.0.0:8000"
 # Worker processes - can be overridden with environment variable
 workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
 
-# Worker class
-worker_class = "sync"
+# Worker class - "sync" serves the WSGI app; set GUNICORN_WORKER_CLASS to
+# "uvicorn.workers.UvicornWorker" to serve the ASGI app instead, where the async
+# create view (/api/trips/plan/) can hold many plans waiting on Geoapify per worker
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "sync")
+
+# The application matching the worker class
+wsgi_app = (
+    "config.asgi:application"
+    if "uvicorn" in worker_class.lower()
+    else "config.wsgi:application"
+)
 
 # Worker connections
 worker_connections = 1000
@@ -33,3 +42,21 @@ preload_app = True
 # Graceful worker restarts
 max_requests = 1000
 max_requests_jitter = 100
+
+
+# Prometheus: with PROMETHEUS_MULTIPROC_DIR set, workers share metrics through files
+# in that directory; drop a dead worker's live gauges so /metrics stays accurate
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
+
+
+# Async trip planning: threads started in the preloaded master don't survive the fork,
+# so each worker starts its own job threads as it boots (including workers that replace
+# ones recycled by max_requests) instead of waiting for its first queued trip
+def post_worker_init(worker):
+    from trip_planner.jobs import start_local_workers
+
+    start_local_workers()
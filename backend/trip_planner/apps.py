@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class TripPlannerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'trip_planner'
+
+    def ready(self):
+        from .telemetry import install_query_recorder
+
+        install_query_recorder()
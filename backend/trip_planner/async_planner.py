@@ -0,0 +1,184 @@
+# trip_planner/async_planner.py
+"""Non-blocking twin of route_planner's upstream calls, for the ASGI create view.
+
+Geocoding and routing await ``httpx`` through AsyncGeoapifyClient instead of blocking a
+thread, so one event loop can have many plans waiting on Geoapify at once. Response
+parsing, the caches and the HOS simulation are the same code the sync path uses; cache
+lookups can touch the shared DB tier, so they run via ``sync_to_async``.
+"""
+
+import asyncio
+import datetime
+import logging
+
+import httpx
+import pytz
+from asgiref.sync import sync_to_async
+
+from .cache import geocode_cache, normalize_location_key, route_cache
+from .geoapify import GEOAPIFY_API_KEY, get_async_client
+from .route_planner import (
+    _geocode_from_response,
+    _route_legs_from_response,
+    _routing_params,
+    simulate_route,
+    trip_stops,
+)
+from .telemetry import span
+
+logger = logging.getLogger(__name__)
+
+
+async def geocode_location_async(location):
+    """Async ``geocode_location``: the geocode cache first, then Geoapify."""
+    with span("geocode"):
+        cached = await sync_to_async(geocode_cache.get)(location)
+        if cached is not None:
+            logger.debug("Geocode cache HIT for '%s'", location)
+            return {
+                "coordinates": list(cached["coordinates"]),
+                "place_name": cached["place_name"],
+            }
+
+        result = await _fetch_geocode_async(location)
+        await sync_to_async(geocode_cache.set)(location, result)
+        return result
+
+
+async def _fetch_geocode_async(location):
+    logger.debug("Attempting to geocode (async): '%s'", location)
+    if not GEOAPIFY_API_KEY:
+        raise ValueError("Geoapify API Key is missing for geocoding.")
+    if not location:
+        raise ValueError("Location string cannot be empty for geocoding.")
+
+    client = get_async_client()
+    params = {"text": location, "limit": 1}
+    try:
+        response = await client.get("geocode", params)
+        logger.debug("Geocode API URL called: %s", client.redact(response.url))
+        response.raise_for_status()
+        return _geocode_from_response(location, response.json())
+
+    except httpx.TimeoutException:
+        logger.warning("Geocoding TIMEOUT for '%s'.", location)
+        raise ValueError(f"Geocoding request timed out for: {location}")
+    except httpx.HTTPStatusError as e:
+        logger.warning(
+            "Geocoding HTTP error for '%s': %s. Response: %s",
+            location,
+            client.redact(e),
+            e.response.text[:500],
+        )
+        if e.response.status_code == 401:
+            raise ValueError(
+                f"Geocoding Authentication Failed (401). Check your API Key."
+            )
+        raise ValueError(
+            f"Geocoding failed for '{location}' (HTTP {e.response.status_code})."
+        )
+    except httpx.RequestError as e:
+        logger.warning(
+            "Geocoding network error for '%s': %s", location, client.redact(e)
+        )
+        raise ValueError(f"Network error during geocoding: {location}")
+    except Exception as e:
+        logger.exception("Geocoding unexpected error for '%s'", location)
+        raise ValueError(f"Could not geocode location: {location}")
+
+
+async def get_route_legs_async(locations):
+    """Async ``get_route_legs``: cached legs, plus at most one routing request."""
+    waypoint_pairs = [
+        [origin.get("coordinates"), destination.get("coordinates")]
+        for origin, destination in zip(locations, locations[1:])
+    ]
+    with span("route"):
+        legs = [await sync_to_async(route_cache.get)(pair) for pair in waypoint_pairs]
+        missing = [i for i, leg in enumerate(legs) if leg is None]
+        if not missing:
+            return legs
+
+        first, last = missing[0], missing[-1]
+        fetched = await _fetch_route_data_async(locations[first : last + 2])
+        for i, route in enumerate(fetched, start=first):
+            await sync_to_async(route_cache.set)(waypoint_pairs[i], route)
+            legs[i] = route
+        return legs
+
+
+async def _fetch_route_data_async(locations):
+    logger.debug("Attempting routing (async) through %d waypoints.", len(locations))
+    params = _routing_params(locations)
+    client = get_async_client()
+    try:
+        response = await client.get("routing", params)
+        logger.debug("Routing API URL called: %s", client.redact(response.url))
+        response.raise_for_status()
+        return _route_legs_from_response(locations, response.json())
+
+    except httpx.TimeoutException:
+        logger.warning("Routing TIMEOUT.")
+        raise ValueError("Routing request timed out.")
+    except httpx.HTTPStatusError as e:
+        logger.warning(
+            "Routing HTTP error: %s. Response: %s",
+            client.redact(e),
+            e.response.text[:500],
+        )
+        if e.response.status_code == 401:
+            raise ValueError(
+                f"Routing Authentication Failed (401). Check your API Key."
+            )
+        raise ValueError(f"Routing failed (HTTP {e.response.status_code}).")
+    except httpx.RequestError as e:
+        logger.warning("Routing network error: %s", client.redact(e))
+        raise ValueError("Network error during routing.")
+    except ValueError:
+        raise
+    except Exception as e:
+        logger.exception("Routing unexpected error")
+        raise ValueError("Unexpected error during routing.")
+
+
+async def plan_route_async(
+    current_location_str,
+    pickup_location_str,
+    dropoff_location_str,
+    current_cycle_used_hours,
+    stops=None,
+    departure_time=None,
+):
+    """Async ``plan_route``: same arguments and result, without blocking the loop."""
+    stops = trip_stops(pickup_location_str, dropoff_location_str, stops)
+    current_time = departure_time or datetime.datetime.now(pytz.utc)
+
+    # Locations that normalize to the same text are only geocoded once.
+    location_strs = [current_location_str] + [stop["location"] for stop in stops]
+    tasks = {}
+    for location_str in location_strs:
+        key = normalize_location_key(location_str) or location_str
+        if key not in tasks:
+            tasks[key] = geocode_location_async(location_str)
+    resolved = dict(
+        zip(tasks, await asyncio.gather(*tasks.values(), return_exceptions=True))
+    )
+    locations = []
+    for location_str in location_strs:
+        result = resolved[normalize_location_key(location_str) or location_str]
+        if isinstance(result, BaseException):
+            # Same error as the sync path: the earliest failing location's
+            raise result
+        locations.append(result)
+
+    routes = await get_route_legs_async(locations)
+    # The simulation is CPU-bound and the plan cache does database I/O, so both run in
+    # a thread rather than on the event loop
+    return await sync_to_async(simulate_route)(
+        locations,
+        routes,
+        stops,
+        current_cycle_used_hours,
+        current_time,
+        use_plan_cache=departure_time is not None,
+    )
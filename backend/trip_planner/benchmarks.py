@@ -0,0 +1,538 @@
+# trip_planner/benchmarks.py
+"""Micro and end-to-end benchmarks for the trip planner.
+
+Everything here runs on synthetic, seeded inputs so results are comparable between runs
+and machines: route geometries of 100 to 1M vertices, trips from a single day to several
+weeks, and drivers starting anywhere from 0 to 69 hours into their cycle. The suites
+cover the HOS simulation, geometry construction and interpolation, ELD log generation,
+trip serialization and rendering (DRF serializers vs the ``values()`` read path), the
+full create view against a local Geoapify stand-in, and batches of concurrent plans
+through the sync and async planners against a stand-in with upstream latency.
+
+Run them with ``python manage.py benchmark``; results are written as JSON and can be
+compared with an earlier run's file to catch regressions. The suites save trips and
+clear and fill the geocode and route caches, so ``run_benchmarks`` runs them against a
+throwaway test database, never the configured one.
+"""
+
+import asyncio
+import contextlib
+import datetime
+import gc
+import json
+import platform
+import statistics
+import subprocess
+import time
+
+import django
+import numpy as np
+import pytz
+from django.test import Client
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from rest_framework.renderers import JSONRenderer
+
+from . import standin
+from .async_planner import plan_route_async
+from .cache import geocode_cache, plan_cache, route_cache, trip_response_cache
+from .geoapify import scoped_async_client
+from .geometry import RouteGeometry, simplify
+from .hos import HOSState, Leg, simulate_trip, summarize_trip
+from .models import Trip
+from .payloads import trip_payload
+from .renderers import FastJSONRenderer
+from .route_planner import generate_eld_logs, plan_route
+from .serializers import TripSerializer
+from .services import save_trip
+
+GEOMETRY_VERTICES = (100, 1_000, 10_000, 100_000, 1_000_000)
+# Total miles: about one driving day, three days, a week, three weeks and a month.
+TRIP_MILES = {
+    "1-day": 450,
+    "3-day": 1_500,
+    "1-week": 3_500,
+    "3-week": 10_000,
+    "1-month": 14_000,
+}
+CYCLE_USED_HOURS = (0, 35, 60, 69)
+# Vertices per leg for the suites that are not about geometry size.
+DEFAULT_LEG_VERTICES = 1_000
+INTERPOLATION_POINTS = 100
+SIMPLIFY_TOLERANCE_METERS = 5.0
+
+# The serializer suite adds a trip long enough for several hundred segments.
+SERIALIZER_TRIP_MILES = {**TRIP_MILES, "3-month": 40_000}
+
+QUICK_GEOMETRY_VERTICES = (100, 10_000, 100_000)
+QUICK_TRIP_MILES = {"1-day": 450, "1-week": 3_500}
+QUICK_CYCLE_USED_HOURS = (0, 69)
+
+# Locations the create suite plans between; the stand-in geocodes them deterministically.
+CREATE_TRIPS = {
+    "single-stop": {
+        "current_location": "Chicago, IL",
+        "pickup_location": "Denver, CO",
+        "dropoff_location": "Los Angeles, CA",
+    },
+    "multi-stop": {
+        "current_location": "Seattle, WA",
+        "stops": [
+            {"location": "Boise, ID", "type": "PICKUP"},
+            {"location": "Omaha, NE", "type": "DROPOFF"},
+            {"location": "Memphis, TN", "type": "PICKUP"},
+            {"location": "Atlanta, GA", "type": "DROPOFF"},
+        ],
+    },
+}
+
+# Trips planned at once by the planning suite, and the stand-in's per-request latency,
+# about what Geoapify takes to route a long-haul trip.
+PLANNING_CONCURRENCY = (1, 8, 32)
+QUICK_PLANNING_CONCURRENCY = (1, 8)
+PLANNING_LATENCY_MS = 150
+
+BENCHMARK_START_TIME = datetime.datetime(2025, 1, 6, 8, 0, tzinfo=pytz.utc)
+
+
+def synthetic_geometry(vertices, length_miles, seed=0):
+    """A seeded, gently winding ``(vertices, 2)`` [lon, lat] line about ``length_miles`` long.
+
+    Vertex spacing is deliberately uneven, like real routing output.
+    """
+    rng = np.random.default_rng(seed)
+    steps = rng.uniform(0.2, 1.8, size=vertices - 1)
+    t = np.concatenate(([0.0], np.cumsum(steps)))
+    t /= t[-1]
+    # Roughly 69 miles per degree of latitude; run mostly east with a north-south wiggle.
+    span_degrees = length_miles / 60.0
+    lons = -120.0 + span_degrees * t
+    lats = 38.0 + 1.5 * np.sin(6 * np.pi * t) * min(1.0, span_degrees / 10)
+    return np.column_stack((lons, lats))
+
+
+def synthetic_legs(total_miles, leg_vertices=DEFAULT_LEG_VERTICES, seed=0):
+    """A deadhead leg to the pickup (a tenth of the miles) and a loaded leg to the dropoff."""
+    legs = []
+    for i, (fraction, stop_type) in enumerate(((0.1, "PICKUP"), (0.9, "DROPOFF"))):
+        miles = total_miles * fraction
+        coords = synthetic_geometry(leg_vertices, miles, seed=seed + i)
+        legs.append(
+            Leg(
+                distance_miles=miles,
+                end_coordinates=coords[-1].tolist(),
+                end_name=f"Synthetic {stop_type.title()}",
+                stop_type=stop_type,
+                geometry=RouteGeometry(coords),
+            )
+        )
+    return legs
+
+
+def synthetic_route_data(total_miles, cycle_used=0, leg_vertices=DEFAULT_LEG_VERTICES):
+    """A ``plan_route``-shaped result for a synthetic trip."""
+    legs = synthetic_legs(total_miles, leg_vertices)
+    start = legs[0].geometry.coordinates[0].tolist()
+    result = simulate_trip(legs, _start_state(cycle_used, start))
+    summary = summarize_trip(result.segments, result.state)
+    return {
+        "segments": result.segments,
+        "total_distance": summary["total_distance_miles"],
+        "total_duration": summary["total_duration_hours"],
+        "summary": summary,
+    }
+
+
+def _start_state(cycle_used, coords):
+    return HOSState.start(BENCHMARK_START_TIME, cycle_used, coords, "Synthetic Start")
+
+
+def measure(func, min_rounds=5, max_rounds=1000, min_seconds=0.5):
+    """Time ``func()`` repeatedly; returns wall-clock stats in seconds.
+
+    Runs once untimed to warm up, then at least ``min_rounds`` times and until
+    ``min_seconds`` have passed (or ``max_rounds`` is reached). GC is paused while timing.
+    """
+    func()
+    timings = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        while len(timings) < max_rounds and (
+            len(timings) < min_rounds or time.perf_counter() - started < min_seconds
+        ):
+            t0 = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - t0)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    timings.sort()
+    return {
+        "rounds": len(timings),
+        "min": timings[0],
+        "median": statistics.median(timings),
+        "mean": statistics.fmean(timings),
+        "p95": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "max": timings[-1],
+    }
+
+
+def _case(name, params, func, **measure_options):
+    return {"name": name, "params": params, **measure(func, **measure_options)}
+
+
+def bench_geometry(vertex_counts=GEOMETRY_VERTICES):
+    """RouteGeometry construction, interpolation and simplification across sizes."""
+    fractions = np.linspace(0.0, 1.0, INTERPOLATION_POINTS)
+    for vertices in vertex_counts:
+        coords = synthetic_geometry(vertices, 1_000)
+        params = {"vertices": vertices}
+        yield _case("geometry.build", params, lambda: RouteGeometry(coords))
+        geom = RouteGeometry(coords)
+        yield _case(
+            "geometry.interpolate",
+            dict(params, points=INTERPOLATION_POINTS),
+            lambda: geom.points_at_fractions(fractions),
+        )
+        yield _case(
+            "geometry.simplify",
+            dict(params, tolerance_meters=SIMPLIFY_TOLERANCE_METERS),
+            lambda: simplify(coords, SIMPLIFY_TOLERANCE_METERS),
+            max_rounds=50,
+        )
+        geojson = {"type": "LineString", "coordinates": coords.tolist()}
+        yield _case(
+            "geometry.from_geojson",
+            params,
+            lambda: RouteGeometry.from_geojson(geojson),
+            max_rounds=50,
+        )
+
+
+def bench_hos(trip_miles=TRIP_MILES, cycle_states=CYCLE_USED_HOURS):
+    """The HOS simulation for every trip length and starting cycle state."""
+    for label, miles in trip_miles.items():
+        legs = synthetic_legs(miles)
+        start = legs[0].geometry.coordinates[0].tolist()
+        for cycle_used in cycle_states:
+            segments = len(
+                simulate_trip(legs, _start_state(cycle_used, start)).segments
+            )
+            yield _case(
+                "hos.simulate",
+                {
+                    "trip": label,
+                    "miles": miles,
+                    "cycle_used": cycle_used,
+                    "segments": segments,
+                },
+                lambda: simulate_trip(legs, _start_state(cycle_used, start)),
+            )
+
+
+def bench_eld(trip_miles=TRIP_MILES, cycle_states=CYCLE_USED_HOURS):
+    """ELD log generation for the longest and shortest cycle states of each trip."""
+    for label, miles in trip_miles.items():
+        for cycle_used in (cycle_states[0], cycle_states[-1]):
+            route_data = synthetic_route_data(miles, cycle_used)
+            days = len(generate_eld_logs(None, route_data))
+            yield _case(
+                "eld.generate",
+                {
+                    "trip": label,
+                    "miles": miles,
+                    "cycle_used": cycle_used,
+                    "segments": len(route_data["segments"]),
+                    "days": days,
+                },
+                lambda: generate_eld_logs(None, route_data),
+            )
+
+
+def bench_serializer(trip_miles=SERIALIZER_TRIP_MILES):
+    """Saved trips as JSON: TripSerializer vs the ``values()`` read path, and DRF's
+    stdlib JSON renderer vs the orjson one, each with and without the database fetch.
+    """
+    saved = []
+    try:
+        for label, miles in trip_miles.items():
+            trip = save_trip(
+                {
+                    "current_location": "Benchmark Start",
+                    "pickup_location": "Benchmark Pickup",
+                    "dropoff_location": "Benchmark Dropoff",
+                    "current_cycle_used": 0,
+                },
+                synthetic_route_data(miles),
+            )
+            saved.append(trip.pk)
+            loaded = Trip.objects.prefetch_related("segments", "eld_logs").get(
+                pk=trip.pk
+            )
+            params = {
+                "trip": label,
+                "miles": miles,
+                "segments": len(loaded.segments.all()),
+                "days": len(loaded.eld_logs.all()),
+            }
+            yield _case("serializer.trip", params, lambda: TripSerializer(loaded).data)
+            yield _case(
+                "serializer.trip_with_fetch",
+                params,
+                lambda: TripSerializer(
+                    Trip.objects.prefetch_related("segments", "eld_logs").get(
+                        pk=trip.pk
+                    )
+                ).data,
+            )
+            yield _case("read_path.trip", params, lambda: trip_payload(trip.pk))
+            data = TripSerializer(loaded).data
+            yield _case(
+                "render.trip_stdlib_json", params, lambda: JSONRenderer().render(data)
+            )
+            yield _case(
+                "render.trip_orjson", params, lambda: FastJSONRenderer().render(data)
+            )
+            yield _case(
+                "response.trip_serializer",
+                params,
+                lambda: JSONRenderer().render(
+                    TripSerializer(
+                        Trip.objects.prefetch_related("segments", "eld_logs").get(
+                            pk=trip.pk
+                        )
+                    ).data
+                ),
+            )
+            yield _case(
+                "response.trip_read_path",
+                params,
+                lambda: FastJSONRenderer().render(trip_payload(trip.pk)),
+            )
+    finally:
+        Trip.objects.filter(pk__in=saved).delete()
+
+
+def bench_create(trips=CREATE_TRIPS, cycle_states=(0, 69), route_points=500):
+    """POST /api/trips/ end to end against an in-process Geoapify stand-in.
+
+    "cold" clears the geocode and route caches before every request, so each one pays
+    for the stand-in round trips; "warm" is served from the caches. Only run it on a
+    database of its own (``run_benchmarks`` does).
+    """
+    server, url = standin.start_in_thread(
+        standin.GeoapifyStandIn(fixtures_path=None, route_points=route_points)
+    )
+    created = []
+
+    def create(payload):
+        response = client.post("/api/trips/", payload, content_type="application/json")
+        if response.status_code != 201:
+            raise RuntimeError(
+                f"Create returned {response.status_code}: {response.content[:500]!r}"
+            )
+        created.append(response.json()["id"])
+
+    def cold(payload):
+        geocode_cache.clear()
+        route_cache.clear()
+        create(payload)
+
+    try:
+        with override_settings(GEOAPIFY_BASE_URL=url, ALLOWED_HOSTS=["*"]):
+            client = Client()
+            for label, trip in trips.items():
+                for cycle_used in cycle_states:
+                    payload = dict(trip, current_cycle_used=cycle_used)
+                    params = {
+                        "trip": label,
+                        "cycle_used": cycle_used,
+                        "route_points": route_points,
+                    }
+                    yield _case(
+                        "create.cold",
+                        params,
+                        lambda: cold(payload),
+                        min_rounds=3,
+                        max_rounds=50,
+                    )
+                    yield _case(
+                        "create.warm",
+                        params,
+                        lambda: create(payload),
+                        min_rounds=3,
+                        max_rounds=200,
+                    )
+    finally:
+        server.shutdown()
+        server.server_close()
+        Trip.objects.filter(pk__in=created).delete()
+
+
+def bench_planning(
+    concurrency=PLANNING_CONCURRENCY, latency_ms=PLANNING_LATENCY_MS, route_points=500
+):
+    """A batch of distinct trips through ``plan_route`` vs ``plan_route_async``.
+
+    "sync" plans the batch one trip after another, as a sync gunicorn worker serves
+    them; "async" gathers it on one event loop, as an ASGI worker serves concurrent
+    POSTs to /api/trips/plan/. The stand-in answers after ``latency_ms`` and the
+    geocode and route caches are cleared before every batch, so each plan waits on it.
+    """
+    server, url = standin.start_in_thread(
+        standin.GeoapifyStandIn(
+            fixtures_path=None, route_points=route_points, latency_ms=latency_ms
+        )
+    )
+
+    def batch(count):
+        return [
+            (f"Origin {i}, IL", f"Pickup {i}, CO", f"Dropoff {i}, CA")
+            for i in range(count)
+        ]
+
+    def clear_caches():
+        geocode_cache.clear()
+        route_cache.clear()
+
+    def plan_sync(trips):
+        clear_caches()
+        for locations in trips:
+            plan_route(*locations, 0)
+
+    async def gather(trips):
+        async with scoped_async_client():
+            await asyncio.gather(*(plan_route_async(*loc, 0) for loc in trips))
+
+    def plan_async(trips):
+        clear_caches()
+        asyncio.run(gather(trips))
+
+    try:
+        with override_settings(GEOAPIFY_BASE_URL=url):
+            for count in concurrency:
+                trips = batch(count)
+                params = {
+                    "trips": count,
+                    "latency_ms": latency_ms,
+                    "route_points": route_points,
+                }
+                yield _case(
+                    "planning.sync",
+                    params,
+                    lambda: plan_sync(trips),
+                    min_rounds=3,
+                    max_rounds=20,
+                )
+                yield _case(
+                    "planning.async",
+                    params,
+                    lambda: plan_async(trips),
+                    min_rounds=3,
+                    max_rounds=20,
+                )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+SUITES = {
+    "geometry": bench_geometry,
+    "hos": bench_hos,
+    "eld": bench_eld,
+    "serializer": bench_serializer,
+    "create": bench_create,
+    "planning": bench_planning,
+}
+
+QUICK_ARGUMENTS = {
+    "geometry": {"vertex_counts": QUICK_GEOMETRY_VERTICES},
+    "hos": {"trip_miles": QUICK_TRIP_MILES, "cycle_states": QUICK_CYCLE_USED_HOURS},
+    "eld": {"trip_miles": QUICK_TRIP_MILES, "cycle_states": QUICK_CYCLE_USED_HOURS},
+    "serializer": {"trip_miles": QUICK_TRIP_MILES},
+    "create": {"trips": {"single-stop": CREATE_TRIPS["single-stop"]}},
+    "planning": {"concurrency": QUICK_PLANNING_CONCURRENCY},
+}
+
+
+@contextlib.contextmanager
+def isolated_database():
+    """Point every connection at a freshly migrated test database for the block.
+
+    The in-process cache tiers are emptied on the way in and out too, so nothing read
+    from the real caches is benchmarked and no benchmark entries outlive the block.
+    """
+    memory_caches = (geocode_cache, route_cache, plan_cache, trip_response_cache)
+    for cache in memory_caches:
+        cache.memory.clear()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        for cache in memory_caches:
+            cache.memory.clear()
+
+
+def run_benchmarks(suites=None, quick=False, progress=None):
+    """Run the named suites (default: all) and return the JSON-ready report.
+
+    The suites run against a throwaway database (see ``isolated_database``).
+    """
+    results = []
+    with isolated_database():
+        for suite in suites or SUITES:
+            kwargs = QUICK_ARGUMENTS[suite] if quick else {}
+            for result in SUITES[suite](**kwargs):
+                results.append(result)
+                if progress:
+                    progress(result)
+    return {"environment": environment(quick), "results": results}
+
+
+def environment(quick=False):
+    """Where and on what a run happened, so reports are compared like for like."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            timeout=5,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "timestamp": datetime.datetime.now(pytz.utc).isoformat(),
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "quick": quick,
+    }
+
+
+def result_key(result):
+    return (result["name"], json.dumps(result["params"], sort_keys=True))
+
+
+def compare(baseline, current, stat="median"):
+    """Pair up cases present in both reports; ``ratio`` > 1 means ``current`` is slower."""
+    previous = {result_key(r): r for r in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        before = previous.get(result_key(result))
+        if before is None or before[stat] <= 0:
+            continue
+        rows.append(
+            {
+                "name": result["name"],
+                "params": result["params"],
+                "baseline": before[stat],
+                "current": result[stat],
+                "ratio": result[stat] / before[stat],
+            }
+        )
+    return rows
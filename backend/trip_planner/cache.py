@@ -0,0 +1,718 @@
+# trip_planner/cache.py
+import datetime
+import gzip
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import polyline
+from .models import (
+    GeocodeCacheEntry,
+    PlanCacheEntry,
+    RouteCacheEntry,
+    TripResponseCacheEntry,
+)
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip bodies are kept
+    brotli = None
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]+", re.UNICODE)
+_WHITESPACE_RE = re.compile(r"\s+")
+_MAX_KEY_LENGTH = 255
+
+
+def normalize_location_key(location):
+    """Normalize a free-text location so trivially different spellings share a key.
+
+    "  123 Main St., Chicago,IL " and "123 main st chicago il" map to the same key.
+    """
+    text = unicodedata.normalize("NFKC", location or "").casefold()
+    text = _PUNCTUATION_RE.sub(" ", text)
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    return _fit_key(text)
+
+
+def _fit_key(key):
+    # Very long keys are hashed so they still fit the unique column.
+    if len(key) > _MAX_KEY_LENGTH:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return key
+
+
+def route_cache_key(waypoints, mode="drive", grid_degrees=None):
+    """Key a route on its waypoints snapped to a grid, so nearby geocodes share a lane.
+
+    ``waypoints`` is a list of [lon, lat] pairs. Returns None if any waypoint is unusable.
+    """
+    grid = grid_degrees or settings.ROUTE_CACHE_GRID_DEGREES
+    cells = []
+    for point in waypoints:
+        if not isinstance(point, (list, tuple)) or len(point) != 2:
+            return None
+        lon, lat = point
+        cells.append(f"{round(lat / grid)},{round(lon / grid)}")
+    return _fit_key(f"{mode}@{grid:g}:" + "|".join(cells))
+
+
+class LRUCache:
+    """Bounded, thread-safe in-process LRU cache with a per-entry TTL."""
+
+    def __init__(self, maxsize, ttl_seconds):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """Return the cached value, or None on a miss (or an expired entry)."""
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, value = item
+            if expires_at <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class _SharedTableCache:
+    """Common bookkeeping for caches whose second tier is a table shared by all workers.
+
+    Database problems never fail a lookup; they are counted and treated as a miss so
+    planning can still fall through to the API.
+    """
+
+    # Prune the shared table once every N writes per process rather than on every write.
+    PRUNE_EVERY_WRITES = 100
+
+    def __init__(self, memory_size, ttl_seconds):
+        self.memory = LRUCache(maxsize=memory_size, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self.db_hits = 0
+        self.db_misses = 0
+        self.db_errors = 0
+
+    def _is_fresh(self, entry):
+        age = (timezone.now() - entry.fetched_at).total_seconds()
+        return age <= self.ttl_seconds
+
+    def _record_write(self):
+        with self._lock:
+            self._writes_since_prune += 1
+            should_prune = self._writes_since_prune >= self.PRUNE_EVERY_WRITES
+            if should_prune:
+                self._writes_since_prune = 0
+        if should_prune:
+            self.prune()
+
+    def _count(self, counter):
+        # Lookups run on pool threads, so counters are bumped under the lock
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def prune(self):
+        raise NotImplementedError
+
+    def stats(self):
+        memory = self.memory.stats()
+        with self._lock:
+            hits, misses, errors = self.db_hits, self.db_misses, self.db_errors
+        return {
+            "memory": memory,
+            "db": {"hits": hits, "misses": misses, "errors": errors},
+            "hits": memory["hits"] + hits,
+            "misses": misses,
+        }
+
+
+class GeocodeCache(_SharedTableCache):
+    """Two-tier geocode cache: per-process LRU in front of a table shared by all workers.
+
+    Values are the ``{"coordinates": [lon, lat], "place_name": str}`` dicts returned by
+    ``route_planner.geocode_location``.
+    """
+
+    def __init__(self):
+        super().__init__(
+            memory_size=settings.GEOCODE_CACHE_MEMORY_SIZE,
+            ttl_seconds=settings.GEOCODE_CACHE_TTL_SECONDS,
+        )
+
+    @property
+    def ttl_seconds(self):
+        return settings.GEOCODE_CACHE_TTL_SECONDS
+
+    def get(self, location):
+        key = normalize_location_key(location)
+        if not key:
+            return None
+
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+
+        value = self._db_get(key)
+        if value is not None:
+            self.memory.set(key, value)
+        return value
+
+    def set(self, location, value):
+        key = normalize_location_key(location)
+        if not key:
+            return
+        self.memory.set(key, value)
+        self._db_set(key, location, value)
+
+    def clear(self):
+        self.memory.clear()
+        try:
+            GeocodeCacheEntry.objects.all().delete()
+        except DatabaseError:
+            self._count("db_errors")
+
+    def _db_get(self, key):
+        try:
+            entry = (
+                GeocodeCacheEntry.objects.filter(key=key)
+                .only("id", "coordinates", "place_name", "fetched_at")
+                .first()
+            )
+            if entry is None:
+                self._count("db_misses")
+                return None
+            if not self._is_fresh(entry):
+                GeocodeCacheEntry.objects.filter(pk=entry.pk).delete()
+                self._count("db_misses")
+                return None
+            GeocodeCacheEntry.objects.filter(pk=entry.pk).update(
+                hit_count=F("hit_count") + 1, last_used_at=timezone.now()
+            )
+        except DatabaseError:
+            self._count("db_errors")
+            return None
+        self._count("db_hits")
+        return {"coordinates": entry.coordinates, "place_name": entry.place_name}
+
+    def _db_set(self, key, location, value):
+        try:
+            GeocodeCacheEntry.objects.update_or_create(
+                key=key,
+                defaults={
+                    "query": location[:255],
+                    "coordinates": value["coordinates"],
+                    "place_name": value["place_name"][:255],
+                    "fetched_at": timezone.now(),
+                    "last_used_at": timezone.now(),
+                },
+            )
+        except DatabaseError:
+            self._count("db_errors")
+            return
+        self._record_write()
+
+    def prune(self):
+        """Drop expired rows and trim the shared table to its configured size."""
+        try:
+            cutoff = timezone.now() - datetime.timedelta(seconds=self.ttl_seconds)
+            GeocodeCacheEntry.objects.filter(fetched_at__lt=cutoff).delete()
+            max_rows = settings.GEOCODE_CACHE_MAX_ROWS
+            stale_ids = list(
+                GeocodeCacheEntry.objects.order_by("-last_used_at").values_list(
+                    "id", flat=True
+                )[max_rows:]
+            )
+            if stale_ids:
+                GeocodeCacheEntry.objects.filter(id__in=stale_ids).delete()
+        except DatabaseError:
+            self._count("db_errors")
+
+
+class RouteCache(_SharedTableCache):
+    """Two-tier cache of Geoapify routes keyed by grid-snapped waypoints and mode.
+
+    Geometry is kept as encoded polylines in both tiers (decoded on a hit) so a long
+    lane costs a few tens of KB rather than a list of float pairs. The shared table is
+    bounded by the total size of the stored geometry, evicting least recently used lanes.
+    """
+
+    def __init__(self):
+        super().__init__(
+            memory_size=settings.ROUTE_CACHE_MEMORY_SIZE,
+            ttl_seconds=settings.ROUTE_CACHE_TTL_SECONDS,
+        )
+
+    @property
+    def ttl_seconds(self):
+        return settings.ROUTE_CACHE_TTL_SECONDS
+
+    def get(self, waypoints, mode="drive"):
+        key = route_cache_key(waypoints, mode)
+        if key is None:
+            return None
+
+        packed = self.memory.get(key)
+        if packed is None:
+            packed = self._db_get(key)
+            if packed is None:
+                return None
+            self.memory.set(key, packed)
+        return self._unpack(packed)
+
+    def set(self, waypoints, route, mode="drive"):
+        key = route_cache_key(waypoints, mode)
+        if key is None:
+            return
+        packed = self._pack(route)
+        self.memory.set(key, packed)
+        self._db_set(key, mode, packed)
+
+    def clear(self):
+        self.memory.clear()
+        try:
+            RouteCacheEntry.objects.all().delete()
+        except DatabaseError:
+            self._count("db_errors")
+
+    @staticmethod
+    def _pack(route):
+        geometry = route.get("geometry") or {}
+        geometry_type = geometry.get("type") or ""
+        coords = geometry.get("coordinates") or []
+        if geometry_type == "LineString":
+            parts = [coords]
+        elif geometry_type == "MultiLineString":
+            parts = coords
+        else:
+            geometry_type, parts = "", []
+        return {
+            "distance_miles": route["distance_miles"],
+            "duration_hours": route["duration_hours"],
+            "geometry_type": geometry_type,
+            # Polyline characters are printable ASCII 63-126, so a newline can't clash.
+            "encoded_geometry": "\n".join(polyline.encode(part) for part in parts),
+            "point_count": sum(len(part) for part in parts),
+        }
+
+    @staticmethod
+    def _unpack(packed):
+        geometry = None
+        if packed["geometry_type"]:
+            parts = [
+                polyline.decode(part) for part in packed["encoded_geometry"].split("\n")
+            ]
+            geometry = {
+                "type": packed["geometry_type"],
+                "coordinates": (
+                    parts[0] if packed["geometry_type"] == "LineString" else parts
+                ),
+            }
+        return {
+            "distance_miles": packed["distance_miles"],
+            "duration_hours": packed["duration_hours"],
+            "geometry": geometry,
+        }
+
+    def _db_get(self, key):
+        try:
+            entry = (
+                RouteCacheEntry.objects.filter(key=key)
+                .only(
+                    "id",
+                    "distance_miles",
+                    "duration_hours",
+                    "geometry_type",
+                    "encoded_geometry",
+                    "point_count",
+                    "fetched_at",
+                )
+                .first()
+            )
+            if entry is None:
+                self._count("db_misses")
+                return None
+            if not self._is_fresh(entry):
+                # Stale lanes are re-fetched so road changes and closures eventually show up.
+                RouteCacheEntry.objects.filter(pk=entry.pk).delete()
+                self._count("db_misses")
+                return None
+            RouteCacheEntry.objects.filter(pk=entry.pk).update(
+                hit_count=F("hit_count") + 1, last_used_at=timezone.now()
+            )
+        except DatabaseError:
+            self._count("db_errors")
+            return None
+        self._count("db_hits")
+        return {
+            "distance_miles": entry.distance_miles,
+            "duration_hours": entry.duration_hours,
+            "geometry_type": entry.geometry_type,
+            "encoded_geometry": entry.encoded_geometry,
+            "point_count": entry.point_count,
+        }
+
+    def _db_set(self, key, mode, packed):
+        now = timezone.now()
+        try:
+            RouteCacheEntry.objects.update_or_create(
+                key=key,
+                defaults={
+                    "mode": mode,
+                    "distance_miles": packed["distance_miles"],
+                    "duration_hours": packed["duration_hours"],
+                    "geometry_type": packed["geometry_type"],
+                    "encoded_geometry": packed["encoded_geometry"],
+                    "point_count": packed["point_count"],
+                    "size_bytes": len(packed["encoded_geometry"]),
+                    "fetched_at": now,
+                    "last_used_at": now,
+                },
+            )
+        except DatabaseError:
+            self._count("db_errors")
+            return
+        self._record_write()
+
+    def prune(self):
+        """Drop stale lanes, then evict least recently used ones beyond the byte budget."""
+        try:
+            cutoff = timezone.now() - datetime.timedelta(seconds=self.ttl_seconds)
+            RouteCacheEntry.objects.filter(fetched_at__lt=cutoff).delete()
+            budget = settings.ROUTE_CACHE_MAX_BYTES
+            used = 0
+            evict_ids = []
+            rows = RouteCacheEntry.objects.order_by("-last_used_at").values_list(
+                "id", "size_bytes"
+            )
+            for entry_id, size_bytes in rows.iterator():
+                used += size_bytes
+                if used > budget:
+                    evict_ids.append(entry_id)
+            if evict_ids:
+                RouteCacheEntry.objects.filter(id__in=evict_ids).delete()
+        except DatabaseError:
+            self._count("db_errors")
+
+
+class PlanCache(_SharedTableCache):
+    """Two-tier cache of simulated plans keyed by ``hos.plan_fingerprint``.
+
+    A value is ``{"segments", "summary", "eld_logs"}`` as ``simulate_route`` produces
+    them, so a hit skips both the HOS simulation and ELD generation. Both tiers hold the
+    plan as JSON text and each hit decodes a fresh copy. The shared table is bounded by
+    total stored bytes, evicting least recently used plans.
+    """
+
+    def __init__(self):
+        super().__init__(
+            memory_size=settings.PLAN_CACHE_MEMORY_SIZE,
+            ttl_seconds=settings.PLAN_CACHE_TTL_SECONDS,
+        )
+
+    @property
+    def ttl_seconds(self):
+        return settings.PLAN_CACHE_TTL_SECONDS
+
+    def get(self, key):
+        packed = self.memory.get(key)
+        if packed is None:
+            packed = self._db_get(key)
+            if packed is None:
+                return None
+            self.memory.set(key, packed)
+        return self._unpack(packed)
+
+    def set(self, key, plan):
+        packed = self._pack(plan)
+        self.memory.set(key, packed)
+        self._db_set(key, packed, len(plan["segments"]))
+
+    def clear(self):
+        self.memory.clear()
+        try:
+            PlanCacheEntry.objects.all().delete()
+        except DatabaseError:
+            self._count("db_errors")
+
+    @staticmethod
+    def _pack(plan):
+        segments = [
+            dict(
+                segment,
+                start_time=segment["start_time"].isoformat(),
+                end_time=segment["end_time"].isoformat(),
+            )
+            for segment in plan["segments"]
+        ]
+        summary = dict(plan["summary"])
+        if summary.get("arrival_time") is not None:
+            summary["arrival_time"] = summary["arrival_time"].isoformat()
+        return json.dumps(
+            {"segments": segments, "summary": summary, "eld_logs": plan["eld_logs"]},
+            separators=(",", ":"),
+        )
+
+    @staticmethod
+    def _unpack(packed):
+        plan = json.loads(packed)
+        for segment in plan["segments"]:
+            segment["start_time"] = parse_datetime(segment["start_time"])
+            segment["end_time"] = parse_datetime(segment["end_time"])
+        summary = plan["summary"]
+        if summary.get("arrival_time") is not None:
+            summary["arrival_time"] = parse_datetime(summary["arrival_time"])
+        return plan
+
+    def _db_get(self, key):
+        try:
+            entry = (
+                PlanCacheEntry.objects.filter(key=key)
+                .only("id", "plan", "fetched_at")
+                .first()
+            )
+            if entry is None:
+                self._count("db_misses")
+                return None
+            if not self._is_fresh(entry):
+                PlanCacheEntry.objects.filter(pk=entry.pk).delete()
+                self._count("db_misses")
+                return None
+            PlanCacheEntry.objects.filter(pk=entry.pk).update(
+                hit_count=F("hit_count") + 1, last_used_at=timezone.now()
+            )
+        except DatabaseError:
+            self._count("db_errors")
+            return None
+        self._count("db_hits")
+        return entry.plan
+
+    def _db_set(self, key, packed, segment_count):
+        now = timezone.now()
+        try:
+            PlanCacheEntry.objects.update_or_create(
+                key=key,
+                defaults={
+                    "plan": packed,
+                    "segment_count": segment_count,
+                    "size_bytes": len(packed),
+                    "fetched_at": now,
+                    "last_used_at": now,
+                },
+            )
+        except DatabaseError:
+            self._count("db_errors")
+            return
+        self._record_write()
+
+    def prune(self):
+        """Drop expired plans, then evict least recently used ones beyond the byte budget."""
+        try:
+            cutoff = timezone.now() - datetime.timedelta(seconds=self.ttl_seconds)
+            PlanCacheEntry.objects.filter(fetched_at__lt=cutoff).delete()
+            budget = settings.PLAN_CACHE_MAX_BYTES
+            used = 0
+            evict_ids = []
+            rows = PlanCacheEntry.objects.order_by("-last_used_at").values_list(
+                "id", "size_bytes"
+            )
+            for entry_id, size_bytes in rows.iterator():
+                used += size_bytes
+                if used > budget:
+                    evict_ids.append(entry_id)
+            if evict_ids:
+                PlanCacheEntry.objects.filter(id__in=evict_ids).delete()
+        except DatabaseError:
+            self._count("db_errors")
+
+
+class TripResponseCache(_SharedTableCache):
+    """Two-tier cache of finished ``GET /api/trips/<id>/`` bodies, keyed by trip id.
+
+    Trips rarely change once created, so an entry stays valid until the trip is updated
+    or deleted, which deletes it (and the shared row goes with the trip); other workers'
+    memory tiers only catch up when their copy expires. Each entry holds the JSON body,
+    its gzip and, when the brotli package is installed, brotli forms, and a strong ETag.
+    The shared table is bounded by total stored bytes, evicting least recently used
+    trips.
+    """
+
+    def __init__(self):
+        super().__init__(
+            memory_size=settings.TRIP_RESPONSE_CACHE_MEMORY_SIZE,
+            ttl_seconds=settings.TRIP_RESPONSE_CACHE_MEMORY_TTL_SECONDS,
+        )
+
+    @property
+    def ttl_seconds(self):
+        return settings.TRIP_RESPONSE_CACHE_MEMORY_TTL_SECONDS
+
+    def get(self, trip_id):
+        """``{"etag", "body", "gzip", "br"}`` for the trip, or None on a miss."""
+        packed = self.memory.get(trip_id)
+        if packed is None:
+            packed = self._db_get(trip_id)
+            if packed is not None:
+                self.memory.set(trip_id, packed)
+        return packed
+
+    def get_or_build(self, trip_id, build):
+        """Cached entry for the trip, calling ``build()`` for its JSON body on a miss.
+
+        ``build`` returns None for a trip that doesn't exist, and so does this.
+        """
+        packed = self.get(trip_id)
+        if packed is None:
+            body = build()
+            if body is None:
+                return None
+            packed = self.set(trip_id, body)
+        return packed
+
+    def set(self, trip_id, body):
+        packed = self._pack(body)
+        self.memory.set(trip_id, packed)
+        self._db_set(trip_id, packed)
+        return packed
+
+    def delete(self, trip_id):
+        self.memory.delete(trip_id)
+        try:
+            TripResponseCacheEntry.objects.filter(trip_id=trip_id).delete()
+        except DatabaseError:
+            self._count("db_errors")
+
+    def clear(self):
+        self.memory.clear()
+        try:
+            TripResponseCacheEntry.objects.all().delete()
+        except DatabaseError:
+            self._count("db_errors")
+
+    @staticmethod
+    def _pack(body):
+        # Compressed once per trip, so the slowest (smallest) settings are worth it
+        return {
+            "etag": f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+            "body": body,
+            "gzip": gzip.compress(body, compresslevel=9, mtime=0),
+            "br": brotli.compress(body) if brotli is not None else None,
+        }
+
+    def _db_get(self, trip_id):
+        try:
+            entry = TripResponseCacheEntry.objects.filter(trip_id=trip_id).first()
+            if entry is None:
+                self._count("db_misses")
+                return None
+            TripResponseCacheEntry.objects.filter(pk=entry.pk).update(
+                hit_count=F("hit_count") + 1, last_used_at=timezone.now()
+            )
+        except DatabaseError:
+            self._count("db_errors")
+            return None
+        self._count("db_hits")
+        return {
+            "etag": entry.etag,
+            "body": bytes(entry.body),
+            "gzip": bytes(entry.gzip_body),
+            "br": bytes(entry.br_body) if entry.br_body is not None else None,
+        }
+
+    def _db_set(self, trip_id, packed):
+        try:
+            TripResponseCacheEntry.objects.update_or_create(
+                trip_id=trip_id,
+                defaults={
+                    "etag": packed["etag"],
+                    "body": packed["body"],
+                    "gzip_body": packed["gzip"],
+                    "br_body": packed["br"],
+                    "size_bytes": len(packed["body"])
+                    + len(packed["gzip"])
+                    + len(packed["br"] or b""),
+                    "last_used_at": timezone.now(),
+                },
+            )
+        except DatabaseError:
+            self._count("db_errors")
+            return
+        self._record_write()
+
+    def prune(self):
+        """Evict least recently used trips beyond the byte budget."""
+        try:
+            budget = settings.TRIP_RESPONSE_CACHE_MAX_BYTES
+            used = 0
+            evict_ids = []
+            rows = TripResponseCacheEntry.objects.order_by("-last_used_at").values_list(
+                "trip_id", "size_bytes"
+            )
+            for trip_id, size_bytes in rows.iterator():
+                used += size_bytes
+                if used > budget:
+                    evict_ids.append(trip_id)
+            if evict_ids:
+                TripResponseCacheEntry.objects.filter(trip_id__in=evict_ids).delete()
+        except DatabaseError:
+            self._count("db_errors")
+
+
+geocode_cache = GeocodeCache()
+route_cache = RouteCache()
+plan_cache = PlanCache()
+trip_response_cache = TripResponseCache()
@@ -0,0 +1,104 @@
+# trip_planner/eld.py
+"""Daily ELD logs from planned route segments, free of network and database I/O.
+
+Times are handled as integer minutes past midnight (UTC), matching the "HH:MM"
+resolution of the logs. Each segment is split at midnight arithmetically, and each day
+is gap-filled and summed in one pass over its entries. A day's last entry ends at
+"23:59", which stands for midnight and is counted as such in the hours summary.
+"""
+
+import datetime
+
+import pytz
+
+ELD_STATUS_BY_SEGMENT_TYPE = {
+    "DRIVE": "D",
+    "REST": "SB",
+    "FUEL": "ON",
+    "PICKUP": "ON",
+    "DROPOFF": "ON",
+    "START": "OFF",
+}
+
+MINUTES_PER_DAY = 24 * 60
+END_OF_DAY = MINUTES_PER_DAY - 1
+
+_CLOCK = tuple(f"{m // 60:02d}:{m % 60:02d}" for m in range(MINUTES_PER_DAY))
+_ONE_DAY = datetime.timedelta(days=1)
+
+
+def _minute_of_day(dt):
+    return dt.hour * 60 + dt.minute
+
+
+def _split_by_day(segments):
+    """``{date: [(start_minute, end_minute, status, location, notes), ...]}``.
+
+    Days are in first-seen order, and each day's entries are sorted by start minute
+    (stably, so entries starting in the same minute keep their segment order).
+    """
+    days = {}
+    unsorted_days = set()
+    for segment in segments:
+        start = segment["start_time"].astimezone(pytz.utc)
+        end = segment["end_time"].astimezone(pytz.utc)
+        status = ELD_STATUS_BY_SEGMENT_TYPE.get(segment["type"], "OFF")
+        location = segment["start_location"]
+        notes = f"Segment Type: {segment['type']}"
+
+        day, last_day = start.date(), end.date()
+        start_minute = _minute_of_day(start)
+        while day <= last_day:
+            end_minute = _minute_of_day(end) if day == last_day else END_OF_DAY
+            entries = days.setdefault(day, [])
+            if entries and start_minute < entries[-1][0]:
+                unsorted_days.add(day)
+            entries.append((start_minute, end_minute, status, location, notes))
+            day += _ONE_DAY
+            start_minute = 0
+
+    for day in unsorted_days:
+        days[day].sort(key=lambda entry: entry[0])
+    return days
+
+
+def _day_log(date_str, entries):
+    timeline = []
+    hours = {"D": 0.0, "ON": 0.0, "OFF": 0.0, "SB": 0.0}
+
+    def add(status, start_minute, end_minute, location, notes):
+        timeline.append(
+            {
+                "status": status,
+                "start_time": _CLOCK[start_minute],
+                "end_time": _CLOCK[end_minute],
+                "location": location,
+                "notes": notes,
+            }
+        )
+        end = MINUTES_PER_DAY if end_minute == END_OF_DAY else end_minute
+        hours[status] += max(0, (end - start_minute) * 60) / 3600
+
+    last_end, last_location = 0, "Start of Day"
+    for start_minute, end_minute, status, location, notes in entries:
+        if start_minute > last_end:
+            add("OFF", last_end, start_minute, last_location, "Gap Fill")
+        add(status, start_minute, end_minute, location, notes)
+        last_end, last_location = end_minute, location
+    if last_end != END_OF_DAY:
+        add("OFF", last_end, END_OF_DAY, last_location, "Gap Fill End of Day")
+
+    return {
+        "date": date_str,
+        "status_timeline": timeline,
+        "hours_summary": {status: round(total, 2) for status, total in hours.items()},
+    }
+
+
+def build_daily_logs(segments):
+    """``{"YYYY-MM-DD": log}`` for every day the segments touch, in the order reached."""
+    logs = {}
+    for day, entries in _split_by_day(segments).items():
+        date_str = day.isoformat()
+        logs[date_str] = _day_log(date_str, entries)
+    return logs
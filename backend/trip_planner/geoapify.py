@@ -0,0 +1,328 @@
+# trip_planner/geoapify.py
+import asyncio
+import contextlib
+import contextvars
+import os
+import random
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from decouple import config
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .telemetry import UPSTREAM_REQUESTS
+
+GEOAPIFY_API_KEY = config("GEOAPIFY_API_KEY", default=None)
+
+DEFAULT_BASE_URL = "https://api.geoapify.com"
+
+ENDPOINT_PATHS = {
+    "geocode": "/v1/geocode/search",
+    "routing": "/v1/routing",
+}
+
+# Statuses worth another attempt: rate limiting and transient upstream failures.
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+REDACTED = "***KEY***"
+
+
+class _GeoapifyClientBase:
+    """Settings, URL building, key redaction and backoff shared by both clients."""
+
+    def __init__(
+        self,
+        api_key,
+        base_url=DEFAULT_BASE_URL,
+        timeouts=None,
+        connect_timeout=3.05,
+        max_retries=2,
+        backoff_seconds=0.25,
+        backoff_max_seconds=2.0,
+        pool_size=10,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeouts = {"geocode": 10, "routing": 15}
+        self.timeouts.update(timeouts or {})
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.pool_size = pool_size
+
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.failures = 0
+
+    def url_for(self, endpoint):
+        return self.base_url + ENDPOINT_PATHS[endpoint]
+
+    def redact(self, text):
+        text = str(text)
+        if self.api_key:
+            text = text.replace(self.api_key, REDACTED)
+        return text
+
+    def _backoff(self, attempt):
+        # Full jitter: spread retries from concurrent workers across the window.
+        ceiling = min(
+            self.backoff_max_seconds, self.backoff_seconds * 2 ** (attempt - 1)
+        )
+        return random.uniform(0, ceiling)
+
+    @staticmethod
+    def _retry_after_seconds(response):
+        value = response.headers.get("Retry-After")
+        try:
+            return max(0.0, float(value)) if value is not None else None
+        except ValueError:
+            return None
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    @staticmethod
+    def _record(endpoint, outcome):
+        # One sample per attempt: "ok", "http_error", "retry" or "error" (network)
+        UPSTREAM_REQUESTS.labels(endpoint, outcome).inc()
+
+
+class GeoapifyClient(_GeoapifyClientBase):
+    """Keep-alive Geoapify client shared by every planner call in a worker process.
+
+    One ``requests.Session`` holds a connection pool to the API host, so repeated
+    geocode/routing calls reuse TLS connections instead of handshaking each time.
+    Connection errors and 429/5xx responses are retried a bounded number of times with
+    full-jitter exponential backoff; read timeouts are not retried, since another full
+    timeout would not fit in the gunicorn request timeout. The API key is only ever
+    added here, and ``redact`` is the one place it is scrubbed from text we log.
+    """
+
+    def __init__(self, api_key, **kwargs):
+        super().__init__(api_key, **kwargs)
+        self._adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=self.pool_size, max_retries=0
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+
+    def get(self, endpoint, params):
+        """GET an endpoint ("geocode" or "routing"), retrying transient failures.
+
+        Returns the final ``requests.Response`` (which may still be an error status once
+        retries are exhausted); raises ``requests.RequestException`` for network errors.
+        """
+        url = self.url_for(endpoint)
+        params = dict(params, apiKey=self.api_key)
+        timeout = (self.connect_timeout, self.timeouts[endpoint])
+
+        attempt = 0
+        while True:
+            try:
+                response = self.session.get(url, params=params, timeout=timeout)
+            except requests.exceptions.ConnectionError:
+                # ConnectTimeout is a ConnectionError too; a ReadTimeout is not.
+                if attempt >= self.max_retries:
+                    self._count("failures")
+                    self._record(endpoint, "error")
+                    raise
+                self._record(endpoint, "retry")
+            except requests.RequestException:
+                self._record(endpoint, "error")
+                raise
+            else:
+                if (
+                    response.status_code not in RETRY_STATUSES
+                    or attempt >= self.max_retries
+                ):
+                    if response.status_code >= 400:
+                        self._count("failures")
+                        self._record(endpoint, "http_error")
+                    else:
+                        self._record(endpoint, "ok")
+                    return response
+                self._record(endpoint, "retry")
+                retry_after = self._retry_after_seconds(response)
+                response.close()
+                if retry_after is not None:
+                    attempt += 1
+                    self._count("retries")
+                    time.sleep(min(retry_after, self.backoff_max_seconds))
+                    continue
+
+            attempt += 1
+            self._count("retries")
+            time.sleep(self._backoff(attempt))
+
+    def stats(self):
+        """Requests sent, and how many connections were opened vs. reused from the pool."""
+        requests_sent = 0
+        connections_opened = 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            requests_sent += pool.num_requests
+            connections_opened += pool.num_connections
+        return {
+            "requests": requests_sent,
+            "connections_opened": connections_opened,
+            "connections_reused": max(0, requests_sent - connections_opened),
+            "retries": self.retries,
+            "failures": self.failures,
+        }
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncGeoapifyClient(_GeoapifyClientBase):
+    """``httpx.AsyncClient`` twin of GeoapifyClient for the async planning path.
+
+    Same timeouts, retry rules and key handling, but waiting on the network (and on
+    backoff) yields to the event loop, so one worker process can have many plans in
+    flight at once.
+    """
+
+    def __init__(self, api_key, **kwargs):
+        super().__init__(api_key, **kwargs)
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.pool_size * 10,
+                max_keepalive_connections=self.pool_size,
+            )
+        )
+        self.requests_sent = 0
+
+    async def get(self, endpoint, params):
+        """Async ``GeoapifyClient.get``; raises ``httpx.RequestError`` for network errors."""
+        url = self.url_for(endpoint)
+        params = dict(params, apiKey=self.api_key)
+        timeout = httpx.Timeout(self.timeouts[endpoint], connect=self.connect_timeout)
+
+        attempt = 0
+        while True:
+            try:
+                self._count("requests_sent")
+                response = await self.client.get(url, params=params, timeout=timeout)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if attempt >= self.max_retries:
+                    self._count("failures")
+                    self._record(endpoint, "error")
+                    raise
+                self._record(endpoint, "retry")
+            except httpx.RequestError:
+                self._record(endpoint, "error")
+                raise
+            else:
+                if (
+                    response.status_code not in RETRY_STATUSES
+                    or attempt >= self.max_retries
+                ):
+                    if response.status_code >= 400:
+                        self._count("failures")
+                        self._record(endpoint, "http_error")
+                    else:
+                        self._record(endpoint, "ok")
+                    return response
+                self._record(endpoint, "retry")
+                retry_after = self._retry_after_seconds(response)
+                await response.aclose()
+                if retry_after is not None:
+                    attempt += 1
+                    self._count("retries")
+                    await asyncio.sleep(min(retry_after, self.backoff_max_seconds))
+                    continue
+
+            attempt += 1
+            self._count("retries")
+            await asyncio.sleep(self._backoff(attempt))
+
+    def stats(self):
+        return {
+            "requests": self.requests_sent,
+            "retries": self.retries,
+            "failures": self.failures,
+        }
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+_scoped_async_client = contextvars.ContextVar("scoped_async_client", default=None)
+
+
+def _client_options():
+    return dict(
+        base_url=settings.GEOAPIFY_BASE_URL,
+        timeouts={
+            "geocode": settings.GEOAPIFY_GEOCODE_TIMEOUT,
+            "routing": settings.GEOAPIFY_ROUTING_TIMEOUT,
+        },
+        connect_timeout=settings.GEOAPIFY_CONNECT_TIMEOUT,
+        max_retries=settings.GEOAPIFY_MAX_RETRIES,
+        backoff_seconds=settings.GEOAPIFY_BACKOFF_SECONDS,
+        pool_size=settings.GEOAPIFY_POOL_SIZE,
+    )
+
+
+def get_client():
+    """Return this worker process's client, creating it after a fork if needed.
+
+    gunicorn preloads the app and then forks, and pooled sockets must not be shared
+    between processes, so the client is keyed on the current pid.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = GeoapifyClient(api_key=GEOAPIFY_API_KEY, **_client_options())
+                _client_pid = pid
+    return _client
+
+
+def get_async_client():
+    """Return the async client for the running event loop.
+
+    httpx connections belong to the loop that opened them, so there is one client per
+    loop (uvicorn runs a single loop per worker process). Inside ``scoped_async_client``
+    the block's own client is returned instead.
+    """
+    client = _scoped_async_client.get()
+    if client is not None:
+        return client
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = AsyncGeoapifyClient(api_key=GEOAPIFY_API_KEY, **_client_options())
+        _async_clients[loop] = client
+    return client
+
+
+@contextlib.asynccontextmanager
+async def scoped_async_client():
+    """Give the calls inside the block their own async client, closed on the way out.
+
+    For event loops that only live for one request (an async view under WSGI runs on a
+    new loop each time), where a per-loop client would never be closed.
+    """
+    client = AsyncGeoapifyClient(api_key=GEOAPIFY_API_KEY, **_client_options())
+    token = _scoped_async_client.set(client)
+    try:
+        yield client
+    finally:
+        _scoped_async_client.reset(token)
+        await client.aclose()
@@ -0,0 +1,160 @@
+# trip_planner/geometry.py
+import numpy as np
+
+EARTH_RADIUS_MILES = 3958.7613
+METERS_PER_DEGREE = 111_319.49  # Along the equator (or any meridian)
+# Ground size of one 256 px Web Mercator tile pixel at zoom 0, at the equator.
+METERS_PER_PIXEL_ZOOM_0 = 156_543.03
+
+
+def haversine_miles(lons1, lats1, lons2, lats2):
+    """Great-circle distance in miles; works element-wise on NumPy arrays."""
+    lons1, lats1, lons2, lats2 = map(np.radians, (lons1, lats1, lons2, lats2))
+    a = (
+        np.sin((lats2 - lats1) / 2) ** 2
+        + np.cos(lats1) * np.cos(lats2) * np.sin((lons2 - lons1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class RouteGeometry:
+    """A leg's polyline plus its cumulative arc length, built once per leg.
+
+    Positions along the leg are looked up by distance travelled rather than by vertex
+    index, so stops land where the truck actually is even when vertices are unevenly
+    spaced. Each lookup is a binary search over the cumulative distances, and
+    ``points_at_fractions`` resolves every stop on a leg in one vectorized call.
+    """
+
+    def __init__(self, coordinates):
+        coords = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        if len(coords) == 0:
+            raise ValueError("RouteGeometry needs at least one coordinate.")
+        self.coordinates = coords
+        if len(coords) > 1:
+            step = haversine_miles(
+                coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1]
+            )
+            self.cumulative_miles = np.concatenate(([0.0], np.cumsum(step)))
+        else:
+            self.cumulative_miles = np.zeros(1)
+        self.length_miles = float(self.cumulative_miles[-1])
+
+    @classmethod
+    def from_geojson(cls, geometry):
+        """Build from a GeoJSON LineString/MultiLineString, or return None if unusable.
+
+        Geoapify returns one MultiLineString part per leg; the parts are walked in order
+        as a single line.
+        """
+        if not geometry:
+            return None
+        geom_type = geometry.get("type")
+        coords = geometry.get("coordinates")
+        if not coords:
+            return None
+        if geom_type == "MultiLineString":
+            coords = [point for part in coords for point in part]
+        elif geom_type != "LineString":
+            return None
+        if not coords:
+            return None
+        return cls(coords)
+
+    def __len__(self):
+        return len(self.coordinates)
+
+    def points_at_fractions(self, fractions):
+        """Return an (n, 2) array of [lon, lat] at each fraction (0-1) of the leg length."""
+        fractions = np.clip(np.asarray(fractions, dtype=np.float64), 0.0, 1.0)
+        coords = self.coordinates
+        if len(coords) == 1 or self.length_miles <= 0:
+            return np.repeat(coords[:1], len(fractions), axis=0)
+
+        cumulative = self.cumulative_miles
+        targets = fractions * self.length_miles
+        # Index of the vertex starting the segment that contains each target distance.
+        idx = np.searchsorted(cumulative, targets, side="right") - 1
+        idx = np.clip(idx, 0, len(coords) - 2)
+        seg_start = cumulative[idx]
+        seg_length = cumulative[idx + 1] - seg_start
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = np.where(seg_length > 0, (targets - seg_start) / seg_length, 0.0)
+        return coords[idx] + (coords[idx + 1] - coords[idx]) * t[:, None]
+
+    def point_at_fraction(self, fraction):
+        """Single-point convenience wrapper around ``points_at_fractions``."""
+        return self.points_at_fractions([fraction])[0].tolist()
+
+
+def zoom_tolerance_meters(zoom):
+    """Half a map pixel at ``zoom``: coarser detail than this is invisible on screen."""
+    return METERS_PER_PIXEL_ZOOM_0 / 2**zoom / 2
+
+
+def simplify(coordinates, tolerance_meters):
+    """Douglas-Peucker simplification of a [lon, lat] polyline; returns an (m, 2) array.
+
+    Every dropped vertex lies within ``tolerance_meters`` of the simplified line, and
+    both endpoints are always kept. Distances are measured on a sinusoidal projection,
+    which is accurate to well under a percent at the scale of a tolerance.
+    """
+    coords = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    n = len(coords)
+    if n <= 2 or tolerance_meters <= 0:
+        return coords
+    xy = np.empty_like(coords)
+    xy[:, 1] = coords[:, 1] * METERS_PER_DEGREE
+    xy[:, 0] = coords[:, 0] * METERS_PER_DEGREE * np.cos(np.radians(coords[:, 1]))
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    tolerance_sq = tolerance_meters**2
+    # Every open (first, last) range at one depth of the recursion is split at once.
+    firsts, lasts = np.array([0]), np.array([n - 1])
+    while len(firsts):
+        interior = lasts - firsts - 1
+        range_ids = np.repeat(np.arange(len(firsts)), interior)
+        range_starts = np.cumsum(interior) - interior
+        idx = (
+            firsts[range_ids] + 1 + np.arange(len(range_ids)) - range_starts[range_ids]
+        )
+
+        start = xy[firsts]
+        chord = xy[lasts] - start
+        chord_sq = np.einsum("ij,ij->i", chord, chord)
+        offsets = xy[idx] - start[range_ids]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = np.where(
+                chord_sq[range_ids] > 0,
+                np.einsum("ij,ij->i", offsets, chord[range_ids]) / chord_sq[range_ids],
+                0.0,
+            )
+        offsets -= np.clip(t, 0.0, 1.0)[:, None] * chord[range_ids]
+        distances_sq = np.einsum("ij,ij->i", offsets, offsets)
+
+        # The first vertex at each range's maximum distance, like a plain argmax
+        max_sq = np.maximum.reduceat(distances_sq, range_starts)
+        at_max = np.flatnonzero(distances_sq == max_sq[range_ids])
+        _, first_at_max = np.unique(range_ids[at_max], return_index=True)
+        farthest = idx[at_max[first_at_max]]
+
+        split = max_sq > tolerance_sq
+        keep[farthest[split]] = True
+        firsts = np.concatenate((firsts[split], farthest[split]))
+        lasts = np.concatenate((farthest[split], lasts[split]))
+        open_ranges = lasts - firsts >= 2
+        firsts, lasts = firsts[open_ranges], lasts[open_ranges]
+    return coords[keep]
+
+
+def simplify_to_budget(coordinates, tolerance_meters, max_points):
+    """``simplify``, doubling the tolerance until at most ``max_points`` remain.
+
+    Returns ``(coords, tolerance_meters_used)``, the error bound actually achieved.
+    """
+    simplified = simplify(coordinates, tolerance_meters)
+    while len(simplified) > max(2, max_points):
+        tolerance_meters *= 2
+        simplified = simplify(coordinates, tolerance_meters)
+    return simplified, tolerance_meters
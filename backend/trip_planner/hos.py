@@ -0,0 +1,477 @@
+# trip_planner/hos.py
+"""Hours-of-Service trip simulation, free of network, database and logging I/O.
+
+``simulate_trip`` takes already-routed legs plus the driver's starting state and returns
+the DRIVE/REST/FUEL/PICKUP/DROPOFF segment dicts that ``route_planner.plan_route`` has
+always produced, so it can be profiled, tested and batch-run on its own.
+"""
+
+import dataclasses
+import datetime
+import hashlib
+import math
+from typing import List, Optional
+
+from .geometry import RouteGeometry
+
+# Constants for ELD regulations (adjust as needed)
+MAX_DRIVING_HOURS_PER_DAY = 11
+MAX_ON_DUTY_HOURS_PER_DAY = 14
+REQUIRED_REST_HOURS = 10
+MAX_CONSECUTIVE_DRIVING_HOURS = 8  # Driver must take 30-min break by 8th hour
+HOURS_BEFORE_BREAK = 8  # Simplified: break needed if drive exceeds this
+BREAK_DURATION_HOURS = 0.5
+MAX_CYCLE_HOURS = 70  # e.g., 70 hours in 8 days
+AVERAGE_SPEED_MPH = 55  # Adjust this based on typical conditions
+FUEL_STOP_DURATION_HOURS = 0.75
+PICKUP_DROPOFF_DURATION_HOURS = 1.0
+MAX_MILES_BEFORE_FUEL = 1000  # Adjust fuel range
+
+RESTART_HOURS = 34  # Off-duty hours that reset the 70-hour cycle
+
+# Part of every plan fingerprint; bump it when simulate_trip's output changes.
+SIMULATION_VERSION = 2
+
+HOURS_EPSILON = 0.01
+# A drive block ending this close to the fuel range fuels there (as the loop always did),
+# but the range only counts as used up before driving once it is gone, float error aside.
+FUEL_MILES_EPSILON = 0.1
+FUEL_MILES_TOLERANCE = 1e-9
+# Resets needed back to back before driving can resume is at most one of each kind.
+_MAX_STOPS_BETWEEN_DRIVES = 5
+
+
+@dataclasses.dataclass(frozen=True)
+class HOSRules:
+    max_driving_hours_per_day: float = MAX_DRIVING_HOURS_PER_DAY
+    max_on_duty_hours_per_day: float = MAX_ON_DUTY_HOURS_PER_DAY
+    required_rest_hours: float = REQUIRED_REST_HOURS
+    hours_before_break: float = HOURS_BEFORE_BREAK
+    break_duration_hours: float = BREAK_DURATION_HOURS
+    max_cycle_hours: float = MAX_CYCLE_HOURS
+    average_speed_mph: float = AVERAGE_SPEED_MPH
+    fuel_stop_duration_hours: float = FUEL_STOP_DURATION_HOURS
+    max_miles_before_fuel: float = MAX_MILES_BEFORE_FUEL
+    restart_hours: float = RESTART_HOURS
+
+
+DEFAULT_RULES = HOSRules()
+
+
+@dataclasses.dataclass
+class HOSState:
+    """Where the driver is and how much of each HOS limit is left."""
+
+    current_time: datetime.datetime
+    remaining_daily_driving: float
+    remaining_daily_duty: float
+    remaining_cycle: float
+    driving_hours_since_last_break: float = 0.0
+    fuel_distance_since_last_stop: float = 0.0
+    position_coords: Optional[list] = None
+    position_name: str = "Unknown Start"
+
+    @classmethod
+    def start(
+        cls,
+        current_time,
+        current_cycle_used_hours,
+        position_coords,
+        position_name,
+        rules=DEFAULT_RULES,
+    ):
+        """Fresh daily limits, with the cycle reduced by hours already used."""
+        return cls(
+            current_time=current_time,
+            remaining_daily_driving=rules.max_driving_hours_per_day,
+            remaining_daily_duty=rules.max_on_duty_hours_per_day,
+            remaining_cycle=rules.max_cycle_hours - current_cycle_used_hours,
+            position_coords=position_coords,
+            position_name=position_name,
+        )
+
+
+@dataclasses.dataclass
+class Leg:
+    """One routed leg, ending at a stop (e.g. PICKUP or DROPOFF) of a given length."""
+
+    distance_miles: float
+    end_coordinates: list
+    end_name: str
+    stop_type: str
+    stop_duration_hours: float = PICKUP_DROPOFF_DURATION_HOURS
+    geometry: Optional[RouteGeometry] = None
+
+
+@dataclasses.dataclass
+class SimulationResult:
+    segments: List[dict]
+    state: HOSState
+    warnings: List[str]
+
+
+class _LegPosition:
+    """A point partway along a leg, known by its distance ratio until the leg is done."""
+
+    __slots__ = ("ratio", "coords")
+
+    def __init__(self, ratio):
+        self.ratio = ratio
+        self.coords = None
+
+    def __repr__(self):
+        return f"<position {self.ratio:.3f} along leg>"
+
+
+def _copy_position(coords):
+    if isinstance(coords, _LegPosition):
+        return coords
+    return list(coords) if coords else None
+
+
+def _resolve_leg_positions(leg_segments, route_geom, leg_start_coords):
+    """Swap every pending position on a leg for coordinates in one vectorized lookup.
+
+    Without usable geometry, pending positions fall back to the leg's start coordinates;
+    returns True when that happened.
+    """
+    pending = []
+    for segment in leg_segments:
+        for field in ("start_coordinates", "end_coordinates"):
+            position = segment.get(field)
+            if isinstance(position, _LegPosition) and position.coords is None:
+                pending.append(position)
+    if pending:
+        if route_geom is not None:
+            points = route_geom.points_at_fractions([p.ratio for p in pending])
+            for position, point in zip(pending, points.tolist()):
+                position.coords = point
+        else:
+            for position in pending:
+                position.coords = list(leg_start_coords) if leg_start_coords else None
+    fell_back = bool(pending) and route_geom is None
+    for segment in leg_segments:
+        for field in ("start_coordinates", "end_coordinates"):
+            position = segment.get(field)
+            if isinstance(position, _LegPosition):
+                segment[field] = list(position.coords) if position.coords else None
+    return fell_back
+
+
+def _stop_segment(segment_type, name, coords, start_time, hours):
+    return {
+        "type": segment_type,
+        "start_location": name,
+        "end_location": name,
+        "start_coordinates": coords,
+        "end_coordinates": coords,
+        "distance_miles": 0,
+        "duration_hours": hours,
+        "start_time": start_time,
+        "end_time": start_time + datetime.timedelta(hours=hours),
+    }
+
+
+def _advance(state, segments, segment):
+    segments.append(segment)
+    state.current_time = segment["end_time"]
+
+
+def _take_restart(state, rules, segments, name, coords):
+    """34-hour restart: the only thing that gives back cycle hours."""
+    _advance(
+        state,
+        segments,
+        _stop_segment("REST", name, coords, state.current_time, rules.restart_hours),
+    )
+    state.remaining_cycle = rules.max_cycle_hours
+    state.remaining_daily_driving = rules.max_driving_hours_per_day
+    state.remaining_daily_duty = rules.max_on_duty_hours_per_day
+    state.driving_hours_since_last_break = 0
+
+
+def _take_rest(state, rules, segments, name, coords):
+    """Mandatory 10-hour rest: resets the daily limits (not the cycle)."""
+    _advance(
+        state,
+        segments,
+        _stop_segment(
+            "REST", name, coords, state.current_time, rules.required_rest_hours
+        ),
+    )
+    state.remaining_daily_driving = rules.max_driving_hours_per_day
+    state.remaining_daily_duty = rules.max_on_duty_hours_per_day
+    state.driving_hours_since_last_break = 0
+
+
+def _take_break(state, rules, segments, name, coords):
+    """30-minute break: on-duty time that resets the hours-since-break counter."""
+    _advance(
+        state,
+        segments,
+        _stop_segment(
+            "REST", name, coords, state.current_time, rules.break_duration_hours
+        ),
+    )
+    state.remaining_daily_duty -= rules.break_duration_hours
+    state.remaining_cycle -= rules.break_duration_hours
+    state.driving_hours_since_last_break = 0
+
+
+def _take_fuel(state, rules, segments, name, coords):
+    _advance(
+        state,
+        segments,
+        _stop_segment(
+            "FUEL", name, coords, state.current_time, rules.fuel_stop_duration_hours
+        ),
+    )
+    state.remaining_daily_duty -= rules.fuel_stop_duration_hours
+    state.remaining_cycle -= rules.fuel_stop_duration_hours
+    state.fuel_distance_since_last_stop = 0
+
+
+def _drive_leg(leg, state, rules, segments, warnings):
+    """Drive one leg to its end, inserting breaks, rests, restarts and fuel stops.
+
+    Each step works out in closed form how far the driver gets before the first limit
+    (leg end, fuel range, 8-hour break window, 11-hour driving, 14-hour duty window or
+    cycle) runs out, emits that DRIVE block, and then the stop that resets the limit.
+    Every step emits at least one segment, so the work done is proportional to the
+    segments produced and there is no iteration cap to silently cut a long trip short.
+    """
+    total_route_distance = leg.distance_miles
+    if not math.isfinite(total_route_distance) or total_route_distance < 0:
+        raise ValueError(f"Invalid leg distance: {total_route_distance}")
+
+    leg_first_segment = len(segments)
+    leg_start_coords = state.position_coords
+    distance_covered_on_leg = 0.0
+    steps_without_driving = 0
+
+    while distance_covered_on_leg < total_route_distance:
+        if steps_without_driving > _MAX_STOPS_BETWEEN_DRIVES:
+            raise ValueError("HOS rules leave no driving time; check HOSRules values.")
+        steps_without_driving += 1
+        name = state.position_name
+        coords = _copy_position(state.position_coords)
+
+        # 1. Reset whichever limit is already used up before driving again
+        if state.remaining_cycle <= HOURS_EPSILON:
+            _take_restart(state, rules, segments, name, coords)
+            continue
+        if (
+            state.remaining_daily_driving <= HOURS_EPSILON
+            or state.remaining_daily_duty <= HOURS_EPSILON
+        ):
+            _take_rest(state, rules, segments, name, coords)
+            continue
+        fuel_miles_left = (
+            rules.max_miles_before_fuel - state.fuel_distance_since_last_stop
+        )
+        if fuel_miles_left <= FUEL_MILES_TOLERANCE:
+            _take_fuel(state, rules, segments, name, coords)
+            continue
+        break_hours_left = (
+            rules.hours_before_break - state.driving_hours_since_last_break
+        )
+        if break_hours_left <= HOURS_EPSILON:
+            _take_break(state, rules, segments, name, coords)
+            continue
+
+        # 2. Drive until the first limit (or the end of the leg)
+        drivable_hours = min(
+            state.remaining_daily_driving,
+            state.remaining_daily_duty,
+            state.remaining_cycle,
+            break_hours_left,
+        )
+        miles_left_on_leg = total_route_distance - distance_covered_on_leg
+        drive_miles = min(
+            drivable_hours * rules.average_speed_mph,
+            miles_left_on_leg,
+            fuel_miles_left,
+        )
+        reaches_leg_end = miles_left_on_leg - drive_miles <= total_route_distance * 1e-6
+        if reaches_leg_end:
+            drive_miles = miles_left_on_leg
+            distance_covered_on_leg = total_route_distance
+            drive_end_coords = (
+                list(leg.end_coordinates) if leg.end_coordinates else None
+            )
+            drive_end_name = leg.end_name
+        else:
+            distance_covered_on_leg += drive_miles
+            # Interpolated for the whole leg in one batch once the leg is done
+            drive_end_coords = _LegPosition(
+                distance_covered_on_leg / total_route_distance
+            )
+            drive_end_name = (
+                f"Point approx. {drive_miles:.1f} miles driven towards {leg.end_name}"
+            )
+
+        drive_hours = drive_miles / rules.average_speed_mph
+        _advance(
+            state,
+            segments,
+            {
+                "type": "DRIVE",
+                "start_location": name,
+                "end_location": drive_end_name,
+                "start_coordinates": coords,
+                "end_coordinates": drive_end_coords,
+                "distance_miles": drive_miles,
+                "duration_hours": drive_hours,
+                "start_time": state.current_time,
+                "end_time": state.current_time + datetime.timedelta(hours=drive_hours),
+            },
+        )
+        steps_without_driving = 0
+        state.position_coords = drive_end_coords
+        state.position_name = drive_end_name
+        state.remaining_daily_driving -= drive_hours
+        state.remaining_daily_duty -= drive_hours
+        state.remaining_cycle -= drive_hours
+        state.driving_hours_since_last_break += drive_hours
+        state.fuel_distance_since_last_stop += drive_miles
+
+        # 3. The stop this block ran into (rests/restarts are taken on the next step)
+        if not reaches_leg_end:
+            if (
+                state.fuel_distance_since_last_stop
+                >= rules.max_miles_before_fuel - FUEL_MILES_EPSILON
+            ):
+                _take_fuel(state, rules, segments, drive_end_name, drive_end_coords)
+            elif (
+                state.driving_hours_since_last_break
+                >= rules.hours_before_break - HOURS_EPSILON
+            ):
+                _take_break(state, rules, segments, drive_end_name, drive_end_coords)
+
+    if _resolve_leg_positions(
+        segments[leg_first_segment:], leg.geometry, leg_start_coords
+    ):
+        warnings.append(
+            f"No route geometry for the leg to {leg.end_name}; stops along it are "
+            "placed at the leg's start."
+        )
+    if isinstance(state.position_coords, _LegPosition):
+        state.position_coords = state.position_coords.coords
+
+
+def simulate_trip(legs, state, rules=DEFAULT_RULES):
+    """Simulate driving ``legs`` in order from ``state``, stopping at the end of each.
+
+    ``state`` is updated in place and also returned on the result. Any number of legs is
+    supported; each must end at a stop with known coordinates. ``warnings`` on the
+    result lists legs whose stops had to be placed without route geometry.
+    """
+    if rules.average_speed_mph <= 0:
+        raise ValueError("HOSRules.average_speed_mph must be positive.")
+    segments = []
+    warnings = []
+    for leg in legs:
+        _drive_leg(leg, state, rules, segments, warnings)
+        if not leg.end_coordinates:
+            raise ValueError(
+                f"{leg.stop_type.title()} location coordinates are missing!"
+            )
+
+        # Ensure position is exactly at the stop after the leg
+        stop_coords = list(leg.end_coordinates)
+        segments.append(
+            _stop_segment(
+                leg.stop_type,
+                leg.end_name,
+                stop_coords,
+                state.current_time,
+                leg.stop_duration_hours,
+            )
+        )
+        state.current_time = segments[-1]["end_time"]
+        state.position_coords = stop_coords
+        state.position_name = leg.end_name
+        state.remaining_daily_duty -= leg.stop_duration_hours
+        state.remaining_cycle -= leg.stop_duration_hours
+
+    return SimulationResult(segments=segments, state=state, warnings=warnings)
+
+
+def summarize_segments(segments):
+    """Total drive distance (miles) and wall-clock duration (hours) of a segment list."""
+    total_dist = sum(s["distance_miles"] for s in segments if s["type"] == "DRIVE")
+    total_dur = (
+        (segments[-1]["end_time"] - segments[0]["start_time"]).total_seconds() / 3600
+        if segments
+        else 0
+    )
+    return total_dist, total_dur
+
+
+def summarize_trip(segments, state, rules=DEFAULT_RULES):
+    """Trip totals as stored on ``Trip``: distance, hours by duty status, stop counts,
+    arrival time and the cycle hours used by then (``state`` is the final HOSState).
+    """
+    total_dist, total_dur = summarize_segments(segments)
+    hours = {"DRIVE": 0.0, "REST": 0.0, "ON": 0.0}
+    stop_counts = {"REST": 0, "FUEL": 0}
+    for s in segments:
+        kind = s["type"] if s["type"] in ("DRIVE", "REST") else "ON"
+        hours[kind] += s["duration_hours"]
+        if s["type"] in stop_counts:
+            stop_counts[s["type"]] += 1
+    return {
+        "total_distance_miles": total_dist,
+        "total_duration_hours": total_dur,
+        "driving_hours": hours["DRIVE"],
+        "rest_hours": hours["REST"],
+        "on_duty_hours": hours["ON"],
+        "rest_stop_count": stop_counts["REST"],
+        "fuel_stop_count": stop_counts["FUEL"],
+        "arrival_time": segments[-1]["end_time"] if segments else None,
+        "cycle_used_at_arrival": rules.max_cycle_hours - state.remaining_cycle,
+    }
+
+
+def plan_fingerprint(legs, state, rules=DEFAULT_RULES):
+    """Hash of everything ``simulate_trip(legs, state, rules)`` depends on.
+
+    That is each leg (distance, stop, end point and route line), the starting state
+    (time, cycle hours left, position) and the rules, so equal fingerprints mean equal
+    segments.
+    """
+    digest = hashlib.sha256()
+    digest.update(
+        repr(
+            (
+                SIMULATION_VERSION,
+                dataclasses.astuple(rules),
+                state.current_time.isoformat(),
+                float(state.remaining_daily_driving),
+                float(state.remaining_daily_duty),
+                float(state.remaining_cycle),
+                state.position_coords,
+                state.position_name,
+            )
+        ).encode("utf-8")
+    )
+    for leg in legs:
+        digest.update(
+            repr(
+                (
+                    float(leg.distance_miles),
+                    leg.end_coordinates,
+                    leg.end_name,
+                    leg.stop_type,
+                    float(leg.stop_duration_hours),
+                    (
+                        leg.geometry.coordinates.shape
+                        if leg.geometry is not None
+                        else None
+                    ),
+                )
+            ).encode("utf-8")
+        )
+        if leg.geometry is not None:
+            digest.update(leg.geometry.coordinates.tobytes())
+    return digest.hexdigest()
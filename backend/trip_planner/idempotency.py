@@ -0,0 +1,117 @@
+# trip_planner/idempotency.py
+"""``Idempotency-Key`` support for trip creates.
+
+The first request with a key claims it by inserting an IdempotencyKey row (the unique
+key column decides races between workers), plans, then records the trip or queued job
+on the row. A retry with the same key and request gets that trip or job back without
+planning again; the same key with a different request is refused. If planning fails,
+the key is released so a retry can try again. Keys expire after
+IDEMPOTENCY_KEY_TTL_SECONDS, and a claim left unfinished by a worker that died is taken
+over after IDEMPOTENCY_KEY_PENDING_SECONDS. Expired rows are deleted when their key is
+reused, and all of them once every PRUNE_EVERY_CLAIMS claims per process.
+"""
+
+import datetime
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+MAX_KEY_LENGTH = 255
+# Prune expired keys once every N claims per process rather than on every claim.
+PRUNE_EVERY_CLAIMS = 100
+
+_claims_since_prune = 0
+_prune_lock = threading.Lock()
+
+
+class IdempotencyError(Exception):
+    """The request can't go ahead under its key; ``status`` is the HTTP status to send."""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+def _expiry_cutoff(now):
+    return now - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL_SECONDS)
+
+
+def prune_idempotency_keys():
+    """Delete every expired key, whoever used it; returns how many rows went."""
+    deleted, _ = IdempotencyKey.objects.filter(
+        created_at__lt=_expiry_cutoff(timezone.now())
+    ).delete()
+    return deleted
+
+
+def _record_claim():
+    global _claims_since_prune
+    with _prune_lock:
+        _claims_since_prune += 1
+        should_prune = _claims_since_prune >= PRUNE_EVERY_CLAIMS
+        if should_prune:
+            _claims_since_prune = 0
+    if should_prune:
+        prune_idempotency_keys()
+
+
+def claim_idempotency_key(key, request_hash):
+    """Claim ``key`` for a request, returning ``(entry, replay)``.
+
+    With ``replay`` True, ``entry.trip`` or ``entry.job`` is what the earlier request
+    produced. Raises IdempotencyError for an invalid key, a key used with a different
+    request (422) or one whose first request is still being planned (409).
+    """
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise IdempotencyError(
+            f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters.", 400
+        )
+    _record_claim()
+    now = timezone.now()
+    IdempotencyKey.objects.filter(key=key, created_at__lt=_expiry_cutoff(now)).delete()
+    try:
+        with transaction.atomic():
+            entry = IdempotencyKey.objects.create(
+                key=key, request_hash=request_hash, created_at=now
+            )
+        return entry, False
+    except IntegrityError:
+        pass
+
+    entry = IdempotencyKey.objects.filter(key=key).first()
+    if entry is not None and entry.request_hash != request_hash:
+        raise IdempotencyError(
+            "This Idempotency-Key was already used with a different request.", 422
+        )
+    if entry is not None and (entry.trip_id or entry.job_id):
+        return entry, True
+    if entry is not None and entry.created_at < now - datetime.timedelta(
+        seconds=settings.IDEMPOTENCY_KEY_PENDING_SECONDS
+    ):
+        # Only one worker's update can match the claim time it read
+        taken = IdempotencyKey.objects.filter(
+            pk=entry.pk, created_at=entry.created_at, trip=None, job=None
+        ).update(created_at=now)
+        if taken:
+            entry.created_at = now
+            return entry, False
+    raise IdempotencyError(
+        "A request with this Idempotency-Key is still being planned; retry shortly.",
+        409,
+    )
+
+
+def complete_idempotency_key(entry, trip=None, job=None):
+    """Record what the claiming request produced."""
+    entry.trip = trip
+    entry.job = job
+    entry.save(update_fields=["trip", "job"])
+
+
+def release_idempotency_key(entry):
+    """Drop a claim whose request failed, so the client can retry with the same key."""
+    IdempotencyKey.objects.filter(pk=entry.pk, trip=None, job=None).delete()
@@ -0,0 +1,196 @@
+# trip_planner/jobs.py
+"""Database-backed queue for asynchronous trip planning.
+
+Jobs are PlanningJob rows. Any process can run them: each gunicorn worker starts
+PLANNING_JOB_LOCAL_WORKERS threads when it boots (see gunicorn.conf.py; other servers
+start them on the first enqueue), and ``python manage.py run_planning_jobs`` runs a
+dedicated worker. A job is claimed with ``SELECT ... FOR UPDATE SKIP LOCKED`` where the
+database supports it, plus a conditional status update, so two workers never run the
+same job. A running job's heartbeat is refreshed every PLANNING_JOB_HEARTBEAT_SECONDS;
+jobs whose heartbeat is PLANNING_JOB_STALE_SECONDS old belong to a worker that died
+(or was recycled) and are picked up again, and marked FAILED once they have been tried
+PLANNING_JOB_MAX_ATTEMPTS times.
+"""
+
+import contextlib
+import datetime
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import PlanningJob
+from .services import create_trip
+
+logger = logging.getLogger(__name__)
+
+# Set when a job is queued so idle local workers don't wait out their poll interval.
+_wakeup = threading.Event()
+_local_workers_pid = None
+_local_workers_lock = threading.Lock()
+
+
+def enqueue_trip(validated_data):
+    """Queue a trip-create request and make sure this process is working the queue."""
+    job = PlanningJob.objects.create(payload=_to_payload(validated_data))
+    logger.debug("Queued planning job %s", job.id)
+    start_local_workers()
+    _wakeup.set()
+    return job
+
+
+def _to_payload(validated_data):
+    # JSONField can't hold datetimes, so departure_time is kept as ISO 8601 text
+    payload = dict(validated_data)
+    if payload.get("departure_time") is not None:
+        payload["departure_time"] = payload["departure_time"].isoformat()
+    return payload
+
+
+def _from_payload(payload):
+    validated_data = dict(payload)
+    if validated_data.get("departure_time") is not None:
+        validated_data["departure_time"] = parse_datetime(
+            validated_data["departure_time"]
+        )
+    return validated_data
+
+
+def _fail_abandoned_jobs(stale_before):
+    """Give up on stale RUNNING jobs whose workers died on every attempt."""
+    max_attempts = settings.PLANNING_JOB_MAX_ATTEMPTS
+    failed = PlanningJob.objects.filter(
+        status=PlanningJob.RUNNING,
+        heartbeat_at__lt=stale_before,
+        attempts__gte=max_attempts,
+    ).update(
+        status=PlanningJob.FAILED,
+        error=f"Trip planning failed: worker died after {max_attempts} attempts",
+        finished_at=timezone.now(),
+    )
+    if failed:
+        logger.warning("Marked %d abandoned planning job(s) FAILED", failed)
+
+
+def claim_next_job():
+    """Mark the oldest runnable job RUNNING and return it, or None if there is none."""
+    stale_before = timezone.now() - datetime.timedelta(
+        seconds=settings.PLANNING_JOB_STALE_SECONDS
+    )
+    _fail_abandoned_jobs(stale_before)
+    runnable = Q(status=PlanningJob.PENDING) | Q(
+        status=PlanningJob.RUNNING,
+        heartbeat_at__lt=stale_before,
+        attempts__lt=settings.PLANNING_JOB_MAX_ATTEMPTS,
+    )
+    while True:
+        with transaction.atomic():
+            candidates = PlanningJob.objects.filter(runnable).order_by("created_at")
+            if connection.features.has_select_for_update_skip_locked:
+                candidates = candidates.select_for_update(skip_locked=True)
+            job = candidates.only("id", "status", "started_at").first()
+            if job is None:
+                return None
+            # Only one worker's update can match the status it read
+            now = timezone.now()
+            claimed = PlanningJob.objects.filter(
+                pk=job.pk, status=job.status, started_at=job.started_at
+            ).update(
+                status=PlanningJob.RUNNING,
+                started_at=now,
+                heartbeat_at=now,
+                attempts=F("attempts") + 1,
+            )
+        if claimed:
+            return PlanningJob.objects.get(pk=job.pk)
+
+
+def run_job(job):
+    """Plan and save the job's trip, recording the outcome on the job."""
+    logger.debug("Running planning job %s (attempt %d)", job.id, job.attempts)
+    try:
+        with _heartbeat(job):
+            trip = create_trip(_from_payload(job.payload))
+    except Exception as e:
+        logger.exception("Planning job %s failed", job.id)
+        job.status = PlanningJob.FAILED
+        job.error = f"Trip planning failed: {str(e)}"
+    else:
+        job.status = PlanningJob.SUCCEEDED
+        job.trip = trip
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "error", "trip", "finished_at"])
+    logger.info("Planning job %s finished: %s", job.id, job.status)
+    return job
+
+
+@contextlib.contextmanager
+def _heartbeat(job):
+    """Refresh the job's heartbeat from a side thread while the body runs."""
+    done = threading.Event()
+
+    def beat():
+        try:
+            while not done.wait(settings.PLANNING_JOB_HEARTBEAT_SECONDS):
+                try:
+                    PlanningJob.objects.filter(
+                        pk=job.pk, status=PlanningJob.RUNNING
+                    ).update(heartbeat_at=timezone.now())
+                except DatabaseError:
+                    logger.warning("Heartbeat failed for planning job %s", job.id)
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(
+        target=beat, name=f"planning-job-heartbeat-{job.id}", daemon=True
+    )
+    thread.start()
+    try:
+        yield
+    finally:
+        done.set()
+        thread.join()
+
+
+def run_pending_jobs(stop_event=None, poll_seconds=None, burst=False):
+    """Work the queue until ``stop_event`` is set (or, with ``burst``, it is empty)."""
+    stop_event = stop_event or threading.Event()
+    poll_seconds = poll_seconds or settings.PLANNING_JOB_POLL_SECONDS
+    while not stop_event.is_set():
+        try:
+            job = claim_next_job()
+            if job is not None:
+                run_job(job)
+                continue
+        except Exception:
+            logger.exception("Planning job worker error")
+        finally:
+            connections.close_all()
+        if burst:
+            return
+        _wakeup.wait(poll_seconds)
+        _wakeup.clear()
+
+
+def start_local_workers():
+    """Start this process's job threads once (again after a fork, like the Geoapify client)."""
+    global _local_workers_pid
+    count = settings.PLANNING_JOB_LOCAL_WORKERS
+    pid = os.getpid()
+    if count <= 0 or _local_workers_pid == pid:
+        return
+    with _local_workers_lock:
+        if _local_workers_pid == pid:
+            return
+        for i in range(count):
+            threading.Thread(
+                target=run_pending_jobs,
+                name=f"planning-job-{i}",
+                daemon=True,
+            ).start()
+        _local_workers_pid = pid
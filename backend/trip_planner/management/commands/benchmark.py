@@ -0,0 +1,124 @@
+# trip_planner/management/commands/benchmark.py
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from trip_planner.benchmarks import SUITES, compare, run_benchmarks
+
+
+def _format_seconds(seconds):
+    if seconds >= 1:
+        return f"{seconds:.2f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.1f} us"
+
+
+def _format_params(params):
+    return " ".join(f"{key}={value}" for key, value in params.items())
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the HOS simulation, route geometry, ELD generation, trip "
+        "serialization, the full create view and sync vs async planning (against a "
+        "local Geoapify stand-in), and save the results as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--suite",
+            action="append",
+            choices=sorted(SUITES),
+            help="Suite to run; repeat for several (default: all).",
+        )
+        parser.add_argument(
+            "--quick",
+            action="store_true",
+            help="Fewer sizes and trip lengths, for a fast sanity check.",
+        )
+        parser.add_argument(
+            "--output",
+            default="benchmark-results.json",
+            help="Where to write the JSON results ('-' for stdout).",
+        )
+        parser.add_argument(
+            "--compare",
+            metavar="BASELINE",
+            help="Earlier results file to compare this run's medians against.",
+        )
+        parser.add_argument(
+            "--max-slowdown",
+            type=float,
+            default=None,
+            help="With --compare, fail if any case's median is more than this many "
+            "times the baseline's (e.g. 1.25).",
+        )
+
+    def handle(self, *args, **options):
+        if options["max_slowdown"] is not None and not options["compare"]:
+            raise CommandError("--max-slowdown needs --compare.")
+        baseline = None
+        if options["compare"]:
+            try:
+                with open(options["compare"]) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read {options['compare']}: {e}")
+
+        # Per-request INFO lines from the create suite would drown out the results
+        planner_logger = logging.getLogger("trip_planner")
+        previous_level = planner_logger.level
+        if options["verbosity"] < 2:
+            planner_logger.setLevel(logging.WARNING)
+        try:
+            report = run_benchmarks(
+                suites=options["suite"],
+                quick=options["quick"],
+                progress=self._report_case,
+            )
+        finally:
+            planner_logger.setLevel(previous_level)
+
+        if options["output"] == "-":
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(
+                f"Wrote {len(report['results'])} results to {options['output']}"
+            )
+
+        if baseline is not None:
+            self._compare(baseline, report, options["max_slowdown"])
+
+    def _report_case(self, result):
+        self.stderr.write(
+            f"{result['name']:<28} {_format_params(result['params']):<60} "
+            f"median {_format_seconds(result['median']):>10}  "
+            f"({result['rounds']} rounds)"
+        )
+
+    def _compare(self, baseline, report, max_slowdown):
+        rows = compare(baseline, report)
+        if not rows:
+            self.stdout.write("No cases in common with the baseline.")
+            return
+        regressions = []
+        self.stdout.write(f"Compared with {baseline['environment'].get('commit')}:")
+        for row in rows:
+            line = (
+                f"{row['name']:<28} {_format_params(row['params']):<60} "
+                f"{_format_seconds(row['baseline']):>10} -> "
+                f"{_format_seconds(row['current']):>10}  x{row['ratio']:.2f}"
+            )
+            if max_slowdown is not None and row["ratio"] > max_slowdown:
+                regressions.append(row)
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+        if regressions:
+            raise CommandError(
+                f"{len(regressions)} case(s) slowed down by more than x{max_slowdown}."
+            )
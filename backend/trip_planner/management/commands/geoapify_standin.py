@@ -0,0 +1,90 @@
+# trip_planner/management/commands/geoapify_standin.py
+from django.core.management.base import BaseCommand, CommandError
+
+from trip_planner.geoapify import DEFAULT_BASE_URL, GEOAPIFY_API_KEY
+from trip_planner.standin import DEFAULT_FIXTURES_PATH, GeoapifyStandIn, make_server
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve a local stand-in for the Geoapify geocode and routing endpoints. "
+        "Set GEOAPIFY_BASE_URL=http://<host>:<port> to point the planner at it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8090)
+        parser.add_argument(
+            "--fixtures",
+            default=str(DEFAULT_FIXTURES_PATH),
+            help="JSON file of recorded responses to replay (and to record into).",
+        )
+        parser.add_argument(
+            "--route-points",
+            type=int,
+            default=500,
+            help="Vertices per leg in synthesized route geometries.",
+        )
+        parser.add_argument(
+            "--latency-ms", type=float, default=0.0, help="Added to every response."
+        )
+        parser.add_argument(
+            "--jitter-ms",
+            type=float,
+            default=0.0,
+            help="Extra uniformly random latency on top of --latency-ms.",
+        )
+        parser.add_argument(
+            "--error-rate",
+            type=float,
+            default=0.0,
+            help="Fraction of requests (0-1) answered with --error-status.",
+        )
+        parser.add_argument("--error-status", type=int, default=503)
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed for latency/error injection."
+        )
+        parser.add_argument(
+            "--record",
+            action="store_true",
+            help="Fetch responses missing from the fixtures from the real API "
+            "(needs GEOAPIFY_API_KEY) and save them.",
+        )
+        parser.add_argument("--upstream-url", default=DEFAULT_BASE_URL)
+        parser.add_argument("--verbose-requests", action="store_true")
+
+    def handle(self, *args, **options):
+        if not 0.0 <= options["error_rate"] <= 1.0:
+            raise CommandError("--error-rate must be between 0 and 1.")
+        if options["record"] and not GEOAPIFY_API_KEY:
+            raise CommandError("--record needs a real GEOAPIFY_API_KEY.")
+
+        standin = GeoapifyStandIn(
+            fixtures_path=options["fixtures"],
+            route_points=options["route_points"],
+            latency_ms=options["latency_ms"],
+            jitter_ms=options["jitter_ms"],
+            error_rate=options["error_rate"],
+            error_status=options["error_status"],
+            seed=options["seed"],
+            record=options["record"],
+            upstream_url=options["upstream_url"],
+            upstream_api_key=GEOAPIFY_API_KEY,
+        )
+        server = make_server(
+            standin,
+            host=options["host"],
+            port=options["port"],
+            quiet=not options["verbose_requests"],
+        )
+        self.stdout.write(
+            f"Geoapify stand-in listening on http://{options['host']}:{server.server_port} "
+            f"({len(standin.fixtures['geocode'])} geocode and "
+            f"{len(standin.fixtures['routing'])} routing fixtures)"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
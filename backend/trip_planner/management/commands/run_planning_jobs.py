@@ -0,0 +1,61 @@
+# trip_planner/management/commands/run_planning_jobs.py
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+from trip_planner.jobs import run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued async trip-planning jobs. Safe to run alongside the web workers' "
+        "own job threads and other copies of this command."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threads", type=int, default=4, help="Jobs to run at once."
+        )
+        parser.add_argument(
+            "--poll-seconds",
+            type=float,
+            default=None,
+            help="How often idle threads check for new jobs "
+            "(default: PLANNING_JOB_POLL_SECONDS).",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Exit once the queue is empty instead of waiting for more jobs.",
+        )
+
+    def handle(self, *args, **options):
+        if options["threads"] < 1:
+            raise CommandError("--threads must be at least 1.")
+
+        stop_event = threading.Event()
+        threads = [
+            threading.Thread(
+                target=run_pending_jobs,
+                kwargs={
+                    "stop_event": stop_event,
+                    "poll_seconds": options["poll_seconds"],
+                    "burst": options["burst"],
+                },
+                name=f"planning-job-{i}",
+                daemon=True,
+            )
+            for i in range(options["threads"])
+        ]
+        self.stdout.write(f"Running planning jobs on {len(threads)} threads")
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            stop_event.set()
+            self.stdout.write("Stopping after the jobs in progress finish")
+            for thread in threads:
+                thread.join()
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.10 on 2026-10-17 06:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trip_planner', '0003_alter_routesegment_segment_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='Normalized location text', max_length=255, unique=True)),
+                ('query', models.CharField(help_text='Location text as first seen', max_length=255)),
+                ('coordinates', models.JSONField(help_text='[longitude, latitude]')),
+                ('place_name', models.CharField(max_length=255)),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('fetched_at', models.DateTimeField(db_index=True, help_text='When Geoapify was last asked')),
+                ('last_used_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
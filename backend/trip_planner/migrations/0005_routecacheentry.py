@@ -0,0 +1,56 @@
+# Generated by Django 4.2.10 on 2026-10-17 06:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trip_planner", "0004_geocodecacheentry"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RouteCacheEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "key",
+                    models.CharField(
+                        help_text="Mode plus grid-snapped waypoints",
+                        max_length=255,
+                        unique=True,
+                    ),
+                ),
+                ("mode", models.CharField(default="drive", max_length=20)),
+                ("distance_miles", models.FloatField()),
+                ("duration_hours", models.FloatField()),
+                ("geometry_type", models.CharField(blank=True, max_length=20)),
+                (
+                    "encoded_geometry",
+                    models.TextField(
+                        blank=True,
+                        help_text="Encoded polyline(s), one line per LineString part",
+                    ),
+                ),
+                ("point_count", models.PositiveIntegerField(default=0)),
+                ("size_bytes", models.PositiveIntegerField(default=0)),
+                ("hit_count", models.PositiveIntegerField(default=0)),
+                (
+                    "fetched_at",
+                    models.DateTimeField(
+                        db_index=True, help_text="When Geoapify was last asked"
+                    ),
+                ),
+                ("last_used_at", models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.10 on 2026-10-17 07:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trip_planner", "0005_routecacheentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="trip",
+            name="stops",
+            field=models.JSONField(
+                blank=True,
+                default=list,
+                help_text="Ordered stops (location, type, dwell_hours); empty means just pickup then dropoff",
+            ),
+        ),
+    ]
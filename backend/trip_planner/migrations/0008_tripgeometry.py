@@ -0,0 +1,47 @@
+# Generated by Django 4.2.10 on 2026-10-17 07:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trip_planner", "0007_planningjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TripGeometry",
+            fields=[
+                (
+                    "trip",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="geometry",
+                        serialize=False,
+                        to="trip_planner.trip",
+                    ),
+                ),
+                (
+                    "encoded_geometry",
+                    models.TextField(help_text="Encoded polyline(s), one line per leg"),
+                ),
+                (
+                    "precision",
+                    models.PositiveSmallIntegerField(
+                        default=5,
+                        help_text="Decimal places kept by the polyline encoding",
+                    ),
+                ),
+                ("point_count", models.PositiveIntegerField(default=0)),
+                (
+                    "bbox",
+                    models.JSONField(
+                        blank=True, help_text="[west, south, east, north]", null=True
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.10 on 2026-10-17 07:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trip_planner", "0008_tripgeometry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tripgeometry",
+            name="levels",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                help_text="Simplified copies by map zoom: {zoom: {tolerance_meters, point_count, encoded_geometry}}",
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.10 on 2026-10-17 07:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trip_planner", "0009_tripgeometry_levels"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="trip",
+            name="created_at",
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
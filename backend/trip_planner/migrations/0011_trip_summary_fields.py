@@ -0,0 +1,137 @@
+# Generated by Django 4.2.10 on 2026-10-17 07:27
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Q, Sum
+
+BACKFILL_BATCH_SIZE = 500
+
+
+def backfill_trip_summaries(apps, schema_editor):
+    """Fill the new totals from each trip's saved segments.
+
+    The totals are aggregated per trip in SQL and written back in batches, so the
+    segments are never loaded. The cycle hours used at arrival depend on restarts the
+    simulation took, which the segments don't record reliably, so that column stays
+    empty for older trips.
+    """
+    Trip = apps.get_model("trip_planner", "Trip")
+    RouteSegment = apps.get_model("trip_planner", "RouteSegment")
+    drive = Q(segment_type="DRIVE")
+    rest = Q(segment_type="REST")
+    totals = (
+        RouteSegment.objects.order_by("trip_id")
+        .values("trip_id")
+        .annotate(
+            distance=Sum("distance_miles", filter=drive),
+            driving=Sum("estimated_duration_hours", filter=drive),
+            resting=Sum("estimated_duration_hours", filter=rest),
+            on_duty=Sum("estimated_duration_hours", filter=~drive & ~rest),
+            rest_stops=Count("pk", filter=rest),
+            fuel_stops=Count("pk", filter=Q(segment_type="FUEL")),
+            started=Min("start_time"),
+            arrived=Max("end_time"),
+        )
+    )
+    fields = [
+        "total_distance_miles",
+        "total_duration_hours",
+        "driving_hours",
+        "rest_hours",
+        "on_duty_hours",
+        "rest_stop_count",
+        "fuel_stop_count",
+        "arrival_time",
+    ]
+    trips = []
+    for row in totals.iterator(chunk_size=BACKFILL_BATCH_SIZE):
+        trips.append(
+            Trip(
+                pk=row["trip_id"],
+                total_distance_miles=row["distance"] or 0.0,
+                total_duration_hours=(row["arrived"] - row["started"]).total_seconds()
+                / 3600,
+                driving_hours=row["driving"] or 0.0,
+                rest_hours=row["resting"] or 0.0,
+                on_duty_hours=row["on_duty"] or 0.0,
+                rest_stop_count=row["rest_stops"],
+                fuel_stop_count=row["fuel_stops"],
+                arrival_time=row["arrived"],
+            )
+        )
+        if len(trips) >= BACKFILL_BATCH_SIZE:
+            Trip.objects.bulk_update(trips, fields)
+            trips = []
+    if trips:
+        Trip.objects.bulk_update(trips, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trip_planner", "0010_trip_created_at_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="trip",
+            name="arrival_time",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="cycle_used_at_arrival",
+            field=models.FloatField(
+                blank=True,
+                help_text="Cycle hours used when the last stop ends",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="driving_hours",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="fuel_stop_count",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="on_duty_hours",
+            field=models.FloatField(
+                blank=True,
+                help_text="On duty, not driving (fuel, pickup, dropoff)",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="rest_hours",
+            field=models.FloatField(
+                blank=True,
+                help_text="Breaks, daily rests and cycle restarts",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="rest_stop_count",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="total_distance_miles",
+            field=models.FloatField(blank=True, help_text="Miles driven", null=True),
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="total_duration_hours",
+            field=models.FloatField(
+                blank=True,
+                help_text="Wall-clock hours from start to arrival",
+                null=True,
+            ),
+        ),
+        migrations.RunPython(backfill_trip_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.10 on 2026-10-17 07:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trip_planner", "0011_trip_summary_fields"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TripResponseCacheEntry",
+            fields=[
+                (
+                    "trip",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="+",
+                        serialize=False,
+                        to="trip_planner.trip",
+                    ),
+                ),
+                (
+                    "etag",
+                    models.CharField(
+                        help_text="Quoted strong ETag of the body", max_length=64
+                    ),
+                ),
+                (
+                    "body",
+                    models.BinaryField(help_text="JSON body of GET /api/trips/<id>/"),
+                ),
+                ("gzip_body", models.BinaryField()),
+                (
+                    "br_body",
+                    models.BinaryField(
+                        blank=True,
+                        help_text="Brotli body, if brotli was installed",
+                        null=True,
+                    ),
+                ),
+                ("size_bytes", models.PositiveIntegerField(default=0)),
+                ("hit_count", models.PositiveIntegerField(default=0)),
+                ("last_used_at", models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
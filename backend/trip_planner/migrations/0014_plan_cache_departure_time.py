@@ -0,0 +1,64 @@
+# Generated by Django 4.2.10 on 2026-10-17 07:45
+
+from django.db import migrations, models
+
+
+def clear_trip_response_cache(apps, schema_editor):
+    # Cached trip bodies predate the departure_time field
+    apps.get_model("trip_planner", "TripResponseCacheEntry").objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trip_planner", "0013_idempotencykey"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PlanCacheEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "key",
+                    models.CharField(
+                        help_text="hos.plan_fingerprint of the inputs",
+                        max_length=64,
+                        unique=True,
+                    ),
+                ),
+                (
+                    "plan",
+                    models.TextField(help_text="JSON: segments, summary and ELD logs"),
+                ),
+                ("segment_count", models.PositiveIntegerField(default=0)),
+                ("size_bytes", models.PositiveIntegerField(default=0)),
+                ("hit_count", models.PositiveIntegerField(default=0)),
+                (
+                    "fetched_at",
+                    models.DateTimeField(
+                        db_index=True, help_text="When it was simulated"
+                    ),
+                ),
+                ("last_used_at", models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="departure_time",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="Requested start; empty means planned from the time of the request",
+                null=True,
+            ),
+        ),
+        migrations.RunPython(clear_trip_response_cache, migrations.RunPython.noop),
+    ]
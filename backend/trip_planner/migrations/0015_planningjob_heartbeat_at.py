@@ -0,0 +1,32 @@
+# Generated by Django 4.2.10 on 2026-10-17 14:20
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_heartbeats(apps, schema_editor):
+    # Jobs already RUNNING count as last seen when they started
+    PlanningJob = apps.get_model("trip_planner", "PlanningJob")
+    PlanningJob.objects.filter(started_at__isnull=False).update(
+        heartbeat_at=F("started_at")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("trip_planner", "0014_plan_cache_departure_time"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="planningjob",
+            name="heartbeat_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="Last time the running worker checked in",
+                null=True,
+            ),
+        ),
+        migrations.RunPython(backfill_heartbeats, migrations.RunPython.noop),
+    ]
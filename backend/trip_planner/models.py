@@ -1,4 +1,6 @@
 # trip_planner/models.py
+import uuid
+
 from django.db import models
 
 
@@ -8,7 +10,38 @@ class Trip(models.Model):
     pickup_location = models.CharField(max_length=255)
     dropoff_location = models.CharField(max_length=255)
     current_cycle_used = models.FloatField(help_text="Current cycle used in hours")
-    created_at = models.DateTimeField(auto_now_add=True)
+    stops = models.JSONField(
+        default=list,
+        blank=True,
+        help_text="Ordered stops (location, type, dwell_hours); empty means just pickup then dropoff",
+    )
+    departure_time = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Requested start; empty means planned from the time of the request",
+    )
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # --- Plan Summary (written with the trip, see hos.summarize_trip) ---
+    total_distance_miles = models.FloatField(
+        null=True, blank=True, help_text="Miles driven"
+    )
+    total_duration_hours = models.FloatField(
+        null=True, blank=True, help_text="Wall-clock hours from start to arrival"
+    )
+    driving_hours = models.FloatField(null=True, blank=True)
+    rest_hours = models.FloatField(
+        null=True, blank=True, help_text="Breaks, daily rests and cycle restarts"
+    )
+    on_duty_hours = models.FloatField(
+        null=True, blank=True, help_text="On duty, not driving (fuel, pickup, dropoff)"
+    )
+    rest_stop_count = models.PositiveIntegerField(null=True, blank=True)
+    fuel_stop_count = models.PositiveIntegerField(null=True, blank=True)
+    arrival_time = models.DateTimeField(null=True, blank=True)
+    cycle_used_at_arrival = models.FloatField(
+        null=True, blank=True, help_text="Cycle hours used when the last stop ends"
+    )
+    # --- End Plan Summary ---
 
     def __str__(self):
         return f"Trip {self.id}: {self.pickup_location} to {self.dropoff_location}"
@@ -51,6 +84,33 @@ class RouteSegment(models.Model):
         return f"Segment {self.id} ({self.segment_type}): {self.start_location} to {self.end_location}"
 
 
+class TripGeometry(models.Model):
+    """A trip's route line, stored once at create as one encoded polyline per leg."""
+
+    trip = models.OneToOneField(
+        Trip, related_name="geometry", on_delete=models.CASCADE, primary_key=True
+    )
+    encoded_geometry = models.TextField(
+        help_text="Encoded polyline(s), one line per leg"
+    )
+    precision = models.PositiveSmallIntegerField(
+        default=5, help_text="Decimal places kept by the polyline encoding"
+    )
+    point_count = models.PositiveIntegerField(default=0)
+    bbox = models.JSONField(
+        null=True, blank=True, help_text="[west, south, east, north]"
+    )
+    levels = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Simplified copies by map zoom: {zoom: {tolerance_meters, "
+        "point_count, encoded_geometry}}",
+    )
+
+    def __str__(self):
+        return f"Geometry for Trip {self.trip_id} ({self.point_count} points)"
+
+
 class ELDLog(models.Model):
     trip = models.ForeignKey(Trip, related_name="eld_logs", on_delete=models.CASCADE)
     date = models.DateField()
@@ -62,4 +122,151 @@ class ELDLog(models.Model):
         ordering = ["date"]  # Good practice
 
     def __str__(self):
-        return f"ELD Log for Trip {self.trip.id} on {self.date}"
+        return f"ELD Log for Trip {self.trip_id} on {self.date}"
+
+
+class GeocodeCacheEntry(models.Model):
+    """Shared (cross-worker) tier of the geocode cache, see trip_planner/cache.py."""
+
+    key = models.CharField(
+        max_length=255, unique=True, help_text="Normalized location text"
+    )
+    query = models.CharField(max_length=255, help_text="Location text as first seen")
+    coordinates = models.JSONField(help_text="[longitude, latitude]")
+    place_name = models.CharField(max_length=255)
+    hit_count = models.PositiveIntegerField(default=0)
+    fetched_at = models.DateTimeField(
+        db_index=True, help_text="When Geoapify was last asked"
+    )
+    last_used_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Geocode cache '{self.key}' -> {self.coordinates}"
+
+
+class RouteCacheEntry(models.Model):
+    """Shared (cross-worker) tier of the route cache, see trip_planner/cache.py."""
+
+    key = models.CharField(
+        max_length=255, unique=True, help_text="Mode plus grid-snapped waypoints"
+    )
+    mode = models.CharField(max_length=20, default="drive")
+    distance_miles = models.FloatField()
+    duration_hours = models.FloatField()
+    geometry_type = models.CharField(max_length=20, blank=True)
+    encoded_geometry = models.TextField(
+        blank=True, help_text="Encoded polyline(s), one line per LineString part"
+    )
+    point_count = models.PositiveIntegerField(default=0)
+    size_bytes = models.PositiveIntegerField(default=0)
+    hit_count = models.PositiveIntegerField(default=0)
+    fetched_at = models.DateTimeField(
+        db_index=True, help_text="When Geoapify was last asked"
+    )
+    last_used_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Route cache '{self.key}' ({self.distance_miles:.1f} miles)"
+
+
+class PlanCacheEntry(models.Model):
+    """Shared (cross-worker) tier of the plan cache, see trip_planner/cache.py."""
+
+    key = models.CharField(
+        max_length=64, unique=True, help_text="hos.plan_fingerprint of the inputs"
+    )
+    plan = models.TextField(help_text="JSON: segments, summary and ELD logs")
+    segment_count = models.PositiveIntegerField(default=0)
+    size_bytes = models.PositiveIntegerField(default=0)
+    hit_count = models.PositiveIntegerField(default=0)
+    fetched_at = models.DateTimeField(db_index=True, help_text="When it was simulated")
+    last_used_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Plan cache '{self.key[:12]}' ({self.segment_count} segments)"
+
+
+class TripResponseCacheEntry(models.Model):
+    """Shared (cross-worker) tier of the trip response cache, see trip_planner/cache.py."""
+
+    trip = models.OneToOneField(
+        Trip, related_name="+", on_delete=models.CASCADE, primary_key=True
+    )
+    etag = models.CharField(max_length=64, help_text="Quoted strong ETag of the body")
+    body = models.BinaryField(help_text="JSON body of GET /api/trips/<id>/")
+    gzip_body = models.BinaryField()
+    br_body = models.BinaryField(
+        null=True, blank=True, help_text="Brotli body, if brotli was installed"
+    )
+    size_bytes = models.PositiveIntegerField(default=0)
+    hit_count = models.PositiveIntegerField(default=0)
+    last_used_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Response cache for Trip {self.trip_id} ({self.size_bytes} bytes)"
+
+
+class PlanningJob(models.Model):
+    """A queued trip-create request, run by the workers in trip_planner/jobs.py."""
+
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    SUCCEEDED = "SUCCEEDED"
+    FAILED = "FAILED"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(
+        max_length=20,
+        choices=[
+            (PENDING, "Pending"),
+            (RUNNING, "Running"),
+            (SUCCEEDED, "Succeeded"),
+            (FAILED, "Failed"),
+        ],
+        default=PENDING,
+    )
+    payload = models.JSONField(help_text="Validated TripCreateSerializer data")
+    trip = models.ForeignKey(
+        Trip,
+        related_name="planning_jobs",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+    error = models.TextField(blank=True, default="")
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(
+        null=True, blank=True, help_text="Last time the running worker checked in"
+    )
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["created_at"]
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+    def __str__(self):
+        return f"Planning job {self.id} ({self.status})"
+
+
+class IdempotencyKey(models.Model):
+    """A client's Idempotency-Key on a trip create, and the trip or job it produced.
+
+    A row with neither is a request still being planned; see trip_planner/idempotency.py.
+    """
+
+    key = models.CharField(max_length=255, unique=True)
+    request_hash = models.CharField(
+        max_length=64, help_text="services.plan_request_key of the first request"
+    )
+    trip = models.ForeignKey(
+        Trip, related_name="+", null=True, blank=True, on_delete=models.CASCADE
+    )
+    job = models.ForeignKey(
+        PlanningJob, related_name="+", null=True, blank=True, on_delete=models.CASCADE
+    )
+    created_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Idempotency key '{self.key}'"
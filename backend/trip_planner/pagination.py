@@ -0,0 +1,15 @@
+# trip_planner/pagination.py
+from rest_framework.pagination import CursorPagination
+
+
+class TripCursorPagination(CursorPagination):
+    """Newest trips first; each page is one indexed range scan, however deep it is.
+
+    Unlike page numbers, a cursor needs no COUNT(*) and no OFFSET, so fetching a page
+    costs the same on page 1 and page 2,000 of a 100k-trip table.
+    """
+
+    ordering = "-created_at"
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
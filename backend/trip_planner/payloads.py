@@ -0,0 +1,110 @@
+# trip_planner/payloads.py
+"""Trip response bodies built straight from ``values()`` rows.
+
+The read endpoints return the same JSON as TripSerializer and TripSummarySerializer,
+but skip DRF's per-field machinery: one query per table, plain dicts, and datetimes
+left for the renderer (trip_planner/renderers.py) to format. The field lists are the
+serializers' own, so the two can't drift apart.
+
+Right after a create, trip_payload_from builds the same body from the objects that
+were just saved, so the 201 response doesn't read them back.
+"""
+
+import datetime
+
+from django.db import models
+
+from .models import ELDLog, RouteSegment, Trip
+from .serializers import (
+    ELDLogSerializer,
+    RouteSegmentSerializer,
+    TripSerializer,
+    TripSummarySerializer,
+)
+
+_NESTED_FIELDS = ("segments", "eld_logs")
+TRIP_FIELDS = [f for f in TripSerializer.Meta.fields if f not in _NESTED_FIELDS]
+SEGMENT_FIELDS = list(RouteSegmentSerializer.Meta.fields)
+ELD_LOG_FIELDS = list(ELDLogSerializer.Meta.fields)
+SUMMARY_FIELDS = list(TripSummarySerializer.Meta.fields)
+
+
+def _float_fields(model):
+    return {f.name for f in model._meta.fields if isinstance(f, models.FloatField)}
+
+
+_FLOAT_FIELDS = {model: _float_fields(model) for model in (Trip, RouteSegment, ELDLog)}
+
+
+def trip_summaries(queryset):
+    """``queryset`` as summary dicts (a lazy ``values()`` queryset, ready to paginate)."""
+    return queryset.values(*SUMMARY_FIELDS)
+
+
+def trip_payloads(ids):
+    """``{id: trip dict}`` with segments and logs, for whichever of ``ids`` exist."""
+    trips = {
+        row["id"]: row for row in Trip.objects.filter(pk__in=ids).values(*TRIP_FIELDS)
+    }
+    if not trips:
+        return trips
+    for trip in trips.values():
+        trip["segments"] = []
+        trip["eld_logs"] = []
+    # Model Meta orderings (start_time, date) are kept, as with the prefetch
+    for segment in RouteSegment.objects.filter(trip_id__in=trips).values(
+        "trip_id", *SEGMENT_FIELDS
+    ):
+        trips[segment.pop("trip_id")]["segments"].append(segment)
+    for log in ELDLog.objects.filter(trip_id__in=trips).values(
+        "trip_id", *ELD_LOG_FIELDS
+    ):
+        trips[log.pop("trip_id")]["eld_logs"].append(log)
+    return trips
+
+
+def trip_payload(pk):
+    """One trip's response body, or None if it doesn't exist."""
+    return trip_payloads([pk]).get(pk)
+
+
+def _row(obj, fields):
+    """``obj`` as the dict ``values(*fields)`` would read back for it."""
+    floats = _FLOAT_FIELDS[type(obj)]
+    row = {}
+    for name in fields:
+        value = getattr(obj, name)
+        if value is not None:
+            if name in floats:
+                value = float(value)
+            elif isinstance(value, datetime.datetime):
+                # The database hands datetimes back in UTC, whatever zone was saved
+                value = value.astimezone(datetime.timezone.utc)
+        row[name] = value
+    return row
+
+
+def trip_payload_from(trip):
+    """The response body of a trip just saved by services.save_trip, without queries.
+
+    Uses the ``saved_segments`` and ``saved_eld_logs`` that save_trip leaves on the
+    trip; falls back to reading the trip back if they're missing or unsaved.
+    """
+    segments = getattr(trip, "saved_segments", None)
+    logs = getattr(trip, "saved_eld_logs", None)
+    if (
+        segments is None
+        or logs is None
+        or any(obj.pk is None for obj in (*segments, *logs))
+    ):
+        return trip_payload(trip.pk)
+    payload = _row(trip, TRIP_FIELDS)
+    # Same order as the model Meta orderings; sorted() is stable for ties, like pk order
+    payload["segments"] = [
+        _row(segment, SEGMENT_FIELDS)
+        for segment in sorted(segments, key=lambda segment: segment.start_time)
+    ]
+    payload["eld_logs"] = [
+        _row(log, ELD_LOG_FIELDS) for log in sorted(logs, key=lambda log: log.date)
+    ]
+    return payload
@@ -0,0 +1,65 @@
+# trip_planner/polyline.py
+"""Encoded polyline format (the one used by Google/OSRM/Mapbox) for compact geometry storage.
+
+Coordinates go in and come out in GeoJSON order, ``[longitude, latitude]``; the encoded
+string itself uses the standard latitude-first order so any polyline decoder can read it.
+"""
+
+DEFAULT_PRECISION = 5
+
+
+def _encode_value(value, out):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        out.append(chr((0x20 | (value & 0x1F)) + 63))
+        value >>= 5
+    out.append(chr(value + 63))
+
+
+def encode(coordinates, precision=DEFAULT_PRECISION):
+    """Encode a list of [lon, lat] pairs into a polyline string."""
+    factor = 10**precision
+    out = []
+    prev_lat = prev_lon = 0
+    for lon, lat in coordinates:
+        lat_i = int(round(lat * factor))
+        lon_i = int(round(lon * factor))
+        _encode_value(lat_i - prev_lat, out)
+        _encode_value(lon_i - prev_lon, out)
+        prev_lat, prev_lon = lat_i, lon_i
+    return "".join(out)
+
+
+def quantize(coordinates, precision=DEFAULT_PRECISION):
+    """Round [lon, lat] pairs to exactly what ``decode(encode(coordinates))`` returns."""
+    factor = 10**precision
+    return [
+        [round(lon * factor) / factor, round(lat * factor) / factor]
+        for lon, lat in coordinates
+    ]
+
+
+def decode(encoded, precision=DEFAULT_PRECISION):
+    """Decode a polyline string into a list of [lon, lat] pairs."""
+    factor = float(10**precision)
+    coordinates = []
+    index = 0
+    length = len(encoded)
+    lat = lon = 0
+    while index < length:
+        deltas = []
+        for _ in range(2):
+            shift = 0
+            result = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1F) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        coordinates.append([lon / factor, lat / factor])
+    return coordinates
@@ -0,0 +1,42 @@
+# trip_planner/renderers.py
+"""JSON rendering with orjson when it is installed, else DRF's stdlib-based encoder.
+
+orjson writes datetimes, dates and numpy values itself, so the ``values()`` payloads
+from trip_planner/payloads.py are rendered without a per-object Python callback. Aware
+UTC datetimes come out as ``...Z``, like DRF's DateTimeField.
+"""
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+# Compact and unescaped, like DRF's JSONRenderer defaults
+_fallback_encoder = encoders.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def dumps(data):
+    """``data`` as UTF-8 JSON bytes."""
+    if orjson is None:
+        return _fallback_encoder.encode(data).encode()
+    # Anything orjson doesn't know (Decimal, lazy strings, ...) goes through DRF's encoder
+    return orjson.dumps(data, default=_fallback_encoder.default, option=_OPTIONS)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """DRF's JSONRenderer, encoding with orjson unless indentation was asked for."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if orjson is None or self.get_indent(
+            accepted_media_type, renderer_context or {}
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
@@ -1,6 +1,12 @@
 # trip_planner/serializers.py
 from rest_framework import serializers
-from .models import Trip, RouteSegment, ELDLog
+from rest_framework.reverse import reverse
+from . import polyline
+from .models import Trip, RouteSegment, ELDLog, PlanningJob, TripGeometry
+
+MAX_TRIP_STOPS = 25
+# Most trips one ``GET /api/trips/?ids=`` can fetch.
+MAX_TRIP_IDS = 100
 
 
 class RouteSegmentSerializer(serializers.ModelSerializer):
@@ -28,6 +34,19 @@ class ELDLogSerializer(serializers.ModelSerializer):
         fields = ["id", "date", "log_data"]
 
 
+TRIP_SUMMARY_FIELDS = [
+    "total_distance_miles",
+    "total_duration_hours",
+    "driving_hours",
+    "rest_hours",
+    "on_duty_hours",
+    "rest_stop_count",
+    "fuel_stop_count",
+    "arrival_time",
+    "cycle_used_at_arrival",
+]
+
+
 class TripSerializer(serializers.ModelSerializer):
     # Use the updated RouteSegmentSerializer
     segments = RouteSegmentSerializer(many=True, read_only=True)
@@ -41,13 +60,43 @@ class TripSerializer(serializers.ModelSerializer):
             "pickup_location",
             "dropoff_location",
             "current_cycle_used",
+            "stops",
+            "departure_time",
+            *TRIP_SUMMARY_FIELDS,
             "created_at",
             "segments",  # Will now include coordinate fields
             "eld_logs",
         ]
 
 
+class TripSummarySerializer(serializers.ModelSerializer):
+    """A trip without its segments and logs, for lists."""
+
+    class Meta:
+        model = Trip
+        fields = [
+            "id",
+            "current_location",
+            "pickup_location",
+            "dropoff_location",
+            "current_cycle_used",
+            *TRIP_SUMMARY_FIELDS,
+            "created_at",
+        ]
+
+
+class StopSerializer(serializers.Serializer):
+    location = serializers.CharField(max_length=255)
+    # Defaults to PICKUP, except the last stop which defaults to DROPOFF
+    type = serializers.ChoiceField(choices=["PICKUP", "DROPOFF"], required=False)
+    dwell_hours = serializers.FloatField(
+        min_value=0, max_value=24, required=False, default=1.0
+    )
+
+
 class TripCreateSerializer(serializers.ModelSerializer):
+    stops = StopSerializer(many=True, required=False, max_length=MAX_TRIP_STOPS)
+
     class Meta:
         model = Trip
         fields = [
@@ -55,4 +104,103 @@ class TripCreateSerializer(serializers.ModelSerializer):
             "pickup_location",
             "dropoff_location",
             "current_cycle_used",
+            "stops",
+            "departure_time",
         ]
+        extra_kwargs = {
+            "pickup_location": {"required": False},
+            "dropoff_location": {"required": False},
+        }
+
+    def validate(self, attrs):
+        stops = [dict(stop) for stop in attrs.get("stops") or []]
+        if stops:
+            # An ordered stop list takes the place of pickup/dropoff
+            for i, stop in enumerate(stops):
+                stop.setdefault("type", "DROPOFF" if i == len(stops) - 1 else "PICKUP")
+            attrs["stops"] = stops
+            attrs["pickup_location"] = stops[0]["location"]
+            attrs["dropoff_location"] = stops[-1]["location"]
+            return attrs
+
+        missing = {
+            field: ["This field is required."]
+            for field in ("pickup_location", "dropoff_location")
+            if not attrs.get(field)
+        }
+        if missing:
+            raise serializers.ValidationError(missing)
+        attrs["stops"] = []
+        return attrs
+
+
+class TripGeometrySerializer(serializers.ModelSerializer):
+    """A trip's route line as encoded polylines (one per leg) or as GeoJSON.
+
+    The format comes from ``encoding`` in the context: "polyline" (the default) or
+    "geojson". With a ``zoom`` in the context, the coarsest stored level of detail that
+    still looks exact at that zoom is used instead of the full line.
+    """
+
+    ENCODINGS = ("polyline", "geojson")
+
+    class Meta:
+        model = TripGeometry
+        fields = ["trip", "point_count", "bbox"]
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        encoded, level_zoom = instance.encoded_geometry, None
+        zoom = self.context.get("zoom")
+        if zoom is not None:
+            level_zoom = min(
+                (int(z) for z in instance.levels if int(z) >= zoom), default=None
+            )
+        if level_zoom is not None:
+            level = instance.levels[str(level_zoom)]
+            encoded = level["encoded_geometry"]
+            data["point_count"] = level["point_count"]
+            data["tolerance_meters"] = level["tolerance_meters"]
+        else:
+            data["tolerance_meters"] = None  # The full stored line
+        data["zoom"] = level_zoom
+
+        legs = encoded.split("\n")
+        encoding = self.context.get("encoding", "polyline")
+        data["encoding"] = encoding
+        if encoding == "geojson":
+            data["geometry"] = {
+                "type": "MultiLineString",
+                "coordinates": [
+                    polyline.decode(leg, instance.precision) for leg in legs
+                ],
+            }
+        else:
+            data["precision"] = instance.precision
+            data["legs"] = legs
+        return data
+
+
+class PlanningJobSerializer(serializers.ModelSerializer):
+    trip_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = PlanningJob
+        fields = [
+            "id",
+            "status",
+            "trip",
+            "trip_url",
+            "error",
+            "attempts",
+            "created_at",
+            "started_at",
+            "finished_at",
+        ]
+
+    def get_trip_url(self, obj):
+        if obj.trip_id is None:
+            return None
+        url = reverse("trip-detail", args=[obj.trip_id])
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
@@ -0,0 +1,426 @@
+# trip_planner/services.py
+"""Trip creation pipeline shared by the single and batch create endpoints."""
+
+import concurrent.futures
+import datetime
+import hashlib
+import json
+import logging
+
+import numpy as np
+import pytz
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db import transaction
+
+from .async_planner import plan_route_async
+from .cache import normalize_location_key, route_cache_key
+from . import polyline
+from .geometry import simplify, zoom_tolerance_meters
+from .models import Trip, RouteSegment, ELDLog, TripGeometry
+from .route_planner import (
+    _in_worker_thread,
+    generate_eld_logs,
+    geocode_location,
+    get_route_data,
+    plan_route,
+    simulate_route,
+    trip_stops,
+)
+from .singleflight import AsyncSingleFlight, SingleFlight
+from .telemetry import DEDUPLICATED_CREATES, span, submit_in_context
+
+logger = logging.getLogger(__name__)
+
+# Map zooms that get a pre-simplified copy of each trip's route line.
+GEOMETRY_LOD_ZOOMS = (4, 6, 8, 10, 12)
+
+# Identical creates that arrive while one is being planned share its trip.
+create_flight = SingleFlight()
+create_flight_async = AsyncSingleFlight()
+
+
+def build_route_segments(trip, route_data):
+    """Unsaved RouteSegment rows for a planned route, skipping malformed segments."""
+    segments_to_create = []
+    if not route_data.get("segments"):
+        logger.warning("No segments were generated by plan_route to save.")
+        return segments_to_create
+
+    logger.debug("Preparing %d segments for database save", len(route_data["segments"]))
+    for i, segment_data in enumerate(route_data["segments"]):
+        start_coords = segment_data.get("start_coordinates")
+        end_coords = segment_data.get("end_coordinates")
+        segment_type = segment_data.get("type", "UNKNOWN")
+
+        logger.debug(
+            "Processing Segment %d (Type: %s) Raw Coords - Start: %s, End: %s",
+            i,
+            segment_type,
+            start_coords,
+            end_coords,
+        )
+
+        # Basic validation for coordinates before saving
+        if not (isinstance(start_coords, list) and len(start_coords) == 2):
+            logger.warning(
+                "Segment %d - Invalid start_coords format, saving as None.", i
+            )
+            start_coords = None
+        if not (isinstance(end_coords, list) and len(end_coords) == 2):
+            logger.warning("Segment %d - Invalid end_coords format, saving as None.", i)
+            end_coords = None
+
+        # Check if datetime objects are present (should be from route_planner)
+        start_time = segment_data.get("start_time")
+        end_time = segment_data.get("end_time")
+        if not isinstance(start_time, datetime.datetime) or not isinstance(
+            end_time, datetime.datetime
+        ):
+            logger.error(
+                "Segment %d has invalid datetime objects! Start: %s, End: %s",
+                i,
+                type(start_time),
+                type(end_time),
+            )
+            continue  # Skip this segment
+
+        segments_to_create.append(
+            RouteSegment(
+                trip=trip,
+                start_location=segment_data.get("start_location", "Unknown"),
+                end_location=segment_data.get("end_location", "Unknown"),
+                start_coordinates=start_coords,  # Use validated/None coords
+                end_coordinates=end_coords,  # Use validated/None coords
+                distance_miles=segment_data.get("distance_miles", 0.0),
+                estimated_duration_hours=segment_data.get("duration_hours", 0.0),
+                segment_type=segment_type,
+                start_time=start_time,  # Pass datetime object
+                end_time=end_time,  # Pass datetime object
+            )
+        )
+    return segments_to_create
+
+
+def build_eld_logs(trip, route_data):
+    """Unsaved ELDLog rows, one per day covered by a planned route."""
+    logs_to_create = []
+    for log_date_str, log_data_dict in generate_eld_logs(trip, route_data).items():
+        try:
+            log_date = datetime.datetime.strptime(log_date_str, "%Y-%m-%d").date()
+            logs_to_create.append(
+                ELDLog(trip=trip, date=log_date, log_data=log_data_dict)
+            )
+        except ValueError:
+            logger.error("Could not parse date for ELD log: %s", log_date_str)
+    return logs_to_create
+
+
+def _encode_legs(legs):
+    return "\n".join(
+        polyline.encode(coords.tolist(), polyline.DEFAULT_PRECISION) for coords in legs
+    )
+
+
+def build_trip_geometry(trip, route_data):
+    """Unsaved TripGeometry for a planned route, or None if no leg has a route line.
+
+    Besides the full line, a simplified copy is kept for each of GEOMETRY_LOD_ZOOMS,
+    at half a pixel's tolerance for that zoom.
+    """
+    legs = [
+        coords
+        for coords in route_data.get("leg_coordinates") or []
+        if coords is not None
+    ]
+    if not legs:
+        return None
+    points = np.concatenate(legs)
+    west, south = points.min(axis=0).tolist()
+    east, north = points.max(axis=0).tolist()
+
+    levels = {}
+    for zoom in GEOMETRY_LOD_ZOOMS:
+        tolerance = zoom_tolerance_meters(zoom)
+        simplified = [simplify(coords, tolerance) for coords in legs]
+        levels[str(zoom)] = {
+            "tolerance_meters": round(tolerance, 2),
+            "point_count": sum(len(coords) for coords in simplified),
+            "encoded_geometry": _encode_legs(simplified),
+        }
+    return TripGeometry(
+        trip=trip,
+        encoded_geometry=_encode_legs(legs),
+        precision=polyline.DEFAULT_PRECISION,
+        point_count=len(points),
+        bbox=[west, south, east, north],
+        levels=levels,
+    )
+
+
+def create_trip(validated_data):
+    """Plan a trip from TripCreateSerializer data and save it with its segments and logs.
+
+    Raises whatever planning raised (usually ValueError); nothing is saved then.
+    """
+    logger.debug("Starting route planning...")
+    route_data = plan_route(
+        validated_data["current_location"],
+        validated_data["pickup_location"],
+        validated_data["dropoff_location"],
+        validated_data["current_cycle_used"],
+        stops=validated_data.get("stops") or None,
+        departure_time=validated_data.get("departure_time"),
+    )
+    logger.debug("Route planning function finished.")
+    return save_trip(validated_data, route_data)
+
+
+async def create_trip_async(validated_data):
+    """``create_trip`` for async views: planning awaits Geoapify, saving runs in a thread."""
+    route_data = await plan_route_async(
+        validated_data["current_location"],
+        validated_data["pickup_location"],
+        validated_data["dropoff_location"],
+        validated_data["current_cycle_used"],
+        stops=validated_data.get("stops") or None,
+        departure_time=validated_data.get("departure_time"),
+    )
+    return await sync_to_async(save_trip)(validated_data, route_data)
+
+
+def plan_request_key(validated_data):
+    """Fingerprint of a create request: normalized locations and stops, cycle hours and
+    departure time. Requests that would plan the same trip share it."""
+    stops = trip_stops(
+        validated_data["pickup_location"],
+        validated_data["dropoff_location"],
+        validated_data.get("stops"),
+    )
+    departure = validated_data.get("departure_time")
+    normalized = {
+        "current": normalize_location_key(validated_data["current_location"]),
+        "pickup": normalize_location_key(validated_data["pickup_location"]),
+        "dropoff": normalize_location_key(validated_data["dropoff_location"]),
+        "stops": [
+            [
+                normalize_location_key(stop["location"]),
+                stop["type"],
+                stop["dwell_hours"],
+            ]
+            for stop in stops
+        ],
+        "cycle_used": validated_data["current_cycle_used"],
+        "departure": departure.isoformat() if departure else None,
+    }
+    return hashlib.sha256(
+        json.dumps(normalized, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def create_trip_coalesced(validated_data):
+    """``create_trip``, except that a request identical to one already being planned in
+    this process waits for that one and returns the same trip."""
+    trip, shared = create_flight.do(
+        plan_request_key(validated_data), create_trip, validated_data
+    )
+    if shared:
+        DEDUPLICATED_CREATES.labels("in_flight").inc()
+        logger.info(
+            "Create request joined an identical one in flight (Trip %s)", trip.id
+        )
+    return trip
+
+
+async def create_trip_async_coalesced(validated_data):
+    """``create_trip_async`` with the same in-flight coalescing as ``create_trip_coalesced``."""
+    trip, shared = await create_flight_async.do(
+        plan_request_key(validated_data), create_trip_async, validated_data
+    )
+    if shared:
+        DEDUPLICATED_CREATES.labels("in_flight").inc()
+        logger.info(
+            "Create request joined an identical one in flight (Trip %s)", trip.id
+        )
+    return trip
+
+
+def save_trip(validated_data, route_data):
+    """Save a planned trip with its segments, ELD logs and route geometry.
+
+    Everything is written in one transaction, one INSERT per table. The saved segments
+    and logs are left on the trip as ``saved_segments`` and ``saved_eld_logs`` so the
+    response can be built without reading them back (see payloads.trip_payload_from).
+    """
+    # ELD logs are generated before the persist span so the two phases stay separate
+    logs_to_create = build_eld_logs(None, route_data)
+    geometry = build_trip_geometry(None, route_data)
+    with span("persist"), transaction.atomic():
+        trip = Trip.objects.create(**validated_data, **route_data.get("summary", {}))
+        logger.debug("Trip object saved with ID: %s", trip.id)
+        segments_to_create = build_route_segments(trip, route_data)
+        if segments_to_create:
+            RouteSegment.objects.bulk_create(segments_to_create)
+            logger.debug("Bulk created %d route segments.", len(segments_to_create))
+
+        for log in logs_to_create:
+            log.trip = trip
+        if logs_to_create:
+            ELDLog.objects.bulk_create(logs_to_create)
+            logger.debug("Bulk created %d ELD logs.", len(logs_to_create))
+        else:
+            logger.debug("No ELD logs generated.")
+
+        if geometry is not None:
+            geometry.trip = trip
+            TripGeometry.objects.bulk_create([geometry])
+    trip.saved_segments = segments_to_create
+    trip.saved_eld_logs = logs_to_create
+    return trip
+
+
+def _resolve_concurrently(calls, max_workers):
+    """Run ``{key: (func, *args)}`` on a bounded pool; returns ``{key: result or error}``."""
+    outcomes = {}
+    if not calls:
+        return outcomes
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="planner-batch"
+    ) as pool:
+        futures = {
+            submit_in_context(pool, _in_worker_thread, *call): key
+            for key, call in calls.items()
+        }
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                outcomes[futures[future]] = future.result()
+            except Exception as e:
+                outcomes[futures[future]] = e
+    return outcomes
+
+
+def create_trips_batch(validated_items):
+    """Plan and save many trips, fetching each distinct geocode and lane only once.
+
+    ``validated_items`` is a list of TripCreateSerializer data. Geocodes are
+    deduplicated by normalized text and lanes by grid-snapped endpoints across the
+    whole batch, and each unique one goes through the caches (and Geoapify, on a miss)
+    once, on a bounded pool. Every trip is then simulated on its own, and all trips,
+    segments, logs and geometries are saved in four bulk inserts. Returns one
+    ``(trip, None)`` or ``(None, error_message)`` per item, in order.
+    """
+    max_workers = settings.TRIP_BATCH_UPSTREAM_WORKERS
+    current_time = datetime.datetime.now(pytz.utc)
+
+    # 1. Geocode every distinct location string once
+    item_stops = [
+        trip_stops(data["pickup_location"], data["dropoff_location"], data.get("stops"))
+        for data in validated_items
+    ]
+    item_location_keys = []
+    geocode_calls = {}
+    for data, stops in zip(validated_items, item_stops):
+        keys = []
+        for location_str in [data["current_location"]] + [
+            stop["location"] for stop in stops
+        ]:
+            key = normalize_location_key(location_str) or location_str
+            geocode_calls.setdefault(key, (geocode_location, location_str))
+            keys.append(key)
+        item_location_keys.append(keys)
+    geocodes = _resolve_concurrently(geocode_calls, max_workers)
+    logger.info(
+        "Batch of %d trips needed %d distinct geocodes.",
+        len(validated_items),
+        len(geocode_calls),
+    )
+
+    # 2. Route every distinct lane once
+    errors = [None] * len(validated_items)
+    item_locations = [None] * len(validated_items)
+    item_lane_keys = [None] * len(validated_items)
+    route_calls = {}
+    for i, keys in enumerate(item_location_keys):
+        failed = next(
+            (geocodes[key] for key in keys if isinstance(geocodes[key], Exception)),
+            None,
+        )
+        if failed is not None:
+            errors[i] = str(failed)
+            continue
+        locations = [geocodes[key] for key in keys]
+        lane_keys = []
+        for origin, destination in zip(locations, locations[1:]):
+            waypoints = [origin.get("coordinates"), destination.get("coordinates")]
+            lane_key = route_cache_key(waypoints) or repr(waypoints)
+            route_calls.setdefault(lane_key, (get_route_data, origin, destination))
+            lane_keys.append(lane_key)
+        item_locations[i] = locations
+        item_lane_keys[i] = lane_keys
+    routes = _resolve_concurrently(route_calls, max_workers)
+    logger.info(
+        "Batch of %d trips needed %d distinct lanes.",
+        len(validated_items),
+        len(route_calls),
+    )
+
+    # 3. Simulate each trip
+    trips, plans = [], []
+    for i, data in enumerate(validated_items):
+        if errors[i] is not None:
+            continue
+        lane_routes = [routes[key] for key in item_lane_keys[i]]
+        failed = next((r for r in lane_routes if isinstance(r, Exception)), None)
+        if failed is not None:
+            errors[i] = str(failed)
+            continue
+        try:
+            route_data = simulate_route(
+                item_locations[i],
+                lane_routes,
+                item_stops[i],
+                data["current_cycle_used"],
+                data.get("departure_time") or current_time,
+                use_plan_cache=data.get("departure_time") is not None,
+            )
+        except ValueError as e:
+            logger.exception("Batch item %d failed to plan", i)
+            errors[i] = str(e)
+            continue
+        trips.append((i, Trip(**data, **route_data.get("summary", {}))))
+        plans.append(route_data)
+
+    # 4. Save everything in four bulk inserts
+    results = [(None, f"Trip planning failed: {error}") for error in errors]
+    if trips:
+        logs_by_trip = [build_eld_logs(None, route_data) for route_data in plans]
+        geometries = [build_trip_geometry(None, route_data) for route_data in plans]
+        with span("persist"), transaction.atomic():
+            Trip.objects.bulk_create([trip for _, trip in trips])
+            segments_to_create, logs_to_create, geometries_to_create = [], [], []
+            for (_, trip), route_data, logs, geometry in zip(
+                trips, plans, logs_by_trip, geometries
+            ):
+                segments = build_route_segments(trip, route_data)
+                for log in logs:
+                    log.trip = trip
+                segments_to_create.extend(segments)
+                logs_to_create.extend(logs)
+                trip.saved_segments = segments
+                trip.saved_eld_logs = logs
+                if geometry is not None:
+                    geometry.trip = trip
+                    geometries_to_create.append(geometry)
+            RouteSegment.objects.bulk_create(segments_to_create)
+            ELDLog.objects.bulk_create(logs_to_create)
+            TripGeometry.objects.bulk_create(geometries_to_create)
+        logger.info(
+            "Batch saved %d trips, %d segments and %d ELD logs.",
+            len(trips),
+            len(segments_to_create),
+            len(logs_to_create),
+        )
+        for i, trip in trips:
+            results[i] = (trip, None)
+    return results
@@ -0,0 +1,135 @@
+# trip_planner/singleflight.py
+"""Coalesce identical concurrent calls so only one of them does the work.
+
+The first caller for a key (the leader) runs the function; callers arriving with the
+same key while it runs (followers) wait and get the leader's result, or its exception.
+If an async leader is cancelled (its client went away), its followers don't inherit
+the cancellation: one of them runs the call again as the new leader. Nothing is
+cached: once the leader finishes, the next call with that key runs again. Flights are
+per process, and the sync and async groups don't share keys.
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "followers")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """Thread-based single-flight group."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key, func, *args):
+        """``func(*args)``, shared with any concurrent call for ``key``.
+
+        Returns ``(result, shared)``, where ``shared`` is True for followers.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+            else:
+                call.followers += 1
+                self.followers += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func(*args)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "followers": self.followers,
+        }
+
+
+class AsyncSingleFlight:
+    """Single-flight group for coroutines.
+
+    Calls are tracked with thread-safe futures, so followers are coalesced even when
+    requests run on different event loops (as async views do behind sync middleware).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key, func, *args):
+        """``await func(*args)``, shared with any concurrent call for ``key``.
+
+        Returns ``(result, shared)``, where ``shared`` is True for followers.
+        """
+        while True:
+            with self._lock:
+                future = self._calls.get(key)
+                if future is None:
+                    future = self._calls[key] = concurrent.futures.Future()
+                    self.leaders += 1
+                    break
+                self.followers += 1
+
+            try:
+                # shield: a cancelled follower must not cancel the leader's work
+                return await asyncio.shield(asyncio.wrap_future(future)), True
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling() or not future.cancelled():
+                    raise
+                # The leader was cancelled, not this caller: take over the call
+
+        try:
+            result = await func(*args)
+        except BaseException as e:
+            # Forgotten before followers wake, so a retrying follower starts a new call
+            self._forget(key)
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+            raise
+        self._forget(key)
+        future.set_result(result)
+        return result, False
+
+    def _forget(self, key):
+        with self._lock:
+            del self._calls[key]
+
+    def stats(self):
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "followers": self.followers,
+        }
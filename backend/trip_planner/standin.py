@@ -0,0 +1,281 @@
+# trip_planner/standin.py
+"""Local stand-in for the two Geoapify endpoints the planner uses.
+
+Serves ``/v1/geocode/search`` and ``/v1/routing`` so perf tests, load tests and CI can run
+without network access or API quota. Responses come from a fixture file of recorded
+responses when one matches; otherwise they are synthesized deterministically from the
+request (the same text always geocodes to the same point, and the same waypoints always
+produce the same route), so runs are repeatable. Latency and error rates can be injected.
+
+Point the planner at it with ``GEOAPIFY_BASE_URL=http://127.0.0.1:8090`` (any non-empty
+``GEOAPIFY_API_KEY`` will do). Run it with ``python manage.py geoapify_standin``.
+"""
+
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+from .cache import normalize_location_key
+from .geoapify import DEFAULT_BASE_URL, ENDPOINT_PATHS
+
+DEFAULT_FIXTURES_PATH = Path(__file__).resolve().parent / "fixtures" / "geoapify.json"
+
+EARTH_RADIUS_METERS = 6371000.0
+# Synthesized routes are a bit longer than the great circle, at a highway-ish speed.
+ROAD_DISTANCE_FACTOR = 1.2
+SYNTHETIC_SPEED_MPS = 25.0
+# Synthesized geocodes land inside the continental US.
+SYNTHETIC_LAT_RANGE = (25.0, 49.0)
+SYNTHETIC_LON_RANGE = (-124.0, -67.0)
+
+
+def _stable_fraction(text, salt):
+    digest = hashlib.sha256(f"{salt}:{text}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2**64
+
+
+def _haversine_meters(lon1, lat1, lon2, lat2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = (
+        math.sin(dphi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(min(1.0, a)))
+
+
+def fixture_key(endpoint, params):
+    """Key a request the same way whether it is being recorded or replayed."""
+    if endpoint == "geocode":
+        return normalize_location_key(params.get("text", ""))
+    return f"{params.get('mode', 'drive')}:{params.get('waypoints', '')}"
+
+
+class GeoapifyStandIn:
+    """Request handling for the stand-in, independent of the HTTP server around it."""
+
+    def __init__(
+        self,
+        fixtures_path=DEFAULT_FIXTURES_PATH,
+        route_points=500,
+        latency_ms=0.0,
+        jitter_ms=0.0,
+        error_rate=0.0,
+        error_status=503,
+        seed=0,
+        record=False,
+        upstream_url=DEFAULT_BASE_URL,
+        upstream_api_key=None,
+    ):
+        self.fixtures_path = Path(fixtures_path) if fixtures_path else None
+        self.route_points = max(2, int(route_points))
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.record = record
+        self.upstream_url = upstream_url.rstrip("/")
+        self.upstream_api_key = upstream_api_key
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.fixtures = {"geocode": {}, "routing": {}}
+        if self.fixtures_path and self.fixtures_path.exists():
+            with open(self.fixtures_path) as f:
+                loaded = json.load(f)
+            for endpoint in self.fixtures:
+                self.fixtures[endpoint].update(loaded.get(endpoint, {}))
+        self.request_count = 0
+
+    def handle(self, endpoint, params):
+        """Return ``(status, payload, delay_seconds)`` for one request."""
+        with self._lock:
+            self.request_count += 1
+            delay = self.latency_ms + self._rng.uniform(0, self.jitter_ms)
+            fail = self._rng.random() < self.error_rate
+        if fail:
+            return (
+                self.error_status,
+                {"statusCode": self.error_status, "error": "Injected error"},
+                delay / 1000.0,
+            )
+        if not params.get("apiKey"):
+            return 401, {"statusCode": 401, "error": "Unauthorized"}, delay / 1000.0
+
+        key = fixture_key(endpoint, params)
+        payload = self.fixtures[endpoint].get(key)
+        if payload is None and self.record:
+            payload = self._record(endpoint, key, params)
+        if payload is None:
+            if endpoint == "geocode":
+                payload = self.synthesize_geocode(params.get("text", ""))
+            else:
+                payload = self.synthesize_route(params)
+        if payload is None:
+            return 400, {"statusCode": 400, "error": "Bad Request"}, delay / 1000.0
+        return 200, payload, delay / 1000.0
+
+    def synthesize_geocode(self, text):
+        key = normalize_location_key(text)
+        if not key:
+            return {"type": "FeatureCollection", "features": []}
+        lat = SYNTHETIC_LAT_RANGE[0] + _stable_fraction(key, "lat") * (
+            SYNTHETIC_LAT_RANGE[1] - SYNTHETIC_LAT_RANGE[0]
+        )
+        lon = SYNTHETIC_LON_RANGE[0] + _stable_fraction(key, "lon") * (
+            SYNTHETIC_LON_RANGE[1] - SYNTHETIC_LON_RANGE[0]
+        )
+        lon, lat = round(lon, 6), round(lat, 6)
+        return {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "properties": {
+                        "formatted": text.strip(),
+                        "lon": lon,
+                        "lat": lat,
+                    },
+                    "geometry": {"type": "Point", "coordinates": [lon, lat]},
+                }
+            ],
+        }
+
+    def synthesize_route(self, params):
+        """Build a route shaped like Geoapify's: one LineString part and one leg per hop."""
+        try:
+            waypoints = [
+                [float(v) for v in pair.split(",")]
+                for pair in params.get("waypoints", "").split("|")
+            ]
+        except ValueError:
+            return None
+        if len(waypoints) < 2 or any(len(w) != 2 for w in waypoints):
+            return None
+
+        legs = []
+        parts = []
+        for (lat1, lon1), (lat2, lon2) in zip(waypoints, waypoints[1:]):
+            n = self.route_points
+            # A gentle deterministic wiggle so the line isn't perfectly straight.
+            amplitude = 0.02 * math.hypot(lat2 - lat1, lon2 - lon1)
+            phase = _stable_fraction(f"{lat1},{lon1}|{lat2},{lon2}", "phase") * math.pi
+            part = []
+            for i in range(n):
+                t = i / (n - 1)
+                offset = amplitude * math.sin(math.pi * t) * math.sin(6 * t + phase)
+                part.append(
+                    [
+                        round(lon1 + (lon2 - lon1) * t - offset, 6),
+                        round(lat1 + (lat2 - lat1) * t + offset, 6),
+                    ]
+                )
+            distance = ROAD_DISTANCE_FACTOR * _haversine_meters(lon1, lat1, lon2, lat2)
+            legs.append(
+                {
+                    "distance": round(distance),
+                    "time": round(distance / SYNTHETIC_SPEED_MPS),
+                }
+            )
+            parts.append(part)
+
+        return {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "properties": {
+                        "mode": params.get("mode", "drive"),
+                        "waypoints": [
+                            {"location": [lon, lat], "original_index": i}
+                            for i, (lat, lon) in enumerate(waypoints)
+                        ],
+                        "units": "metric",
+                        "distance": sum(leg["distance"] for leg in legs),
+                        "distance_units": "meters",
+                        "time": sum(leg["time"] for leg in legs),
+                        "legs": legs,
+                    },
+                    "geometry": {"type": "MultiLineString", "coordinates": parts},
+                }
+            ],
+            "properties": {"mode": params.get("mode", "drive")},
+        }
+
+    def _record(self, endpoint, key, params):
+        """Fetch a missing response from the real API and append it to the fixtures."""
+        upstream_params = dict(params, apiKey=self.upstream_api_key)
+        response = requests.get(
+            self.upstream_url + ENDPOINT_PATHS[endpoint],
+            params=upstream_params,
+            timeout=30,
+        )
+        if response.status_code != 200:
+            return None
+        payload = response.json()
+        with self._lock:
+            self.fixtures[endpoint][key] = payload
+            if self.fixtures_path:
+                self.fixtures_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.fixtures_path, "w") as f:
+                    json.dump(self.fixtures, f, indent=1, sort_keys=True)
+        return payload
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+    standin = None
+    quiet = True
+
+    def do_GET(self):
+        parsed = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(parsed.query))
+        endpoint = next(
+            (name for name, path in ENDPOINT_PATHS.items() if path == parsed.path),
+            None,
+        )
+        if endpoint is None:
+            status, payload, delay = 404, {"statusCode": 404, "error": "Not Found"}, 0
+        else:
+            status, payload, delay = self.standin.handle(endpoint, params)
+        if delay > 0:
+            time.sleep(delay)
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+def make_server(standin, host="127.0.0.1", port=8090, quiet=True):
+    """Build a threading HTTP server for ``standin``; port 0 picks a free port."""
+    handler = type("StandInHandler", (_Handler,), {"standin": standin, "quiet": quiet})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_thread(standin=None, host="127.0.0.1", port=0):
+    """Start a stand-in on a background thread; returns ``(server, base_url)``.
+
+    Call ``server.shutdown()`` when done.
+    """
+    server = make_server(standin or GeoapifyStandIn(), host=host, port=port)
+    thread = threading.Thread(
+        target=server.serve_forever, name="geoapify-standin", daemon=True
+    )
+    thread.start()
+    return server, f"http://{host}:{server.server_port}"
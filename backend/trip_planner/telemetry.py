@@ -0,0 +1,368 @@
+# trip_planner/telemetry.py
+"""Per-request spans, Prometheus metrics and structured logging for the planner.
+
+``span("geocode")`` times a phase of the current request: the duration goes into the
+``trip_planner_phase_seconds`` histogram and into the request's trace, which
+TelemetryMiddleware turns into a ``Server-Timing`` header and one summary log line.
+The trace lives in a contextvar, so it follows the request into asyncio tasks,
+``sync_to_async`` calls and pool threads started with ``submit_in_context``.
+
+Every SQL query is timed too (``install_query_recorder`` hooks each DB connection): the
+request's query count and database time go into the summary log line, Server-Timing and
+the ``trip_planner_request_db_*`` histograms, and queries slower than SLOW_QUERY_MS are
+logged on their own. ``record_queries`` collects the statements run in a block, for
+trip_planner/testing.py's query budgets.
+
+Metrics are served at ``/metrics`` in the Prometheus text format, to staff users and to
+scrapers sending ``Authorization: Bearer <METRICS_TOKEN>``. Under a multi-process
+gunicorn, set PROMETHEUS_MULTIPROC_DIR so every worker's samples are aggregated.
+"""
+
+import contextlib
+import contextvars
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+logger = logging.getLogger(__name__)
+
+PHASES = ("geocode", "route", "simulate", "eld_generate", "persist", "serialize")
+
+# Upstream calls sit around 50 ms-2 s; simulation/serialization can be well under 1 ms.
+_LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+PHASE_SECONDS = Histogram(
+    "trip_planner_phase_seconds",
+    "Time spent in each trip planning phase.",
+    ["phase"],
+    buckets=_LATENCY_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "trip_planner_request_seconds",
+    "End-to-end request latency by URL name.",
+    ["method", "view", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+REQUEST_DB_QUERIES = Histogram(
+    "trip_planner_request_db_queries",
+    "SQL queries run per request, by URL name.",
+    ["view"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144),
+)
+REQUEST_DB_SECONDS = Histogram(
+    "trip_planner_request_db_seconds",
+    "Time per request spent waiting on SQL queries, by URL name.",
+    ["view"],
+    buckets=_LATENCY_BUCKETS,
+)
+for _phase in PHASES:
+    PHASE_SECONDS.labels(_phase)  # Export every phase from the first scrape
+
+UPSTREAM_REQUESTS = Counter(
+    "trip_planner_upstream_requests_total",
+    "Geoapify requests sent, by endpoint and outcome.",
+    ["endpoint", "outcome"],
+)
+DEDUPLICATED_CREATES = Counter(
+    "trip_planner_deduplicated_creates_total",
+    "Trip creates answered without planning again, by reason "
+    "(in_flight: joined an identical request; idempotency_key: replayed).",
+    ["reason"],
+)
+SLOW_QUERIES = Counter(
+    "trip_planner_slow_queries_total",
+    "SQL queries that took at least SLOW_QUERY_MS.",
+)
+
+
+class Trace:
+    """Span durations recorded during one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.spans.append((name, seconds))
+
+    def add_query(self, seconds):
+        with self._lock:
+            self.db_queries += 1
+            self.db_seconds += seconds
+
+    def totals(self):
+        """``{name: (total_seconds, count)}`` in first-seen order."""
+        totals = {}
+        with self._lock:
+            for name, seconds in self.spans:
+                total, count = totals.get(name, (0.0, 0))
+                totals[name] = (total + seconds, count + 1)
+        return totals
+
+
+_current_trace = contextvars.ContextVar("trip_planner_trace", default=None)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextlib.contextmanager
+def span(name):
+    """Time a block as phase ``name``; spans run concurrently (e.g. geocodes) add up."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        PHASE_SECONDS.labels(name).observe(elapsed)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, elapsed)
+        logger.debug("span %s took %.2f ms", name, elapsed * 1000)
+
+
+class QueryLog:
+    """SQL statements run inside ``record_queries``, as ``(sql, seconds)`` pairs."""
+
+    def __init__(self):
+        self.queries = []
+        self._lock = threading.Lock()
+
+    def add(self, sql, seconds):
+        with self._lock:
+            self.queries.append((sql, seconds))
+
+    def __len__(self):
+        return len(self.queries)
+
+
+_current_query_log = contextvars.ContextVar("trip_planner_query_log", default=None)
+
+
+@contextlib.contextmanager
+def record_queries():
+    """Collect the queries run in this block into a QueryLog, pool threads included.
+
+    Only the innermost ``record_queries`` sees a query.
+    """
+    query_log = QueryLog()
+    token = _current_query_log.set(query_log)
+    try:
+        yield query_log
+    finally:
+        _current_query_log.reset(token)
+
+
+def _record_query(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_query(elapsed)
+        query_log = _current_query_log.get()
+        if query_log is not None:
+            query_log.add(sql, elapsed)
+        if settings.SLOW_QUERY_MS and elapsed * 1000 >= settings.SLOW_QUERY_MS:
+            SLOW_QUERIES.inc()
+            logger.warning(
+                "Slow query (%.1f ms): %s",
+                elapsed * 1000,
+                sql[:1000],
+                extra={"duration_ms": round(elapsed * 1000, 1)},
+            )
+
+
+def _add_query_recorder(connection, **kwargs):
+    # At the front: connection.execute_wrapper() blocks pop from the end, and a
+    # connection can be opened (and this run) inside one.
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+def install_query_recorder():
+    """Time every query on this process's DB connections (called from AppConfig.ready)."""
+    connection_created.connect(_add_query_recorder)
+    for connection in connections.all(initialized_only=True):
+        _add_query_recorder(connection)
+
+
+def submit_in_context(pool, func, *args):
+    """``pool.submit`` that carries the caller's trace (and other contextvars) along."""
+    return pool.submit(contextvars.copy_context().run, func, *args)
+
+
+def server_timing(trace):
+    """Format a trace as a Server-Timing header value (durations in milliseconds)."""
+    parts = []
+    for name, (total, count) in trace.totals().items():
+        part = f"{name};dur={total * 1000:.1f}"
+        if count > 1:
+            part += f';desc="{count} calls"'
+        parts.append(part)
+    if trace.db_queries:
+        parts.append(
+            f'db;dur={trace.db_seconds * 1000:.1f};desc="{trace.db_queries} queries"'
+        )
+    parts.append(f"total;dur={(time.perf_counter() - trace.started) * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class TelemetryMiddleware:
+    """Trace each request, then add Server-Timing and record its latency."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        trace = Trace()
+        token = _current_trace.set(trace)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_trace.reset(token)
+        self._finish(request, response, trace)
+        return response
+
+    async def __acall__(self, request):
+        trace = Trace()
+        token = _current_trace.set(trace)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_trace.reset(token)
+        self._finish(request, response, trace)
+        return response
+
+    def _finish(self, request, response, trace):
+        elapsed = time.perf_counter() - trace.started
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "unmatched"
+        REQUEST_SECONDS.labels(request.method, view, response.status_code).observe(
+            elapsed
+        )
+        REQUEST_DB_QUERIES.labels(view).observe(trace.db_queries)
+        REQUEST_DB_SECONDS.labels(view).observe(trace.db_seconds)
+        response["Server-Timing"] = server_timing(trace)
+        if trace.spans or trace.db_queries:
+            logger.info(
+                "%s %s %s in %.1f ms (%d queries, %.1f ms in the database)",
+                request.method,
+                request.path,
+                response.status_code,
+                elapsed * 1000,
+                trace.db_queries,
+                trace.db_seconds * 1000,
+                extra={
+                    "view": view,
+                    "status": response.status_code,
+                    "duration_ms": round(elapsed * 1000, 1),
+                    "db_queries": trace.db_queries,
+                    "db_ms": round(trace.db_seconds * 1000, 1),
+                    "spans_ms": {
+                        name: round(total * 1000, 1)
+                        for name, (total, _) in trace.totals().items()
+                    },
+                },
+            )
+
+
+def metrics_access_allowed(request):
+    """Whether ``request`` may read operational data (/metrics, /api/planner/stats/).
+
+    Staff users may, and so may anyone sending ``Authorization: Bearer <token>`` with
+    the METRICS_TOKEN setting's value (when it is set).
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and hmac.compare_digest(
+            credentials.strip().encode(), token.encode()
+        ):
+            return True
+    user = getattr(request, "user", None)
+    return bool(user is not None and user.is_staff)
+
+
+def metrics(request):
+    """Prometheus scrape endpoint (see ``metrics_access_allowed``)."""
+    if not metrics_access_allowed(request):
+        return HttpResponseForbidden()
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+# Attributes every LogRecord has; anything else was passed in ``extra``.
+_RECORD_ATTRS = frozenset(
+    vars(logging.LogRecord("", 0, "", 0, "", (), None)).keys()
+) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including any ``extra`` fields."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
@@ -0,0 +1,82 @@
+# trip_planner/testing.py
+"""Helpers for the trip planner's tests."""
+
+import contextlib
+from unittest import mock
+
+from django.test import TransactionTestCase
+from django.test.utils import override_settings
+
+from . import async_planner, geoapify, route_planner, standin
+from .cache import geocode_cache, plan_cache, route_cache, trip_response_cache
+from .telemetry import record_queries
+
+# Any non-empty key works against the stand-in
+STANDIN_API_KEY = "test-api-key"
+
+# Transaction control depends on how the test wraps the request (TestCase runs every
+# atomic block as a savepoint), so it doesn't count against a budget.
+_TRANSACTION_CONTROL = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE SAVEPOINT")
+
+
+def counted_queries(query_log):
+    """The statements in a QueryLog that count against a budget."""
+    return [
+        sql
+        for sql, _ in query_log.queries
+        if not sql.lstrip().upper().startswith(_TRANSACTION_CONTROL)
+    ]
+
+
+@contextlib.contextmanager
+def assert_query_budget(budget, label="block"):
+    """Fail if the block runs more than ``budget`` SQL queries.
+
+    Counts queries from every thread the block's work reaches through its context (pool
+    threads, ``sync_to_async``), leaving out transaction control, and lists them when it
+    fails. Yields the QueryLog.
+    """
+    with record_queries() as query_log:
+        yield query_log
+    queries = counted_queries(query_log)
+    if len(queries) > budget:
+        statements = "\n".join(f"{i}. {sql}" for i, sql in enumerate(queries, 1))
+        raise AssertionError(
+            f"{label} ran {len(queries)} queries, over its budget of {budget}:\n"
+            f"{statements}"
+        )
+
+
+class StandInTestCase(TransactionTestCase):
+    """Test case planning against a local Geoapify stand-in, with empty memory caches.
+
+    Planning writes to the caches from pool threads, on their own connections, so these
+    tests commit for real and the tables are flushed afterwards rather than rolled back.
+    """
+
+    route_points = 50
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.standin = standin.GeoapifyStandIn(
+            fixtures_path=None, route_points=cls.route_points
+        )
+        cls.server, url = standin.start_in_thread(cls.standin)
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+        cls.enterClassContext(override_settings(GEOAPIFY_BASE_URL=url))
+        for module in (geoapify, route_planner, async_planner):
+            cls.enterClassContext(
+                mock.patch.object(module, "GEOAPIFY_API_KEY", STANDIN_API_KEY)
+            )
+        # Clients are built from settings on first use, so make new ones for the stand-in
+        cls.enterClassContext(mock.patch.object(geoapify, "_client", None))
+
+    def setUp(self):
+        for cache in (geocode_cache, route_cache, plan_cache, trip_response_cache):
+            cache.memory.clear()
+
+    def upstream_requests(self):
+        """Requests the stand-in has served so far (in this test class)."""
+        return self.standin.request_count
@@ -1,3 +1,1575 @@
-from django.test import TestCase
+import datetime
+import decimal
+import gzip
+import asyncio
+import concurrent.futures
+import contextlib
+import json
+import logging
+import math
+import tempfile
+import threading
+import time
 
-# Create your tests here.
+import numpy as np
+from unittest import mock
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase
+from rest_framework.renderers import JSONRenderer
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from .cache import (
+    GeocodeCache,
+    LRUCache,
+    RouteCache,
+    geocode_cache,
+    normalize_location_key,
+    route_cache,
+    route_cache_key,
+    trip_response_cache,
+)
+from . import benchmarks, geoapify, polyline, standin
+from .eld import build_daily_logs
+from .geoapify import GeoapifyClient
+from .geometry import (
+    RouteGeometry,
+    simplify,
+    simplify_to_budget,
+    zoom_tolerance_meters,
+)
+from .hos import HOSState, Leg, simulate_trip, summarize_trip
+from .idempotency import prune_idempotency_keys
+from .jobs import claim_next_job, run_job, run_pending_jobs
+from .models import (
+    RouteSegment,
+    TripGeometry,
+    ELDLog,
+    GeocodeCacheEntry,
+    IdempotencyKey,
+    PlanningJob,
+    RouteCacheEntry,
+    Trip,
+)
+from .route_planner import (
+    _simplify_geometry,
+    _split_route_legs,
+    fetch_trip_locations_and_routes,
+    geocode_location,
+    get_route_legs,
+    trip_stops,
+)
+from .telemetry import (
+    JsonFormatter,
+    Trace,
+    _current_trace,
+    server_timing,
+    span,
+    submit_in_context,
+)
+from .payloads import trip_payload, trip_payload_from, trip_summaries
+from .renderers import FastJSONRenderer, dumps
+from .serializers import (
+    MAX_TRIP_IDS,
+    TRIP_SUMMARY_FIELDS,
+    TripCreateSerializer,
+    TripSerializer,
+    TripSummarySerializer,
+)
+from .services import plan_request_key
+from .singleflight import AsyncSingleFlight, SingleFlight
+from .testing import StandInTestCase, assert_query_budget
+
+TRIP = {
+    "current_location": "Chicago, IL",
+    "pickup_location": "Denver, CO",
+    "dropoff_location": "Los Angeles, CA",
+    "current_cycle_used": 10,
+}
+
+# Queries each endpoint may run. Lower them when a change saves queries; raising one
+# needs a reason in the commit.
+# Cold caches: each geocode and route is looked up and stored, then four inserts
+CREATE_BUDGET = 19
+CREATE_WARM_BUDGET = 4  # geocodes, routes and plan from memory: only the inserts
+# Response cache miss: cache lookup, trip, segments, logs, then the cache write
+RETRIEVE_BUDGET = 6
+RETRIEVE_CACHED_BUDGET = 0
+LIST_BUDGET = 1  # one page of summaries, however many trips
+
+
+class QueryBudgetTests(StandInTestCase):
+    """Query counts of the trip endpoints."""
+
+    def create_trip(self, **changes):
+        response = self.client.post(
+            "/api/trips/", dict(TRIP, **changes), content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def test_create(self):
+        with assert_query_budget(CREATE_BUDGET, "POST /api/trips/"):
+            trip = self.create_trip()
+        self.assertTrue(trip["segments"])
+        self.assertTrue(trip["eld_logs"])
+
+        with assert_query_budget(CREATE_WARM_BUDGET, "POST /api/trips/ (warm caches)"):
+            self.create_trip(current_cycle_used=11)
+
+    def test_retrieve(self):
+        trip_id = self.create_trip()["id"]
+        trip_response_cache.memory.clear()
+        with assert_query_budget(RETRIEVE_BUDGET, "GET /api/trips/<id>/"):
+            response = self.client.get(f"/api/trips/{trip_id}/")
+        self.assertEqual(response.status_code, 200)
+        with assert_query_budget(RETRIEVE_CACHED_BUDGET, "cached GET /api/trips/<id>/"):
+            response = self.client.get(f"/api/trips/{trip_id}/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_does_not_grow_with_trips(self):
+        self.create_trip()
+        with assert_query_budget(LIST_BUDGET, "GET /api/trips/ (1 trip)"):
+            response = self.client.get("/api/trips/")
+        self.assertEqual(len(response.json()["results"]), 1)
+
+        for cycle_used in (1, 2, 3):
+            self.create_trip(current_cycle_used=cycle_used)
+        with assert_query_budget(LIST_BUDGET, "GET /api/trips/ (4 trips)"):
+            response = self.client.get("/api/trips/")
+        self.assertEqual(len(response.json()["results"]), 4)
+
+    def test_list_by_ids(self):
+        ids = [self.create_trip(current_cycle_used=c)["id"] for c in (1, 2)]
+        with assert_query_budget(3, "GET /api/trips/?ids="):
+            response = self.client.get(f"/api/trips/?ids={ids[0]},{ids[1]}")
+        self.assertEqual([trip["id"] for trip in response.json()["results"]], ids)
+
+    def test_eld_log_str_does_not_load_trip(self):
+        trip_id = self.create_trip()["id"]
+        log = ELDLog.objects.filter(trip_id=trip_id).first()
+        with assert_query_budget(0, "str(ELDLog)"):
+            self.assertIn(f"Trip {trip_id}", str(log))
+
+
+class LRUCacheTests(SimpleTestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2, ttl_seconds=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_expired_entries_miss(self):
+        cache = LRUCache(maxsize=2, ttl_seconds=0)
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+    def test_zero_size_stores_nothing(self):
+        cache = LRUCache(maxsize=0, ttl_seconds=60)
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+
+
+class GeocodeCacheTests(TestCase):
+    VALUE = {"coordinates": [-87.6298, 41.8781], "place_name": "Chicago, IL, USA"}
+
+    def test_normalized_spellings_share_a_key(self):
+        self.assertEqual(
+            normalize_location_key("  Chicago,IL "),
+            normalize_location_key("chicago il"),
+        )
+        self.assertNotEqual(
+            normalize_location_key("Chicago, IL"), normalize_location_key("Denver, CO")
+        )
+        self.assertEqual(len(normalize_location_key("x " * 200)), 64)
+
+    def test_shared_tier_serves_a_new_process(self):
+        GeocodeCache().set("Chicago, IL", self.VALUE)
+        other_worker = GeocodeCache()
+        self.assertEqual(other_worker.get("chicago il"), self.VALUE)
+        self.assertEqual(other_worker.db_hits, 1)
+        # Now from its own memory tier
+        self.assertEqual(other_worker.get("Chicago, IL"), self.VALUE)
+        self.assertEqual(other_worker.db_hits, 1)
+        self.assertEqual(GeocodeCacheEntry.objects.get().hit_count, 1)
+
+    def test_expired_rows_are_misses(self):
+        GeocodeCache().set("Chicago, IL", self.VALUE)
+        GeocodeCacheEntry.objects.update(
+            fetched_at=timezone.now() - datetime.timedelta(days=365)
+        )
+        self.assertIsNone(GeocodeCache().get("Chicago, IL"))
+        self.assertFalse(GeocodeCacheEntry.objects.exists())
+
+    def test_counters_are_exact_across_threads(self):
+        cache = GeocodeCache()
+        with mock.patch.object(
+            GeocodeCacheEntry.objects, "filter", side_effect=DatabaseError
+        ):
+            with concurrent.futures.ThreadPoolExecutor(8) as pool:
+                for _ in range(2000):
+                    pool.submit(cache.get, "Chicago, IL")
+        self.assertEqual(cache.stats()["db"]["errors"], 2000)
+
+    @override_settings(GEOCODE_CACHE_MAX_ROWS=2)
+    def test_prune_keeps_most_recently_used_rows(self):
+        cache = GeocodeCache()
+        for i, name in enumerate(("Austin", "Boston", "Chicago")):
+            cache.set(name, self.VALUE)
+            GeocodeCacheEntry.objects.filter(query=name).update(
+                last_used_at=timezone.now() + datetime.timedelta(minutes=i)
+            )
+        cache.prune()
+        self.assertEqual(
+            sorted(GeocodeCacheEntry.objects.values_list("query", flat=True)),
+            ["Boston", "Chicago"],
+        )
+
+
+class GeocodeLocationTests(StandInTestCase):
+    def test_repeat_lookups_skip_the_api(self):
+        first = geocode_location("Chicago, IL")
+        requests_made = self.upstream_requests()
+        self.assertEqual(geocode_location("chicago il"), first)
+        geocode_cache.memory.clear()
+        self.assertEqual(geocode_location("CHICAGO, IL"), first)
+        self.assertEqual(self.upstream_requests(), requests_made)
+
+
+ROUTE = {
+    "distance_miles": 1002.5,
+    "duration_hours": 15.25,
+    "geometry": {
+        "type": "MultiLineString",
+        "coordinates": [
+            [[-87.629812, 41.878113], [-95.0, 40.5], [-104.990251, 39.7392]]
+        ],
+    },
+}
+
+
+class RouteCacheTests(TestCase):
+    CHICAGO, DENVER = [-87.6298, 41.8781], [-104.9903, 39.7392]
+
+    def test_nearby_waypoints_share_a_lane(self):
+        nearby = [self.CHICAGO[0] + 0.0002, self.CHICAGO[1] - 0.0002]
+        self.assertEqual(
+            route_cache_key([self.CHICAGO, self.DENVER]),
+            route_cache_key([nearby, self.DENVER]),
+        )
+        self.assertNotEqual(
+            route_cache_key([self.CHICAGO, self.DENVER]),
+            route_cache_key([self.DENVER, self.CHICAGO]),
+        )
+        self.assertIsNone(route_cache_key([self.CHICAGO, None]))
+
+    def test_geometry_comes_back_as_rounded_polyline_points(self):
+        cache = RouteCache()
+        cache.set([self.CHICAGO, self.DENVER], ROUTE)
+        cache.memory.clear()
+        route = cache.get([self.CHICAGO, self.DENVER])
+        self.assertEqual(cache.db_hits, 1)
+        self.assertEqual(route["distance_miles"], ROUTE["distance_miles"])
+        self.assertEqual(route["duration_hours"], ROUTE["duration_hours"])
+        self.assertEqual(
+            route["geometry"],
+            {
+                "type": "MultiLineString",
+                "coordinates": [
+                    [[-87.62981, 41.87811], [-95.0, 40.5], [-104.99025, 39.7392]]
+                ],
+            },
+        )
+
+    def test_stale_lanes_are_refetched(self):
+        RouteCache().set([self.CHICAGO, self.DENVER], ROUTE)
+        RouteCacheEntry.objects.update(
+            fetched_at=timezone.now() - datetime.timedelta(days=365)
+        )
+        self.assertIsNone(RouteCache().get([self.CHICAGO, self.DENVER]))
+        self.assertFalse(RouteCacheEntry.objects.exists())
+
+    def test_prune_keeps_the_byte_budget(self):
+        cache = RouteCache()
+        cache.set([self.CHICAGO, self.DENVER], ROUTE)
+        cache.set([self.DENVER, self.CHICAGO], ROUTE)
+        RouteCacheEntry.objects.update(
+            last_used_at=timezone.now() - datetime.timedelta(hours=1)
+        )
+        RouteCacheEntry.objects.filter(
+            key=route_cache_key([self.DENVER, self.CHICAGO])
+        ).update(last_used_at=timezone.now())
+        size = RouteCacheEntry.objects.first().size_bytes
+        with override_settings(ROUTE_CACHE_MAX_BYTES=size):
+            cache.prune()
+        self.assertEqual(
+            list(RouteCacheEntry.objects.values_list("key", flat=True)),
+            [route_cache_key([self.DENVER, self.CHICAGO])],
+        )
+
+
+class RouteLegsTests(StandInTestCase):
+    def test_cached_legs_skip_the_api(self):
+        locations = [
+            geocode_location(name) for name in ("Chicago, IL", "Denver, CO", "Reno, NV")
+        ]
+        first = get_route_legs(locations)
+        requests_made = self.upstream_requests()
+        route_cache.memory.clear()
+        second = get_route_legs(locations)
+        self.assertEqual(self.upstream_requests(), requests_made)
+        self.assertEqual(
+            [leg["distance_miles"] for leg in second],
+            [leg["distance_miles"] for leg in first],
+        )
+
+
+class UpstreamFanOutTests(StandInTestCase):
+    def test_same_location_is_geocoded_once(self):
+        requests_before = self.upstream_requests()
+        locations, routes = fetch_trip_locations_and_routes(
+            ["Chicago, IL", "Denver, CO", "chicago il"]
+        )
+        self.assertEqual(locations[0], locations[2])
+        self.assertEqual(len(routes), 2)
+        # Two geocodes and one routing request for both legs
+        self.assertEqual(self.upstream_requests() - requests_before, 3)
+
+    def test_earliest_failing_location_is_reported(self):
+        with self.assertRaisesMessage(ValueError, "location: !!!"):
+            fetch_trip_locations_and_routes(["Chicago, IL", "!!!", "???"])
+
+
+class _FlakyStandIn(standin.GeoapifyStandIn):
+    """Answers the first ``failures`` requests with a 503."""
+
+    def __init__(self, failures):
+        super().__init__(fixtures_path=None)
+        self.failures = failures
+
+    def handle(self, endpoint, params):
+        if self.request_count < self.failures:
+            self.request_count += 1
+            return 503, {"statusCode": 503, "error": "Unavailable"}, 0
+        return super().handle(endpoint, params)
+
+
+class GeoapifyClientTests(SimpleTestCase):
+    def client_for(self, failures=0, api_key="secret-key", **options):
+        self.standin = _FlakyStandIn(failures)
+        server, url = standin.start_in_thread(self.standin)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        client = GeoapifyClient(
+            api_key=api_key, base_url=url, backoff_seconds=0, **options
+        )
+        self.addCleanup(client.close)
+        return client
+
+    def test_retries_transient_errors(self):
+        client = self.client_for(failures=2, max_retries=2)
+        response = client.get("geocode", {"text": "Chicago, IL"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.retries, 2)
+        self.assertEqual(self.standin.request_count, 3)
+
+    def test_gives_up_after_max_retries(self):
+        client = self.client_for(failures=5, max_retries=1)
+        response = client.get("geocode", {"text": "Chicago, IL"})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.standin.request_count, 2)
+        self.assertEqual(client.failures, 1)
+
+    def test_client_errors_are_not_retried(self):
+        client = self.client_for(api_key=None, max_retries=2)
+        response = client.get("geocode", {"text": "Chicago, IL"})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.standin.request_count, 1)
+
+    def test_connections_are_reused(self):
+        client = self.client_for()
+        for city in ("Chicago, IL", "Denver, CO", "Reno, NV"):
+            client.get("geocode", {"text": city})
+        stats = client.stats()
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["connections_opened"], 1)
+
+    def test_redacts_the_key(self):
+        client = self.client_for()
+        response = client.get("geocode", {"text": "Chicago, IL"})
+        self.assertIn("secret-key", response.url)
+        self.assertNotIn("secret-key", client.redact(response.url))
+
+
+class StandInTests(SimpleTestCase):
+    KEY = {"apiKey": "any"}
+
+    def test_geocodes_are_deterministic(self):
+        service = standin.GeoapifyStandIn(fixtures_path=None)
+        status, first, _ = service.handle("geocode", dict(self.KEY, text="Chicago, IL"))
+        _, again, _ = service.handle("geocode", dict(self.KEY, text="chicago il"))
+        self.assertEqual(status, 200)
+        lon, lat = first["features"][0]["geometry"]["coordinates"]
+        self.assertEqual(again["features"][0]["geometry"]["coordinates"], [lon, lat])
+        self.assertTrue(-124 <= lon <= -67 and 25 <= lat <= 49)
+
+    def test_routes_have_one_leg_and_line_per_hop(self):
+        service = standin.GeoapifyStandIn(fixtures_path=None, route_points=20)
+        status, payload, _ = service.handle(
+            "routing",
+            dict(
+                self.KEY, waypoints="41.8,-87.6|39.7,-104.9|39.5,-119.8", mode="drive"
+            ),
+        )
+        self.assertEqual(status, 200)
+        feature = payload["features"][0]
+        self.assertEqual(len(feature["properties"]["legs"]), 2)
+        self.assertEqual(
+            [len(part) for part in feature["geometry"]["coordinates"]], [20, 20]
+        )
+        self.assertEqual(feature["geometry"]["coordinates"][0][0], [-87.6, 41.8])
+
+    def test_replays_fixtures(self):
+        recorded = {"type": "FeatureCollection", "features": [], "recorded": True}
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "geoapify.json"
+            path.write_text(
+                json.dumps({"geocode": {"chicago il": recorded}, "routing": {}})
+            )
+            service = standin.GeoapifyStandIn(fixtures_path=path)
+        _, payload, _ = service.handle("geocode", dict(self.KEY, text="Chicago, IL"))
+        self.assertEqual(payload, recorded)
+
+    def test_injected_errors_and_missing_key(self):
+        service = standin.GeoapifyStandIn(
+            fixtures_path=None, error_rate=1.0, error_status=429
+        )
+        self.assertEqual(service.handle("geocode", dict(self.KEY, text="x"))[0], 429)
+        service = standin.GeoapifyStandIn(fixtures_path=None)
+        self.assertEqual(service.handle("geocode", {"text": "x"})[0], 401)
+
+
+class RouteGeometryTests(SimpleTestCase):
+    def test_interpolates_by_distance_not_vertex_index(self):
+        # Along the equator a degree of longitude is the same distance everywhere,
+        # so fractions of the length map to fractions of the longitude span.
+        geometry = RouteGeometry([[0.0, 0.0], [1.0, 0.0], [1.1, 0.0], [3.0, 0.0]])
+        points = geometry.points_at_fractions([0.0, 0.25, 0.5, 1.0])
+        self.assertEqual(points[:, 0].round(6).tolist(), [0.0, 0.75, 1.5, 3.0])
+        self.assertAlmostEqual(geometry.length_miles, 207.3, places=0)
+
+    def test_clamps_fractions_to_the_endpoints(self):
+        geometry = RouteGeometry([[-87.6, 41.8], [-104.9, 39.7]])
+        self.assertEqual(geometry.point_at_fraction(-1), [-87.6, 41.8])
+        self.assertEqual(geometry.point_at_fraction(2), [-104.9, 39.7])
+
+    def test_single_point(self):
+        geometry = RouteGeometry([[-87.6, 41.8]])
+        self.assertEqual(geometry.length_miles, 0.0)
+        self.assertEqual(geometry.point_at_fraction(0.5), [-87.6, 41.8])
+
+    def test_from_geojson(self):
+        geometry = RouteGeometry.from_geojson(
+            {
+                "type": "MultiLineString",
+                "coordinates": [[[0.0, 0.0], [1.0, 0.0]], [[1.0, 0.0], [2.0, 0.0]]],
+            }
+        )
+        self.assertEqual(len(geometry), 4)
+        self.assertEqual(geometry.point_at_fraction(0.5), [1.0, 0.0])
+        self.assertIsNone(RouteGeometry.from_geojson(None))
+        self.assertIsNone(
+            RouteGeometry.from_geojson({"type": "Point", "coordinates": [0, 0]})
+        )
+        self.assertIsNone(
+            RouteGeometry.from_geojson({"type": "LineString", "coordinates": []})
+        )
+
+
+START = datetime.datetime(2026, 3, 2, 8, 0, tzinfo=datetime.timezone.utc)
+
+
+def hos_state(cycle_used=0.0):
+    return HOSState.start(START, cycle_used, [-87.6, 41.8], "Chicago, IL")
+
+
+def leg(miles, stop_type="DROPOFF", end=(-90.0, 40.0), geometry=None):
+    return Leg(
+        miles, list(end), f"{stop_type.title()} stop", stop_type, geometry=geometry
+    )
+
+
+class SimulateTripTests(SimpleTestCase):
+    def assert_contiguous(self, segments):
+        self.assertEqual(segments[0]["start_time"], START)
+        for before, after in zip(segments, segments[1:]):
+            self.assertEqual(before["end_time"], after["start_time"])
+
+    def test_short_trip(self):
+        result = simulate_trip(
+            [leg(110, "PICKUP", end=(-89.0, 41.0)), leg(110, "DROPOFF")], hos_state()
+        )
+        segments = result.segments
+        self.assertEqual(
+            [s["type"] for s in segments], ["DRIVE", "PICKUP", "DRIVE", "DROPOFF"]
+        )
+        self.assert_contiguous(segments)
+        self.assertEqual(segments[0]["start_coordinates"], [-87.6, 41.8])
+        self.assertEqual(segments[1]["end_coordinates"], [-89.0, 41.0])
+        self.assertEqual(result.state.position_name, "Dropoff stop")
+
+        summary = summarize_trip(segments, result.state)
+        self.assertAlmostEqual(summary["total_distance_miles"], 220)
+        self.assertAlmostEqual(summary["driving_hours"], 4)
+        self.assertAlmostEqual(summary["on_duty_hours"], 2)
+        self.assertEqual(summary["rest_hours"], 0)
+        self.assertEqual(summary["rest_stop_count"], 0)
+        self.assertEqual(summary["arrival_time"], START + datetime.timedelta(hours=6))
+        self.assertAlmostEqual(summary["cycle_used_at_arrival"], 6)
+
+    def test_rejects_bad_legs(self):
+        with self.assertRaises(ValueError):
+            simulate_trip([leg(-1)], hos_state())
+        with self.assertRaises(ValueError):
+            simulate_trip([Leg(10, None, "Nowhere", "DROPOFF")], hos_state())
+
+    def test_break_boundary(self):
+        exactly_eight_hours = simulate_trip([leg(440)], hos_state()).segments
+        self.assertEqual([s["type"] for s in exactly_eight_hours], ["DRIVE", "DROPOFF"])
+
+        segments = simulate_trip([leg(495)], hos_state()).segments
+        self.assertEqual(
+            [(s["type"], s["duration_hours"]) for s in segments],
+            [("DRIVE", 8), ("REST", 0.5), ("DRIVE", 1), ("DROPOFF", 1)],
+        )
+        self.assert_contiguous(segments)
+
+    def test_break_window_carries_over_between_legs(self):
+        segments = simulate_trip(
+            [leg(330, "PICKUP"), leg(275, "DROPOFF")], hos_state()
+        ).segments
+        self.assertEqual(
+            [(s["type"], s["duration_hours"]) for s in segments],
+            [
+                ("DRIVE", 6),
+                ("PICKUP", 1),
+                ("DRIVE", 2),
+                ("REST", 0.5),
+                ("DRIVE", 3),
+                ("DROPOFF", 1),
+            ],
+        )
+
+    def test_fuel_boundary(self):
+        # A leg ending 0.05 miles short of the fuel range doesn't fuel at its stop; the
+        # next leg drives the last 0.05 miles first, as the original loop did.
+        result = simulate_trip([leg(999.95, "PICKUP"), leg(100)], hos_state())
+        segments = result.segments
+        fuel = [i for i, s in enumerate(segments) if s["type"] == "FUEL"]
+        self.assertEqual(len(fuel), 1)
+        self.assertGreater(fuel[0], [s["type"] for s in segments].index("PICKUP"))
+        self.assertEqual(segments[fuel[0] - 1]["type"], "DRIVE")
+        self.assertAlmostEqual(segments[fuel[0] - 1]["distance_miles"], 0.05)
+        self.assertAlmostEqual(result.state.fuel_distance_since_last_stop, 99.95)
+
+        # Within a leg, running into the range fuels on the spot.
+        segments = simulate_trip([leg(1500)], hos_state()).segments
+        drive_before_fuel = sum(
+            s["distance_miles"]
+            for s in segments[: [s["type"] for s in segments].index("FUEL")]
+        )
+        self.assertAlmostEqual(drive_before_fuel, 1000)
+
+    def test_restart_when_the_cycle_runs_out(self):
+        result = simulate_trip([leg(110)], hos_state(cycle_used=69))
+        self.assertEqual(
+            [(s["type"], s["duration_hours"]) for s in result.segments],
+            [("DRIVE", 1), ("REST", 34), ("DRIVE", 1), ("DROPOFF", 1)],
+        )
+        self.assert_contiguous(result.segments)
+        summary = summarize_trip(result.segments, result.state)
+        self.assertAlmostEqual(summary["cycle_used_at_arrival"], 2)
+
+    def test_warns_when_stops_have_no_geometry(self):
+        line = RouteGeometry([[-87.6, 41.8], [-90.0, 40.0]])
+        self.assertEqual(
+            simulate_trip([leg(495, geometry=line)], hos_state()).warnings, []
+        )
+        self.assertEqual(simulate_trip([leg(110)], hos_state()).warnings, [])
+
+        result = simulate_trip([leg(495)], hos_state())
+        self.assertEqual(len(result.warnings), 1)
+        self.assertIn("Dropoff stop", result.warnings[0])
+        self.assertEqual(result.segments[1]["start_coordinates"], [-87.6, 41.8])
+
+
+class MultiStopTests(StandInTestCase):
+    STOPS = [
+        {"location": "Denver, CO", "dwell_hours": 0.5},
+        {"location": "Reno, NV"},
+        {"location": "Los Angeles, CA"},
+    ]
+
+    def test_trip_stops_defaults(self):
+        self.assertEqual(
+            [(s["location"], s["type"]) for s in trip_stops("A", "B")],
+            [("A", "PICKUP"), ("B", "DROPOFF")],
+        )
+        stops = trip_stops("ignored", "ignored", self.STOPS)
+        self.assertEqual(
+            [(s["type"], s["dwell_hours"]) for s in stops],
+            [("PICKUP", 0.5), ("PICKUP", 1.0), ("DROPOFF", 1.0)],
+        )
+
+    def test_trip_with_stops_makes_one_routing_request(self):
+        requests_before = self.upstream_requests()
+        response = self.client.post(
+            "/api/trips/",
+            {
+                "current_location": "Chicago, IL",
+                "current_cycle_used": 0,
+                "stops": self.STOPS,
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        # Four geocodes and a single routing request for all three legs
+        self.assertEqual(self.upstream_requests() - requests_before, 5)
+        trip = response.json()
+        self.assertEqual(trip["pickup_location"], "Denver, CO")
+        self.assertEqual(trip["dropoff_location"], "Los Angeles, CA")
+        stop_types = [
+            s["segment_type"]
+            for s in trip["segments"]
+            if s["segment_type"] in ("PICKUP", "DROPOFF")
+        ]
+        self.assertEqual(stop_types, ["PICKUP", "PICKUP", "DROPOFF"])
+
+    def test_too_many_stops(self):
+        response = self.client.post(
+            "/api/trips/",
+            {
+                "current_location": "Chicago, IL",
+                "current_cycle_used": 0,
+                "stops": [{"location": f"Stop {i}"} for i in range(26)],
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("stops", response.json())
+
+    def test_leg_count_must_match_the_response(self):
+        route = {"properties": {"legs": [{"distance": 1000, "time": 60}]}}
+        with self.assertRaisesMessage(ValueError, "has 1 legs, expected 2"):
+            _split_route_legs(route, 2)
+
+
+class BatchCreateTests(StandInTestCase):
+    def post_batch(self, items):
+        return self.client.post(
+            "/api/trips/batch/", items, content_type="application/json"
+        )
+
+    def test_results_keep_item_order_and_share_upstream_calls(self):
+        requests_before = self.upstream_requests()
+        response = self.post_batch(
+            [
+                TRIP,
+                {"current_location": "Chicago, IL", "current_cycle_used": 0},
+                dict(TRIP, current_location="chicago il", current_cycle_used=20),
+                dict(TRIP, pickup_location="!!!"),
+            ]
+        )
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([r["index"] for r in results], [0, 1, 2, 3])
+        self.assertEqual([r["status"] for r in results], [201, 400, 201, 400])
+        self.assertIn("pickup_location", results[1]["errors"])
+        self.assertIn("!!!", results[3]["error"])
+        self.assertEqual(Trip.objects.count(), 2)
+        self.assertEqual(
+            results[0]["trip"]["total_distance_miles"],
+            results[2]["trip"]["total_distance_miles"],
+        )
+        # Chicago, Denver, Los Angeles and "!!!" geocoded once each, plus one routing
+        # request for each of the two distinct lanes
+        self.assertEqual(self.upstream_requests() - requests_before, 6)
+
+    def test_rejects_empty_and_oversized_batches(self):
+        self.assertEqual(self.post_batch([]).status_code, 400)
+        self.assertEqual(self.post_batch(TRIP).status_code, 400)
+        with override_settings(TRIP_BATCH_MAX_SIZE=2):
+            response = self.post_batch([TRIP] * 3)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Trip.objects.count(), 0)
+
+
+@override_settings(PLANNING_JOB_LOCAL_WORKERS=0)
+class PlanningJobTests(StandInTestCase):
+    def post_async(self, trip, **headers):
+        return self.client.post(
+            "/api/trips/?async=1", trip, content_type="application/json", **headers
+        )
+
+    def job_detail(self, response):
+        return self.client.get(response["Location"]).json()
+
+    def test_queued_trip_is_planned_by_a_worker(self):
+        response = self.post_async(TRIP)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.job_detail(response)["status"], PlanningJob.PENDING)
+
+        run_pending_jobs(burst=True)
+        job = self.job_detail(response)
+        self.assertEqual(job["status"], PlanningJob.SUCCEEDED)
+        self.assertEqual(job["attempts"], 1)
+        trip = self.client.get(job["trip_url"])
+        self.assertEqual(trip.status_code, 200)
+        self.assertEqual(trip.json()["pickup_location"], TRIP["pickup_location"])
+
+    def test_failed_planning_is_recorded_on_the_job(self):
+        response = self.post_async(dict(TRIP, pickup_location="!!!"))
+        run_pending_jobs(burst=True)
+        job = self.job_detail(response)
+        self.assertEqual(job["status"], PlanningJob.FAILED)
+        self.assertIn("!!!", job["error"])
+        self.assertIsNone(job["trip"])
+        self.assertEqual(Trip.objects.count(), 0)
+
+    def running_job(self, attempts, minutes_ago):
+        started_at = timezone.now() - datetime.timedelta(minutes=minutes_ago)
+        return PlanningJob.objects.create(
+            payload={},
+            status=PlanningJob.RUNNING,
+            attempts=attempts,
+            started_at=started_at,
+            heartbeat_at=started_at,
+        )
+
+    @override_settings(PLANNING_JOB_STALE_SECONDS=600, PLANNING_JOB_MAX_ATTEMPTS=3)
+    def test_stale_jobs_are_retried_then_failed(self):
+        self.running_job(attempts=1, minutes_ago=1)
+        self.assertIsNone(claim_next_job())
+
+        stale = self.running_job(attempts=2, minutes_ago=20)
+        exhausted = self.running_job(attempts=3, minutes_ago=20)
+        claimed = claim_next_job()
+        self.assertEqual(claimed.pk, stale.pk)
+        self.assertEqual(claimed.attempts, 3)
+        self.assertIsNone(claim_next_job())
+
+        exhausted.refresh_from_db()
+        self.assertEqual(exhausted.status, PlanningJob.FAILED)
+        self.assertEqual(
+            exhausted.error, "Trip planning failed: worker died after 3 attempts"
+        )
+        self.assertIsNotNone(exhausted.finished_at)
+
+    @override_settings(
+        PLANNING_JOB_STALE_SECONDS=60, PLANNING_JOB_HEARTBEAT_SECONDS=0.01
+    )
+    def test_long_running_job_is_kept_alive_by_its_heartbeat(self):
+        self.post_async(TRIP)
+        job = claim_next_job()
+        long_ago = timezone.now() - datetime.timedelta(minutes=20)
+        PlanningJob.objects.filter(pk=job.pk).update(heartbeat_at=long_ago)
+        reclaimed = []
+
+        def slow_create_trip(validated_data):
+            deadline = time.monotonic() + 5
+            while PlanningJob.objects.filter(pk=job.pk, heartbeat_at=long_ago).exists():
+                if time.monotonic() > deadline:
+                    raise AssertionError("heartbeat never refreshed")
+                time.sleep(0.01)
+            reclaimed.append(claim_next_job())
+            raise RuntimeError("done")
+
+        with mock.patch("trip_planner.jobs.create_trip", slow_create_trip):
+            run_job(job)
+        self.assertEqual(reclaimed, [None])
+        job.refresh_from_db()
+        self.assertEqual(job.status, PlanningJob.FAILED)
+        self.assertEqual(job.attempts, 1)
+
+    def test_idempotency_key_is_released_if_queueing_fails(self):
+        with mock.patch(
+            "trip_planner.views.enqueue_trip", side_effect=RuntimeError("db down")
+        ):
+            with self.assertRaises(RuntimeError):
+                self.post_async(TRIP, HTTP_IDEMPOTENCY_KEY="queue-1")
+        self.assertFalse(IdempotencyKey.objects.filter(key="queue-1").exists())
+
+        response = self.post_async(TRIP, HTTP_IDEMPOTENCY_KEY="queue-1")
+        self.assertEqual(response.status_code, 202)
+
+
+class AsyncPlanTripTests(StandInTestCase):
+    def test_matches_the_sync_create_and_closes_its_client(self):
+        closed = []
+        real_aclose = geoapify.AsyncGeoapifyClient.aclose
+
+        async def aclose(client):
+            closed.append(client)
+            await real_aclose(client)
+
+        with mock.patch.object(geoapify.AsyncGeoapifyClient, "aclose", aclose):
+            response = self.client.post(
+                "/api/trips/plan/", TRIP, content_type="application/json"
+            )
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(len(closed), 1)
+        self.assertTrue(closed[0].client.is_closed)
+        self.assertEqual(len(geoapify._async_clients), 0)
+
+        sync_response = self.client.post(
+            "/api/trips/", TRIP, content_type="application/json"
+        )
+        planned, created = response.json(), sync_response.json()
+        self.assertEqual(planned.keys(), created.keys())
+        for field in ("total_distance_miles", "driving_hours", "fuel_stop_count"):
+            self.assertEqual(planned[field], created[field])
+        self.assertEqual(
+            [s["segment_type"] for s in planned["segments"]],
+            [s["segment_type"] for s in created["segments"]],
+        )
+
+    def test_planning_errors_are_reported(self):
+        response = self.client.post(
+            "/api/trips/plan/",
+            dict(TRIP, pickup_location="!!!"),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("!!!", response.json()["error"])
+        self.assertEqual(self.client.get("/api/trips/plan/").status_code, 405)
+
+
+class TelemetryTests(StandInTestCase):
+    def test_spans_follow_the_trace_into_pool_threads(self):
+        def geocode():
+            with span("geocode"):
+                pass
+
+        trace = Trace()
+        token = _current_trace.set(trace)
+        try:
+            with span("route"):
+                pass
+            with concurrent.futures.ThreadPoolExecutor(2) as pool:
+                futures = [submit_in_context(pool, geocode) for _ in range(2)]
+                concurrent.futures.wait(futures)
+        finally:
+            _current_trace.reset(token)
+        self.assertEqual(list(trace.totals()), ["route", "geocode"])
+        self.assertEqual(trace.totals()["geocode"][1], 2)
+        header = server_timing(trace)
+        self.assertRegex(
+            header, r'^route;dur=[\d.]+, geocode;dur=[\d.]+;desc="2 calls"'
+        )
+        self.assertRegex(header, r"total;dur=[\d.]+$")
+
+    @override_settings(METRICS_TOKEN="scrape-token")
+    def test_create_reports_phases_and_metrics(self):
+        response = self.client.post(
+            "/api/trips/", TRIP, content_type="application/json"
+        )
+        header = response["Server-Timing"]
+        for phase in ("geocode", "route", "simulate", "persist", "db", "total"):
+            self.assertIn(f"{phase};dur=", header)
+
+        metrics = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer scrape-token")
+        self.assertEqual(metrics.status_code, 200)
+        body = metrics.content.decode()
+        self.assertIn('trip_planner_phase_seconds_count{phase="simulate"}', body)
+        self.assertIn("trip_planner_request_seconds_bucket", body)
+
+    @override_settings(METRICS_TOKEN="scrape-token")
+    def test_metrics_and_stats_need_the_token_or_staff(self):
+        for path in ("/metrics", "/api/planner/stats/"):
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get(path).status_code, 403)
+                self.assertEqual(
+                    self.client.get(
+                        path, HTTP_AUTHORIZATION="Bearer wrong-token"
+                    ).status_code,
+                    403,
+                )
+                self.assertEqual(
+                    self.client.get(
+                        path, HTTP_AUTHORIZATION="Bearer scrape-token"
+                    ).status_code,
+                    200,
+                )
+
+        user = User.objects.create_user("ops", is_staff=False)
+        self.client.force_login(user)
+        self.assertEqual(self.client.get("/api/planner/stats/").status_code, 403)
+        User.objects.filter(pk=user.pk).update(is_staff=True)
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
+        self.assertEqual(self.client.get("/api/planner/stats/").status_code, 200)
+
+    def test_metrics_are_staff_only_without_a_token(self):
+        self.assertEqual(
+            self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer ").status_code, 403
+        )
+
+    def test_json_formatter_includes_extras(self):
+        record = logging.LogRecord(
+            "trip_planner", logging.INFO, __file__, 1, "took %d ms", (12,), None
+        )
+        record.db_queries = 3
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry["message"], "took 12 ms")
+        self.assertEqual(entry["level"], "INFO")
+        self.assertEqual(entry["db_queries"], 3)
+        self.assertNotIn("args", entry)
+
+
+class BenchmarkTests(SimpleTestCase):
+    def test_measure(self):
+        calls = []
+        stats = benchmarks.measure(
+            lambda: calls.append(1), min_rounds=5, max_rounds=8, min_seconds=0
+        )
+        # One untimed warm-up call, then the timed rounds
+        self.assertEqual(stats["rounds"], 5)
+        self.assertEqual(len(calls), 6)
+        self.assertLessEqual(stats["min"], stats["median"])
+        self.assertLessEqual(stats["median"], stats["max"])
+
+    def test_compare_pairs_cases_by_name_and_params(self):
+        def report(*results):
+            return {
+                "results": [dict(zip(("name", "params", "median"), r)) for r in results]
+            }
+
+        rows = benchmarks.compare(
+            report(("hos", {"miles": 1}, 2.0), ("hos", {"miles": 2}, 1.0)),
+            report(("hos", {"miles": 2}, 1.5), ("eld", {}, 1.0)),
+        )
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["params"], {"miles": 2})
+        self.assertEqual(rows[0]["ratio"], 1.5)
+
+    def test_suites_run_on_an_isolated_database(self):
+        isolated = []
+
+        @contextlib.contextmanager
+        def isolated_database():
+            isolated.append(True)
+            yield
+
+        def suite():
+            self.assertEqual(isolated, [True])
+            yield {"name": "fake", "params": {}, "median": 1.0}
+
+        with mock.patch.object(benchmarks, "isolated_database", isolated_database):
+            with mock.patch.dict(benchmarks.SUITES, {"fake": suite}):
+                report = benchmarks.run_benchmarks(suites=["fake"])
+        self.assertEqual(isolated, [True])
+        self.assertEqual([r["name"] for r in report["results"]], ["fake"])
+
+
+class PlanningBenchmarkTests(StandInTestCase):
+    def test_sync_and_async_planners_are_measured_side_by_side(self):
+        measure = benchmarks.measure
+
+        def one_round(func, **options):
+            return measure(func, min_rounds=1, max_rounds=1, min_seconds=0)
+
+        with mock.patch.object(benchmarks, "measure", one_round):
+            results = list(benchmarks.bench_planning(concurrency=(2,), latency_ms=0))
+        self.assertEqual(
+            [r["name"] for r in results], ["planning.sync", "planning.async"]
+        )
+        self.assertEqual(results[0]["params"], results[1]["params"])
+        self.assertEqual(results[0]["params"]["trips"], 2)
+
+
+def at(day, hour, minute=0):
+    return datetime.datetime(2026, 3, day, hour, minute, tzinfo=datetime.timezone.utc)
+
+
+class DailyLogTests(SimpleTestCase):
+    def segment(self, kind, start, end, location="Somewhere"):
+        return {
+            "type": kind,
+            "start_time": start,
+            "end_time": end,
+            "start_location": location,
+        }
+
+    def test_segments_are_split_at_midnight_and_gaps_filled(self):
+        logs = build_daily_logs(
+            [
+                self.segment("DRIVE", at(2, 20), at(2, 22, 30), "Chicago"),
+                self.segment("REST", at(2, 22, 30), at(3, 8, 30), "Iowa"),
+                self.segment("DROPOFF", at(3, 8, 30), at(3, 9, 30), "Omaha"),
+            ]
+        )
+        self.assertEqual(list(logs), ["2026-03-02", "2026-03-03"])
+        first, second = logs["2026-03-02"], logs["2026-03-03"]
+        self.assertEqual(
+            [
+                (e["status"], e["start_time"], e["end_time"])
+                for e in first["status_timeline"]
+            ],
+            [
+                ("OFF", "00:00", "20:00"),
+                ("D", "20:00", "22:30"),
+                ("SB", "22:30", "23:59"),
+            ],
+        )
+        self.assertEqual(first["status_timeline"][0]["notes"], "Gap Fill")
+        self.assertEqual(
+            first["hours_summary"], {"D": 2.5, "ON": 0.0, "OFF": 20.0, "SB": 1.5}
+        )
+        self.assertEqual(
+            [
+                (e["status"], e["start_time"], e["end_time"])
+                for e in second["status_timeline"]
+            ],
+            [
+                ("SB", "00:00", "08:30"),
+                ("ON", "08:30", "09:30"),
+                ("OFF", "09:30", "23:59"),
+            ],
+        )
+        self.assertEqual(second["status_timeline"][-1]["location"], "Omaha")
+
+    def test_every_day_adds_up_to_24_hours(self):
+        result = simulate_trip([leg(900, "PICKUP"), leg(1800)], hos_state())
+        logs = build_daily_logs(result.segments)
+        self.assertGreater(len(logs), 3)
+        for log in logs.values():
+            self.assertAlmostEqual(sum(log["hours_summary"].values()), 24, places=1)
+            timeline = log["status_timeline"]
+            self.assertEqual(timeline[0]["start_time"], "00:00")
+            self.assertEqual(timeline[-1]["end_time"], "23:59")
+            for before, after in zip(timeline, timeline[1:]):
+                self.assertEqual(before["end_time"], after["start_time"])
+
+
+class PolylineTests(SimpleTestCase):
+    # The example from Google's polyline format documentation, in [lon, lat] order
+    POINTS = [[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]]
+    ENCODED = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+    def test_encodes_the_reference_example(self):
+        self.assertEqual(polyline.encode(self.POINTS), self.ENCODED)
+        self.assertEqual(polyline.decode(self.ENCODED), self.POINTS)
+
+    def test_round_trips_at_other_precisions(self):
+        points = [[-87.623177, 41.881832], [-104.990251, 39.739236]]
+        self.assertEqual(polyline.decode(polyline.encode(points, 6), 6), points)
+        self.assertEqual(polyline.decode(""), [])
+
+
+class TripGeometryTests(StandInTestCase):
+    def geometry(self, trip_id, **params):
+        return self.client.get(f"/api/trips/{trip_id}/geometry/", params)
+
+    def test_geometry_is_stored_once_per_leg(self):
+        trip_id = self.client.post(
+            "/api/trips/", TRIP, content_type="application/json"
+        ).json()["id"]
+
+        encoded = self.geometry(trip_id).json()
+        self.assertEqual(encoded["encoding"], "polyline")
+        self.assertEqual(encoded["precision"], 5)
+        self.assertEqual(len(encoded["legs"]), 2)
+        decoded = [polyline.decode(leg) for leg in encoded["legs"]]
+        self.assertEqual(encoded["point_count"], sum(map(len, decoded)))
+        west, south, east, north = encoded["bbox"]
+        for lon, lat in decoded[0] + decoded[1]:
+            self.assertTrue(west <= lon <= east and south <= lat <= north)
+
+        geojson = self.geometry(trip_id, encoding="geojson").json()
+        self.assertEqual(geojson["geometry"]["type"], "MultiLineString")
+        self.assertEqual(geojson["geometry"]["coordinates"], decoded)
+
+    def test_errors(self):
+        trip_id = self.client.post(
+            "/api/trips/", TRIP, content_type="application/json"
+        ).json()["id"]
+        self.assertEqual(self.geometry(trip_id, encoding="wkt").status_code, 400)
+        self.assertEqual(self.geometry(trip_id + 1).status_code, 404)
+
+        Trip.objects.get(pk=trip_id).geometry.delete()
+        response = self.geometry(trip_id)
+        self.assertEqual(response.status_code, 404)
+        self.assertIn("No route geometry", response.json()["error"])
+
+
+class SimplifyTests(SimpleTestCase):
+    def test_drops_only_vertices_within_tolerance(self):
+        # 0.001 degrees of latitude is about 111 m
+        line = [[0.0, 0.0], [0.25, 0.0], [0.5, 0.001], [0.75, 0.0], [1.0, 0.0]]
+        self.assertEqual(
+            simplify(line, 100).tolist(), [[0.0, 0.0], [0.5, 0.001], [1.0, 0.0]]
+        )
+        self.assertEqual(simplify(line, 200).tolist(), [[0.0, 0.0], [1.0, 0.0]])
+        self.assertEqual(simplify(line, 0).tolist(), line)
+        self.assertEqual(simplify(line[:2], 1e6).tolist(), line[:2])
+
+    def test_budget_doubles_the_tolerance(self):
+        zigzag = [[i * 0.01, 0.001 * (i % 2) * (1 + i / 100)] for i in range(200)]
+        coords, tolerance = simplify_to_budget(zigzag, 1.0, 20)
+        self.assertLessEqual(len(coords), 20)
+        self.assertEqual(coords[0].tolist(), zigzag[0])
+        self.assertEqual(coords[-1].tolist(), zigzag[-1])
+        self.assertGreater(tolerance, 1.0)
+        self.assertEqual(tolerance, 2 ** round(math.log2(tolerance)))
+        self.assertGreater(len(simplify(zigzag, tolerance / 2)), 20)
+
+    def test_zoom_tolerance_halves_per_level(self):
+        self.assertAlmostEqual(zoom_tolerance_meters(0), 78_271.5, places=1)
+        self.assertAlmostEqual(zoom_tolerance_meters(10) * 2, zoom_tolerance_meters(9))
+
+
+class GeometryZoomTests(StandInTestCase):
+    route_points = 400
+
+    def setUp(self):
+        super().setUp()
+        self.trip_id = self.client.post(
+            "/api/trips/", TRIP, content_type="application/json"
+        ).json()["id"]
+
+    def geometry(self, **params):
+        return self.client.get(f"/api/trips/{self.trip_id}/geometry/", params)
+
+    def test_zoom_picks_the_coarsest_level_that_looks_exact(self):
+        full = self.geometry().json()
+        self.assertIsNone(full["zoom"])
+        self.assertIsNone(full["tolerance_meters"])
+
+        coarse = self.geometry(zoom=5).json()
+        self.assertEqual(coarse["zoom"], 6)
+        self.assertEqual(coarse["tolerance_meters"], round(zoom_tolerance_meters(6), 2))
+        self.assertLess(coarse["point_count"], full["point_count"])
+        self.assertEqual(
+            coarse["point_count"], sum(len(polyline.decode(l)) for l in coarse["legs"])
+        )
+        # Past the finest stored level, the full line is returned
+        self.assertIsNone(self.geometry(zoom=13).json()["zoom"])
+
+    def test_rejects_bad_zooms(self):
+        for zoom in ("-1", "25", "street"):
+            self.assertEqual(self.geometry(zoom=zoom).status_code, 400)
+
+
+class TripListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.trips = []
+        for i in range(5):
+            trip = Trip.objects.create(
+                current_location=f"Start {i}",
+                pickup_location="Denver, CO",
+                dropoff_location="Los Angeles, CA",
+                current_cycle_used=i,
+                total_distance_miles=100.0 * i,
+            )
+            Trip.objects.filter(pk=trip.pk).update(created_at=at(1, 8 + i))
+            cls.trips.append(trip.pk)
+
+    def test_pages_run_newest_first(self):
+        page = self.client.get("/api/trips/", {"page_size": 2}).json()
+        seen = [trip["id"] for trip in page["results"]]
+        while page["next"]:
+            page = self.client.get(page["next"]).json()
+            seen += [trip["id"] for trip in page["results"]]
+        self.assertEqual(seen, self.trips[::-1])
+
+    def test_lists_summaries_without_segments(self):
+        trip = self.client.get("/api/trips/").json()["results"][0]
+        self.assertNotIn("segments", trip)
+        self.assertNotIn("eld_logs", trip)
+        self.assertEqual(trip["current_location"], "Start 4")
+        self.assertEqual(trip["total_distance_miles"], 400.0)
+        for field in TRIP_SUMMARY_FIELDS:
+            self.assertIn(field, trip)
+
+    def test_ids_come_back_in_the_order_given(self):
+        first, second = self.trips[0], self.trips[3]
+        response = self.client.get(
+            "/api/trips/", {"ids": f"{second},{first},0,{second}"}
+        )
+        results = response.json()["results"]
+        self.assertEqual([trip["id"] for trip in results], [second, first])
+        self.assertIn("segments", results[0])
+
+    def test_bad_ids(self):
+        self.assertEqual(
+            self.client.get("/api/trips/", {"ids": "1,two"}).status_code, 400
+        )
+        too_many = ",".join(str(i) for i in range(MAX_TRIP_IDS + 1))
+        self.assertEqual(
+            self.client.get("/api/trips/", {"ids": too_many}).status_code, 400
+        )
+
+
+class TripSummaryTests(StandInTestCase):
+    def assert_summary_matches_segments(self, trip):
+        segments = [
+            {
+                "type": segment.segment_type,
+                "distance_miles": segment.distance_miles,
+                "duration_hours": segment.estimated_duration_hours,
+                "start_time": segment.start_time,
+                "end_time": segment.end_time,
+            }
+            for segment in trip.segments.all()
+        ]
+        state = hos_state(cycle_used=trip.current_cycle_used)
+        state.remaining_cycle = 70 - trip.cycle_used_at_arrival
+        expected = summarize_trip(segments, state)
+        for field in TRIP_SUMMARY_FIELDS:
+            self.assertAlmostEqual(
+                getattr(trip, field), expected[field], places=6, msg=field
+            )
+
+    def test_single_and_batch_creates_store_the_plan_totals(self):
+        created = self.client.post("/api/trips/", TRIP, content_type="application/json")
+        batch = self.client.post(
+            "/api/trips/batch/", [TRIP], content_type="application/json"
+        )
+        single = Trip.objects.get(pk=created.json()["id"])
+        batched = Trip.objects.get(pk=batch.json()["results"][0]["trip"]["id"])
+        self.assert_summary_matches_segments(single)
+        self.assert_summary_matches_segments(batched)
+        self.assertGreater(single.fuel_stop_count, 0)
+        self.assertGreater(single.cycle_used_at_arrival, TRIP["current_cycle_used"])
+        for field in TRIP_SUMMARY_FIELDS:
+            if field != "arrival_time":
+                self.assertEqual(getattr(batched, field), getattr(single, field))
+
+
+def as_json(data, renderer=JSONRenderer):
+    return json.loads(renderer().render(data))
+
+
+class ReadPathTests(StandInTestCase):
+    def test_payloads_match_the_serializers(self):
+        trip_id = self.client.post(
+            "/api/trips/", TRIP, content_type="application/json"
+        ).json()["id"]
+        trip = Trip.objects.prefetch_related("segments", "eld_logs").get(pk=trip_id)
+        expected = as_json(TripSerializer(trip).data)
+
+        self.assertEqual(json.loads(dumps(trip_payload(trip_id))), expected)
+        self.assertEqual(json.loads(dumps(trip_payload_from(trip))), expected)
+        self.assertEqual(self.client.get(f"/api/trips/{trip_id}/").json(), expected)
+        self.assertEqual(
+            json.loads(dumps(list(trip_summaries(Trip.objects.all())))),
+            as_json(TripSummarySerializer(Trip.objects.all(), many=True).data),
+        )
+
+
+class RendererTests(SimpleTestCase):
+    def test_renders_like_drf(self):
+        data = {
+            "when": datetime.datetime(2026, 3, 2, 8, 0, tzinfo=datetime.timezone.utc),
+            "day": datetime.date(2026, 3, 2),
+            "miles": np.float64(1.5),
+            "price": decimal.Decimal("2.50"),
+            "name": "Zürich",
+        }
+        rendered = FastJSONRenderer().render(data)
+        self.assertEqual(
+            json.loads(rendered),
+            {
+                "when": "2026-03-02T08:00:00Z",
+                "day": "2026-03-02",
+                "miles": 1.5,
+                "price": 2.5,
+                "name": "Zürich",
+            },
+        )
+        self.assertIn("Zürich".encode(), rendered)
+        self.assertNotIn(b" ", rendered.replace("Zürich".encode(), b""))
+
+    def test_indented_requests_fall_back_to_drf(self):
+        data = {"a": [1, 2]}
+        rendered = FastJSONRenderer().render(data, "application/json; indent=2", {})
+        self.assertEqual(
+            rendered, JSONRenderer().render(data, "application/json; indent=2", {})
+        )
+        self.assertIn(b"\n  ", rendered)
+        self.assertEqual(FastJSONRenderer().render(None), b"")
+
+
+class TripResponseCacheTests(StandInTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = "/api/trips/{}/".format(
+            self.client.post(
+                "/api/trips/", TRIP, content_type="application/json"
+            ).json()["id"]
+        )
+
+    def test_conditional_get(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        etag = first["ETag"]
+        self.assertEqual(first["Cache-Control"], "no-cache")
+        self.assertIn("Accept, Accept-Encoding", first["Vary"])
+
+        for if_none_match in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=if_none_match)
+            self.assertEqual(response.status_code, 304, if_none_match)
+            self.assertEqual(response.content, b"")
+            self.assertEqual(response["ETag"], etag)
+        self.assertEqual(
+            self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"').status_code, 200
+        )
+
+    def test_gzip_body_is_the_same_json(self):
+        plain = self.client.get(self.url)
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        with assert_query_budget(RETRIEVE_CACHED_BUDGET):
+            zipped = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(zipped["Content-Encoding"], "gzip")
+        self.assertEqual(zipped["ETag"], plain["ETag"])
+        self.assertEqual(gzip.decompress(zipped.content), plain.content)
+        self.assertLess(len(zipped.content), len(plain.content))
+
+    def test_delete_invalidates_the_cached_body(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(self.client.delete(self.url).status_code, 204)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_update_invalidates_the_cached_body(self):
+        before = self.client.get(self.url)
+        self.assertEqual(before.json()["current_location"], TRIP["current_location"])
+        response = self.client.patch(
+            self.url, {"current_location": "Gary, IN"}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        after = self.client.get(self.url)
+        self.assertEqual(after.json()["current_location"], "Gary, IN")
+        self.assertNotEqual(after["ETag"], before["ETag"])
+        self.assertEqual(
+            self.client.get(self.url, HTTP_IF_NONE_MATCH=before["ETag"]).status_code,
+            200,
+        )
+
+
+class IdempotencyKeyTests(StandInTestCase):
+    def post(self, trip, key, url="/api/trips/"):
+        return self.client.post(
+            url, trip, content_type="application/json", HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_retry_replays_the_first_response(self):
+        first = self.post(TRIP, "trip-1")
+        self.assertEqual(first.status_code, 201)
+        requests_made = self.upstream_requests()
+        for url in ("/api/trips/", "/api/trips/plan/"):
+            retry = self.post(dict(TRIP, current_location="chicago il"), "trip-1", url)
+            self.assertEqual(retry.status_code, 201)
+            self.assertEqual(retry["Idempotent-Replayed"], "true")
+            self.assertEqual(retry.json(), first.json())
+        self.assertEqual(self.upstream_requests(), requests_made)
+        self.assertEqual(Trip.objects.count(), 1)
+
+    def test_key_reused_for_another_request(self):
+        self.assertEqual(self.post(TRIP, "trip-2").status_code, 201)
+        response = self.post(dict(TRIP, current_cycle_used=11), "trip-2")
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Trip.objects.count(), 1)
+
+    def test_key_still_being_planned(self):
+        validated = TripCreateSerializer(data=TRIP)
+        validated.is_valid(raise_exception=True)
+        IdempotencyKey.objects.create(
+            key="trip-3",
+            request_hash=plan_request_key(validated.validated_data),
+            created_at=timezone.now(),
+        )
+        self.assertEqual(self.post(TRIP, "trip-3").status_code, 409)
+        self.assertEqual(self.post(TRIP, "").status_code, 400)
+
+    def test_failed_request_releases_its_key(self):
+        failing = dict(TRIP, pickup_location="!!!")
+        for url in ("/api/trips/", "/api/trips/plan/"):
+            self.assertEqual(self.post(failing, "trip-4", url).status_code, 400)
+            self.assertFalse(IdempotencyKey.objects.filter(key="trip-4").exists())
+
+    @override_settings(IDEMPOTENCY_KEY_TTL_SECONDS=3600)
+    def test_expired_keys_are_pruned(self):
+        now = timezone.now()
+        for key, age in (("old-1", 7200), ("old-2", 4000), ("fresh", 60)):
+            IdempotencyKey.objects.create(
+                key=key,
+                request_hash="x",
+                created_at=now - datetime.timedelta(seconds=age),
+            )
+        self.assertEqual(prune_idempotency_keys(), 2)
+        self.assertEqual(
+            list(IdempotencyKey.objects.values_list("key", flat=True)), ["fresh"]
+        )
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_calls_share_one_run(self):
+        flight, started, release = SingleFlight(), threading.Event(), threading.Event()
+        calls = []
+
+        def work():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return "planned"
+
+        with concurrent.futures.ThreadPoolExecutor(3) as pool:
+            leader = pool.submit(flight.do, "trip", work)
+            started.wait(5)
+            followers = [pool.submit(flight.do, "trip", work) for _ in range(2)]
+            while flight.stats()["followers"] < 2:
+                time.sleep(0.001)
+            release.set()
+            self.assertEqual(leader.result(), ("planned", False))
+            self.assertEqual([f.result() for f in followers], [("planned", True)] * 2)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+    def test_followers_get_the_leaders_error(self):
+        flight = AsyncSingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("no route")
+
+        async def main():
+            return await asyncio.gather(
+                flight.do("trip", fail), flight.do("trip", fail), return_exceptions=True
+            )
+
+        errors = asyncio.run(main())
+        self.assertEqual([str(e) for e in errors], ["no route", "no route"])
+
+    async def join(self, flight, work):
+        """Start a ``flight.do`` task and wait until it is following the leader."""
+        followers = flight.stats()["followers"]
+        task = asyncio.create_task(flight.do("trip", work))
+        while flight.stats()["followers"] == followers:
+            await asyncio.sleep(0)
+        return task
+
+    def test_follower_takes_over_from_a_cancelled_leader(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            if len(calls) == 1:
+                await asyncio.Event().wait()  # The first call only ends when cancelled
+            return "planned"
+
+        async def main():
+            leader = asyncio.create_task(flight.do("trip", work))
+            follower = await self.join(flight, work)
+            leader.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            return await follower
+
+        self.assertEqual(asyncio.run(main()), ("planned", False))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+    def test_cancelled_follower_leaves_the_leader_running(self):
+        flight = AsyncSingleFlight()
+
+        async def main():
+            release = asyncio.Event()
+
+            async def work():
+                await release.wait()
+                return "planned"
+
+            leader = asyncio.create_task(flight.do("trip", work))
+            follower = await self.join(flight, work)
+            follower.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await follower
+            release.set()
+            return await leader
+
+        self.assertEqual(asyncio.run(main()), ("planned", False))
+
+
+class PlanCacheTests(StandInTestCase):
+    def test_fresh_and_cached_routes_have_the_same_geometry(self):
+        line = {
+            "type": "MultiLineString",
+            "coordinates": [
+                [[-87.6298123, 41.8781136], [-88.123456789, 41.5], [-89.0, 41.0]]
+            ],
+        }
+        simplified = _simplify_geometry(line)
+        part = simplified["coordinates"][0]
+        self.assertEqual(part, polyline.decode(polyline.encode(part)))
+        self.assertEqual(part[0], [-87.62981, 41.87811])
+
+    def test_repeat_plan_is_served_from_the_plan_cache(self):
+        trip = dict(TRIP, departure_time="2026-03-02T08:00:00Z")
+        with mock.patch(
+            "trip_planner.route_planner.simulate_trip", wraps=simulate_trip
+        ) as simulate:
+            first = self.client.post(
+                "/api/trips/", trip, content_type="application/json"
+            )
+            # The second plan's routes come from the route cache, decoded from polylines
+            self.assertGreater(len(route_cache.memory), 0)
+            second = self.client.post(
+                "/api/trips/", trip, content_type="application/json"
+            )
+        self.assertEqual(simulate.call_count, 1)
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        first, second = first.json(), second.json()
+        for field in TRIP_SUMMARY_FIELDS:
+            self.assertEqual(second[field], first[field])
+        for nested in ("segments", "eld_logs"):
+            self.assertEqual(
+                [dict(row, id=None, trip=None) for row in second[nested]],
+                [dict(row, id=None, trip=None) for row in first[nested]],
+            )
+
+
+class SaveTripTests(StandInTestCase):
+    def test_failed_persist_saves_nothing(self):
+        with mock.patch.object(
+            ELDLog.objects, "bulk_create", side_effect=DatabaseError("disk full")
+        ):
+            response = self.client.post(
+                "/api/trips/", TRIP, content_type="application/json"
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("disk full", response.json()["error"])
+        for model in (Trip, RouteSegment, ELDLog, TripGeometry):
+            self.assertEqual(model.objects.count(), 0, model.__name__)
+
+    def test_create_response_matches_a_later_get(self):
+        created = self.client.post("/api/trips/", TRIP, content_type="application/json")
+        self.assertEqual(created.status_code, 201)
+        trip_id = created.json()["id"]
+        self.assertEqual(
+            self.client.get(f"/api/trips/{trip_id}/").json(), created.json()
+        )
+        self.assertEqual(
+            RouteSegment.objects.filter(trip_id=trip_id).count(),
+            len(created.json()["segments"]),
+        )
+        self.assertTrue(TripGeometry.objects.filter(trip_id=trip_id).exists())
@@ -1,11 +1,19 @@
 # trip_planner/urls.py
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import TripViewSet
+from .views import TripViewSet, plan_trip, planner_stats, planning_job_detail
 
 router = DefaultRouter()
 router.register("trips", TripViewSet)
 
 urlpatterns = [
+    path("planner/stats/", planner_stats, name="planner-stats"),
+    # Before the router, which would otherwise read these as trip ids
+    path("trips/plan/", plan_trip, name="trip-plan"),
+    path(
+        "trips/jobs/<uuid:pk>/",
+        planning_job_detail,
+        name="planning-job-detail",
+    ),
     path("", include(router.urls)),
 ]
@@ -1,164 +1,125 @@
 # trip_planner/views.py
 from rest_framework import viewsets, status
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.permissions import BasePermission
 from rest_framework.response import Response
-import traceback  # For logging errors
-import datetime  # Import datetime for parsing check
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse
+import contextlib
+import json
+import logging
 
-from .models import Trip, RouteSegment, ELDLog
-from .serializers import TripSerializer, TripCreateSerializer
-from .route_planner import plan_route, generate_eld_logs
+from django.http import Http404
+from rest_framework.reverse import reverse
+from .models import Trip, PlanningJob, TripGeometry
+from .pagination import TripCursorPagination
+from .payloads import trip_payload, trip_payload_from, trip_payloads, trip_summaries
+from .renderers import dumps
+from .serializers import (
+    MAX_TRIP_IDS,
+    TripSerializer,
+    TripCreateSerializer,
+    TripGeometrySerializer,
+    TripSummarySerializer,
+    PlanningJobSerializer,
+)
+from .idempotency import (
+    IdempotencyError,
+    claim_idempotency_key,
+    complete_idempotency_key,
+    release_idempotency_key,
+)
+from .services import (
+    create_trip_async_coalesced,
+    create_trip_coalesced,
+    create_trips_batch,
+    plan_request_key,
+)
+from .jobs import enqueue_trip
+from .telemetry import DEDUPLICATED_CREATES, metrics_access_allowed, span
+from .cache import geocode_cache, plan_cache, route_cache, trip_response_cache
+from .geoapify import get_client, scoped_async_client
+
+logger = logging.getLogger(__name__)
+
+MAX_MAP_ZOOM = 24
+
+
+def wants_async(request):
+    """Async planning is opt-in, with ``?async=1`` or ``Prefer: respond-async``."""
+    if request.query_params.get("async", "").lower() in ("1", "true", "yes"):
+        return True
+    prefer = request.headers.get("Prefer", "")
+    return "respond-async" in [p.strip().lower() for p in prefer.split(",")]
 
 
 class TripViewSet(viewsets.ModelViewSet):
     # Optimize default queryset
     queryset = Trip.objects.all().prefetch_related("segments", "eld_logs")
+    pagination_class = TripCursorPagination
+
+    def get_queryset(self):
+        if self.action == "list":
+            # Summaries only: no segments or logs are loaded
+            return Trip.objects.all()
+        return super().get_queryset()
 
     def get_serializer_class(self):
-        if self.action == "create":
+        if self.action in ("create", "batch"):
             return TripCreateSerializer
-        # Use prefetch_related for list and retrieve for efficiency
-        if self.action in ["list", "retrieve"]:
-            self.queryset = Trip.objects.all().prefetch_related("segments", "eld_logs")
+        if self.action == "list":
+            return TripSummarySerializer
+        # The prefetching queryset comes from get_queryset, not from here
         return TripSerializer
 
     def create(self, request, *args, **kwargs):
-        print(f"\n{'*'*10} Received Trip Creation Request {'*'*10}")
-        print(f"Request Data: {request.data}")
+        logger.debug("Received trip creation request: %s", request.data)
         serializer = self.get_serializer(data=request.data)
         if not serializer.is_valid():
-            print(f"ERROR: Input data validation failed: {serializer.errors}")
+            logger.info("Input data validation failed: %s", serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        validated_data = serializer.validated_data
-        trip = None  # Initialize trip as None
+        entry = None
+        if "Idempotency-Key" in request.headers:
+            try:
+                entry, replay = claim_idempotency_key(
+                    request.headers["Idempotency-Key"],
+                    plan_request_key(serializer.validated_data),
+                )
+            except IdempotencyError as e:
+                return Response({"error": str(e)}, status=e.status)
+            if replay:
+                status_code, body, headers = _idempotent_replay(request, entry)
+                return Response(body, status=status_code, headers=headers)
+
+        if wants_async(request):
+            try:
+                job = enqueue_trip(serializer.validated_data)
+            except Exception:
+                if entry is not None:
+                    release_idempotency_key(entry)
+                raise
+            if entry is not None:
+                complete_idempotency_key(entry, job=job)
+            logger.info("Trip creation queued as job %s", job.pk)
+            return _job_accepted_response(request, job)
 
         try:
-            print("DEBUG: Starting route planning...")
-            route_data = plan_route(
-                validated_data["current_location"],
-                validated_data["pickup_location"],
-                validated_data["dropoff_location"],
-                validated_data["current_cycle_used"],
-            )
-            print("DEBUG: Route planning function finished.")
-
-            # If planning succeeds, save the Trip object
-            # Use validated_data to create the instance before saving if needed
-            trip = Trip.objects.create(**validated_data)
-            # trip = serializer.save() # Alternatively use serializer.save() if no extra fields needed
-            print(f"DEBUG: Trip object saved with ID: {trip.id}")
-
-            # Create RouteSegments in bulk
-            segments_to_create = []
-            if "segments" in route_data and route_data["segments"]:
-                print("DEBUG: Preparing segments for database save...")
-                for i, segment_data in enumerate(route_data["segments"]):
-                    start_coords = segment_data.get("start_coordinates")
-                    end_coords = segment_data.get("end_coordinates")
-                    segment_type = segment_data.get("type", "UNKNOWN")
-
-                    print(
-                        f"DEBUG: Processing Segment {i} (Type: {segment_type}) Raw Coords - Start: {start_coords}, End: {end_coords}"
-                    )
-
-                    # Basic validation for coordinates before saving
-                    if not (isinstance(start_coords, list) and len(start_coords) == 2):
-                        print(
-                            f"  WARNING: Segment {i} - Invalid start_coords format, saving as None."
-                        )
-                        start_coords = None
-                    if not (isinstance(end_coords, list) and len(end_coords) == 2):
-                        print(
-                            f"  WARNING: Segment {i} - Invalid end_coords format, saving as None."
-                        )
-                        end_coords = None
-
-                    # Check if datetime objects are present (should be from route_planner)
-                    start_time = segment_data.get("start_time")
-                    end_time = segment_data.get("end_time")
-                    if not isinstance(start_time, datetime.datetime) or not isinstance(
-                        end_time, datetime.datetime
-                    ):
-                        print(
-                            f"  CRITICAL WARNING: Segment {i} has invalid datetime objects! Start: {type(start_time)}, End: {type(end_time)}"
-                        )
-                        # Handle this error - maybe skip segment or raise exception
-                        continue  # Skip this segment
-
-                    print(
-                        f"  DEBUG: Segment {i} Values for DB - StartCoords: {start_coords}, EndCoords: {end_coords}"
-                    )
-
-                    segments_to_create.append(
-                        RouteSegment(
-                            trip=trip,
-                            start_location=segment_data.get(
-                                "start_location", "Unknown"
-                            ),
-                            end_location=segment_data.get("end_location", "Unknown"),
-                            start_coordinates=start_coords,  # Use validated/None coords
-                            end_coordinates=end_coords,  # Use validated/None coords
-                            distance_miles=segment_data.get("distance_miles", 0.0),
-                            estimated_duration_hours=segment_data.get(
-                                "duration_hours", 0.0
-                            ),
-                            segment_type=segment_type,
-                            start_time=start_time,  # Pass datetime object
-                            end_time=end_time,  # Pass datetime object
-                        )
-                    )
-                if segments_to_create:
-                    RouteSegment.objects.bulk_create(segments_to_create)
-                    print(
-                        f"DEBUG: Bulk created {len(segments_to_create)} route segments."
-                    )
-            else:
-                print("WARNING: No segments were generated by plan_route to save.")
-
-            # Generate and create ELD logs in bulk
-            print("DEBUG: Generating ELD logs...")
-            eld_logs_data = generate_eld_logs(
-                trip, route_data
-            )  # Pass the saved trip instance
-            logs_to_create = []
-            for log_date_str, log_data_dict in eld_logs_data.items():
-                try:
-                    log_date = datetime.datetime.strptime(
-                        log_date_str, "%Y-%m-%d"
-                    ).date()
-                    logs_to_create.append(
-                        ELDLog(trip=trip, date=log_date, log_data=log_data_dict)
-                    )
-                except ValueError:
-                    print(f"ERROR: Could not parse date for ELD log: {log_date_str}")
-
-            if logs_to_create:
-                ELDLog.objects.bulk_create(logs_to_create)
-                print(f"DEBUG: Bulk created {len(logs_to_create)} ELD logs.")
-            else:
-                print("DEBUG: No ELD logs generated.")
+            trip = create_trip_coalesced(serializer.validated_data)
+            if entry is not None:
+                complete_idempotency_key(entry, trip=trip)
 
-            # Retrieve the full trip data with related objects for the response
-            final_trip = Trip.objects.prefetch_related("segments", "eld_logs").get(
-                pk=trip.pk
-            )
-            final_serializer = TripSerializer(final_trip)
-            print(f"{'*'*10} Trip Creation Process Complete (ID: {trip.id}) {'*'*10}\n")
-            return Response(final_serializer.data, status=status.HTTP_201_CREATED)
+            # Built from the rows just saved; nothing is read back
+            data = _created_trip_detail(trip)
+            logger.info("Trip creation complete (ID: %s)", trip.id)
+            return Response(data, status=status.HTTP_201_CREATED)
 
         except Exception as e:
-            print("\n--- ERROR DURING TRIP CREATION / PLANNING ---")
-            traceback.print_exc()  # Print full stack trace to console
-            # Clean up trip only if it was partially created before the error
-            if trip and trip.pk:  # Check if trip has been saved (has primary key)
-                print(
-                    f"Attempting to clean up partially created Trip {trip.id} due to error."
-                )
-                try:
-                    trip.delete()
-                    print("Cleanup successful.")
-                except Exception as delete_e:
-                    print(f"Error during trip cleanup: {delete_e}")
+            logger.exception("Error during trip creation / planning")
+            if entry is not None:
+                release_idempotency_key(entry)
 
             # Return a more informative error response
             error_message = f"Trip planning failed: {str(e)}"
@@ -166,19 +127,336 @@ class TripViewSet(viewsets.ModelViewSet):
                 {"error": error_message}, status=status.HTTP_400_BAD_REQUEST
             )
 
-    # Add this method if you want to view details of a specific trip later
+    @action(detail=False, methods=["post"], url_path="batch")
+    def batch(self, request):
+        """Plan a list of trips at once; each item gets its own result and status."""
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response(
+                {"error": "Expected a non-empty list of trips."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(items) > settings.TRIP_BATCH_MAX_SIZE:
+            return Response(
+                {
+                    "error": f"A batch can hold at most {settings.TRIP_BATCH_MAX_SIZE} trips."
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        logger.info("Received batch of %d trips", len(items))
+
+        results = [None] * len(items)
+        valid_indexes, valid_data = [], []
+        for i, item in enumerate(items):
+            serializer = TripCreateSerializer(data=item)
+            if serializer.is_valid():
+                valid_indexes.append(i)
+                valid_data.append(serializer.validated_data)
+            else:
+                results[i] = {
+                    "index": i,
+                    "status": status.HTTP_400_BAD_REQUEST,
+                    "errors": serializer.errors,
+                }
+
+        created = {}
+        for i, (trip, error) in zip(valid_indexes, create_trips_batch(valid_data)):
+            if trip is not None:
+                created[i] = trip
+            else:
+                results[i] = {
+                    "index": i,
+                    "status": status.HTTP_400_BAD_REQUEST,
+                    "error": error,
+                }
+        with span("serialize"):
+            for i, trip in created.items():
+                results[i] = {
+                    "index": i,
+                    "status": status.HTTP_201_CREATED,
+                    "trip": trip_payload_from(trip),
+                }
+        logger.info("Batch complete: %d of %d trips created", len(created), len(items))
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=["get"], url_path="geometry")
+    def geometry(self, request, pk=None):
+        """The trip's stored route line.
+
+        ``?encoding=polyline`` (default) or ``geojson``; ``?zoom=N`` (0-24) returns the
+        line simplified for a map at that zoom.
+        """
+        encoding = request.query_params.get("encoding", "polyline").lower()
+        if encoding not in TripGeometrySerializer.ENCODINGS:
+            return Response(
+                {
+                    "error": "encoding must be one of: "
+                    + ", ".join(TripGeometrySerializer.ENCODINGS)
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        zoom = request.query_params.get("zoom")
+        if zoom is not None:
+            try:
+                zoom = float(zoom)
+            except ValueError:
+                zoom = None
+            if zoom is None or not 0 <= zoom <= MAX_MAP_ZOOM:
+                return Response(
+                    {"error": f"zoom must be a number from 0 to {MAX_MAP_ZOOM}."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+        # Looked up directly, so the trip's segments and logs are not loaded
+        geometry = TripGeometry.objects.filter(trip_id=pk).first()
+        if geometry is None:
+            if not Trip.objects.filter(pk=pk).exists():
+                raise Http404
+            return Response(
+                {"error": "No route geometry was stored for this trip."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        with span("serialize"):
+            data = TripGeometrySerializer(
+                geometry, context={"encoding": encoding, "zoom": zoom}
+            ).data
+        return Response(data)
+
     def retrieve(self, request, *args, **kwargs):
-        instance = self.get_object()
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        """The full trip, as a cached body with a strong ETag (conditional GETs get 304).
+
+        The browsable API (non-JSON renderers) skips the cache. Updates and deletes drop
+        the shared entry and this worker's copy; other workers keep serving theirs until
+        it expires (TRIP_RESPONSE_CACHE_MEMORY_TTL_SECONDS).
+        """
+        try:
+            pk = int(kwargs["pk"])
+        except ValueError:
+            raise Http404
+        if request.accepted_renderer.format != "json":
+            data = _trip_detail(pk)
+            if data is None:
+                raise Http404
+            return Response(data)
+        cached = trip_response_cache.get_or_build(pk, lambda: _trip_body(pk))
+        if cached is None:
+            raise Http404
+        return _cached_json_response(request, cached)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        trip_response_cache.delete(serializer.instance.pk)
+
+    def perform_destroy(self, instance):
+        trip_response_cache.delete(instance.pk)
+        instance.delete()
 
-    # Add this method if you want to list all trips
     def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
-        page = self.paginate_queryset(queryset)
+        """Trip summaries, newest first, a cursor page at a time.
+
+        ``?ids=1,2,3`` instead returns those trips in full, in the order given (unknown
+        ids are left out).
+        """
+        if "ids" in request.query_params:
+            return self._list_by_ids(request.query_params["ids"])
+        queryset = trip_summaries(self.filter_queryset(self.get_queryset()))
+        with span("serialize"):
+            page = self.paginate_queryset(queryset)
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+            return self.get_paginated_response(page)
+        return Response(list(queryset))
+
+    def _list_by_ids(self, raw_ids):
+        try:
+            ids = list(dict.fromkeys(int(i) for i in raw_ids.split(",") if i.strip()))
+        except ValueError:
+            return Response(
+                {"error": "ids must be a comma-separated list of trip ids."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(ids) > MAX_TRIP_IDS:
+            return Response(
+                {"error": f"At most {MAX_TRIP_IDS} ids can be fetched at once."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        with span("serialize"):
+            by_id = trip_payloads(ids)
+        return Response({"results": [by_id[i] for i in ids if i in by_id]})
+
+
+async def plan_trip(request):
+    """Native async trip create for ASGI workers (POST /api/trips/plan/).
+
+    Takes the same payload and returns the same body as POST /api/trips/, but waits on
+    Geoapify without holding a thread, so one worker can plan many trips at once. Under
+    a sync (WSGI) worker it still works, one request at a time.
+    """
+    if request.method != "POST":
+        return JsonResponse(
+            {"error": f'Method "{request.method}" not allowed.'}, status=405
+        )
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"error": "Request body must be JSON."}, status=400)
+
+    serializer = TripCreateSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+
+    entry = None
+    if "Idempotency-Key" in request.headers:
+        try:
+            entry, replay = await sync_to_async(claim_idempotency_key)(
+                request.headers["Idempotency-Key"],
+                plan_request_key(serializer.validated_data),
+            )
+        except IdempotencyError as e:
+            return JsonResponse({"error": str(e)}, status=e.status)
+        if replay:
+            status_code, body, headers = await sync_to_async(_idempotent_replay)(
+                request, entry
+            )
+            return HttpResponse(
+                dumps(body),
+                content_type="application/json",
+                status=status_code,
+                headers=headers,
+            )
+
+    # Under WSGI this view runs on a loop of its own, so it gets a client of its own
+    if isinstance(request, ASGIRequest):
+        upstream_client = contextlib.nullcontext()
+    else:
+        upstream_client = scoped_async_client()
+    try:
+        async with upstream_client:
+            trip = await create_trip_async_coalesced(serializer.validated_data)
+        if entry is not None:
+            await sync_to_async(complete_idempotency_key)(entry, trip=trip)
+        body = await sync_to_async(_created_trip_detail)(trip)
+    except Exception as e:
+        logger.exception("Error during async trip creation / planning")
+        if entry is not None:
+            await sync_to_async(release_idempotency_key)(entry)
+        return JsonResponse({"error": f"Trip planning failed: {str(e)}"}, status=400)
+    return HttpResponse(dumps(body), content_type="application/json", status=201)
+
+
+# Django 4.2's csrf_exempt decorator doesn't keep a view async, so mark it directly
+plan_trip.csrf_exempt = True
+
+
+def _job_accepted(request, job):
+    """Body and status URL for a queued planning job."""
+    job_serializer = PlanningJobSerializer(job, context={"request": request})
+    status_url = request.build_absolute_uri(
+        reverse("planning-job-detail", args=[job.pk])
+    )
+    return dict(job_serializer.data, status_url=status_url), status_url
+
+
+def _job_accepted_response(request, job):
+    body, status_url = _job_accepted(request, job)
+    return Response(
+        body, status=status.HTTP_202_ACCEPTED, headers={"Location": status_url}
+    )
+
+
+def _idempotent_replay(request, entry):
+    """``(status, body, headers)`` answering a retry with what its key produced."""
+    DEDUPLICATED_CREATES.labels("idempotency_key").inc()
+    logger.info("Replaying Idempotency-Key '%s'", entry.key)
+    headers = {"Idempotent-Replayed": "true"}
+    if entry.job_id:
+        body, status_url = _job_accepted(request, entry.job)
+        return status.HTTP_202_ACCEPTED, body, dict(headers, Location=status_url)
+    return status.HTTP_201_CREATED, _trip_detail(entry.trip_id), headers
+
+
+def _trip_detail(pk):
+    """A trip's full response body, or None if it doesn't exist."""
+    with span("serialize"):
+        return trip_payload(pk)
+
+
+def _created_trip_detail(trip):
+    """The response body of a trip services.save_trip just returned."""
+    with span("serialize"):
+        return trip_payload_from(trip)
+
+
+def _trip_body(pk):
+    data = _trip_detail(pk)
+    return dumps(data) if data is not None else None
+
+
+def _accepted_encodings(request):
+    """Content codings the client accepts (q > 0), lowercased."""
+    accepted = set()
+    for part in request.headers.get("Accept-Encoding", "").split(","):
+        coding, _, params = part.partition(";")
+        q = params.strip().lower()
+        if q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000"):
+            continue
+        if coding.strip():
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _cached_json_response(request, cached):
+    """Serve a TripResponseCache entry: 304 on a matching If-None-Match, else the
+    smallest body the client accepts."""
+    etag = cached["etag"]
+    if_none_match = request.headers.get("If-None-Match", "")
+    # If-None-Match uses weak comparison, so a W/ prefix still matches
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if etag in candidates or "*" in candidates:
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        accepted = _accepted_encodings(request)
+        if cached["br"] is not None and "br" in accepted:
+            body, encoding = cached["br"], "br"
+        elif "gzip" in accepted or "*" in accepted:
+            body, encoding = cached["gzip"], "gzip"
+        else:
+            body, encoding = cached["body"], None
+        response = HttpResponse(body, content_type="application/json")
+        if encoding:
+            response["Content-Encoding"] = encoding
+    response["ETag"] = etag
+    # Clients may keep the body but must revalidate, so deleted trips still 404
+    response["Cache-Control"] = "no-cache"
+    response["Vary"] = "Accept, Accept-Encoding"
+    return response
+
+
+class CanReadMetrics(BasePermission):
+    """Staff users, or scrapers with METRICS_TOKEN (see ``metrics_access_allowed``)."""
+
+    def has_permission(self, request, view):
+        return metrics_access_allowed(request)
+
+
+@api_view(["GET"])
+@permission_classes([CanReadMetrics])
+def planner_stats(request):
+    """Per-worker counters for the planner's upstream caches and Geoapify client."""
+    return Response(
+        {
+            "geocode_cache": geocode_cache.stats(),
+            "route_cache": route_cache.stats(),
+            "plan_cache": plan_cache.stats(),
+            "trip_response_cache": trip_response_cache.stats(),
+            "geoapify_client": get_client().stats(),
+        }
+    )
+
 
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+@api_view(["GET"])
+def planning_job_detail(request, pk):
+    """Status of an async trip-planning job, linking to the trip once it is saved."""
+    try:
+        job = PlanningJob.objects.get(pk=pk)
+    except PlanningJob.DoesNotExist:
+        return Response({"error": "Job not found."}, status=status.HTTP_404_NOT_FOUND)
+    return Response(PlanningJobSerializer(job, context={"request": request}).data)
@@ -1,6 +1,7 @@
 import React, { useEffect, useRef, useState } from "react";
 import maplibregl from "maplibre-gl";
 import "maplibre-gl/dist/maplibre-gl.css";
+import { tripService } from "../services/api";
 
 // --- IMPORTANT: Replace with YOUR Geoapify API key ---
 
@@ -244,9 +245,20 @@ const RouteMap = ({ trip }) => {
           }
         });
 
-        // --- 3. Fetch SINGLE Driving Route for ALL Waypoints ---
+        // --- 3. Load the route stored with the trip, else fetch it from Geoapify ---
         let routeGeometry = null;
-        if (waypointsForRoutingApi.length >= 2) {
+        if (trip.id) {
+          try {
+            routeGeometry = await tripService.getTripGeometry(trip.id);
+            if (routeGeometry) console.log("Stored route geometry loaded.");
+          } catch (geometryError) {
+            console.warn(
+              "Could not load stored route geometry; fetching the route instead.",
+              geometryError
+            );
+          }
+        }
+        if (!routeGeometry && waypointsForRoutingApi.length >= 2) {
           console.log(
             `Fetching route for ${waypointsForRoutingApi.length} waypoints...`
           );
@@ -296,7 +308,7 @@ const RouteMap = ({ trip }) => {
               `Failed to fetch driving route. ${fetchError.message}`
             );
           }
-        } else {
+        } else if (!routeGeometry) {
           console.warn(
             "Not enough waypoints (need at least 2) to fetch a route."
           );
@@ -1,5 +1,6 @@
 // frontend/src/services/api.js
 import axios from "axios";
+import { decodePolyline } from "./polyline";
 
 // ALWAYS use the relative path for client-side requests.
 // The Vite proxy will handle forwarding this to the correct backend.
@@ -30,4 +31,24 @@ export const tripService = {
       throw error.response?.data || new Error("Failed to fetch trip details");
     }
   },
+
+  // Returns the trip's stored route as a GeoJSON MultiLineString (one line per leg),
+  // or null if none was stored for it
+  getTripGeometry: async (tripId) => {
+    try {
+      // The final URL will be "/api/trips/{tripId}/geometry/"
+      const response = await axios.get(
+        `${API_BASE_URL}/trips/${tripId}/geometry/`
+      );
+      const { legs, precision } = response.data;
+      return {
+        type: "MultiLineString",
+        coordinates: legs.map((leg) => decodePolyline(leg, precision)),
+      };
+    } catch (error) {
+      if (error.response?.status === 404) return null;
+      console.error("Get trip geometry error:", error);
+      throw error.response?.data || new Error("Failed to fetch trip geometry");
+    }
+  },
 };
@@ -0,0 +1,30 @@
+// frontend/src/services/polyline.js
+
+// Decodes the encoded polyline format served by /api/trips/{id}/geometry/.
+// The string is latitude-first; coordinates come back as GeoJSON [lon, lat] pairs.
+export const decodePolyline = (encoded, precision = 5) => {
+  const factor = Math.pow(10, precision);
+  const coordinates = [];
+  let index = 0;
+  let lat = 0;
+  let lon = 0;
+
+  const nextValue = () => {
+    let result = 0;
+    let shift = 0;
+    let byte;
+    do {
+      byte = encoded.charCodeAt(index++) - 63;
+      result |= (byte & 0x1f) << shift;
+      shift += 5;
+    } while (byte >= 0x20);
+    return result & 1 ? ~(result >> 1) : result >> 1;
+  };
+
+  while (index < encoded.length) {
+    lat += nextValue();
+    lon += nextValue();
+    coordinates.push([lon / factor, lat / factor]);
+  }
+  return coordinates;
+};